@@ -0,0 +1,160 @@
+"""
+Compares the database writes made per connection event by the batched
+achievement engine against awarding each achievement separately.
+
+Run from the repository root with: python benchmarks/bench_achievements.py
+"""
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime
+
+import student_network.helpers.helper_achievements as helper_achievements
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_graph as helper_graph
+from common import add_users, count_statements, create_database
+from flask import session
+from student_network.app import app
+
+USER_COUNT = 1000
+CONNECTIONS_PER_USER = 12
+HOBBIES = ["hobby{}".format(i) for i in range(10)]
+EVENT_COUNT = 200
+WRITES = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+RESULT_COLUMNS = ("statements", "writes", "commits", "latency (ms)")
+
+
+def populate(conn) -> list:
+    """
+    Creates users with random connections, hobbies, interests and degrees,
+    so that most connection events unlock several achievements.
+
+    Returns:
+        The usernames.
+    """
+    random.seed(0)
+    users = ["user{}".format(i) for i in range(USER_COUNT)]
+    add_users(conn, users)
+    edges = set()
+    while len(edges) < USER_COUNT * CONNECTIONS_PER_USER // 2:
+        user1, user2 = random.sample(users, 2)
+        if (user2, user1) not in edges:
+            edges.add((user1, user2))
+    conn.executemany(
+        "INSERT INTO Connection (user1, user2, connection_type) "
+        "VALUES (?, ?, 'connected');",
+        edges,
+    )
+    for table in ("UserHobby", "UserInterests"):
+        conn.executemany(
+            "INSERT INTO {} VALUES (?, ?);".format(table),
+            ((x, hobby) for x in users for hobby in random.sample(HOBBIES, 3)),
+        )
+    conn.executemany(
+        "UPDATE UserProfile SET degree=? WHERE username=?;",
+        ((random.randint(2, 181), x) for x in users),
+    )
+    conn.commit()
+    return users
+
+
+def apply_achievement_separately(username: str, achievement_id: int):
+    """
+    Awards one achievement the way it was done before the engine, checking,
+    inserting, adding experience and notifying in separate commits.
+    """
+    conn = helper_database.get_db()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT * FROM CompleteAchievements "
+        "WHERE (username=? AND achievement_ID=?);",
+        (username, achievement_id),
+    )
+    if cur.fetchone() is None:
+        cur.execute(
+            "INSERT INTO CompleteAchievements "
+            "(username, achievement_ID, date_completed) VALUES (?, ?, ?);",
+            (username, achievement_id, date.today()),
+        )
+        conn.commit()
+        cur.execute(
+            "SELECT xp_value FROM Achievements WHERE achievement_ID=?;",
+            (achievement_id,),
+        )
+        exp = cur.fetchone()[0]
+        cur.execute("SELECT * FROM UserLevel WHERE username=?;", (username,))
+        if cur.fetchone() is None:
+            cur.execute(
+                "INSERT INTO UserLevel (username, experience) VALUES (?, ?);",
+                (username, 0),
+            )
+            conn.commit()
+        cur.execute(
+            "UPDATE UserLevel SET experience = experience + ? WHERE username=?;",
+            (exp, username),
+        )
+        conn.commit()
+        cur.execute(
+            "INSERT INTO notification (username, body, date, url) "
+            "VALUES (?, ?, ?, ?);",
+            (
+                username,
+                helper_achievements.UNLOCK_NOTIFICATION,
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "/achievements",
+            ),
+        )
+        conn.commit()
+
+
+def run_events(path: str, events: list) -> tuple:
+    """
+    Handles the achievements for accepting each connection.
+
+    Returns:
+        The mean statements, writes and commits per event, and the mean
+        latency in milliseconds.
+    """
+    app.config["DATABASE"] = path
+    helper_graph.get_graph(path)
+    statements, writes, commits, elapsed = 0, 0, 0, 0.0
+    for user1, user2 in events:
+        with app.test_request_context("/requests"):
+            session["username"] = user1
+            conn = helper_database.get_db()
+            with count_statements(conn) as traced:
+                start = time.perf_counter()
+                helper_achievements.update_connection_achievements(conn.cursor(), user2)
+                elapsed += time.perf_counter() - start
+        statements += len(traced)
+        writes += sum(1 for x in traced if x.startswith(WRITES))
+        commits += traced.count("COMMIT")
+    helper_database.get_pool(path).close()
+    count = len(events)
+    return statements / count, writes / count, commits / count, elapsed * 1000 / count
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, x) for x in ("before.db", "after.db")]
+        for path in paths:
+            users = populate(create_database(path))
+        events = [random.sample(users, 2) for _ in range(EVENT_COUNT)]
+
+        award_achievements = helper_achievements.award_achievements
+        helper_achievements.award_achievements = lambda unlocks: [
+            apply_achievement_separately(*x) for x in unlocks
+        ]
+        before = run_events(paths[0], events)
+        helper_achievements.award_achievements = award_achievements
+        after = run_events(paths[1], events)
+
+        print("users: {}, events: {}".format(USER_COUNT, EVENT_COUNT))
+        print("{:<10}{:>12}{:>10}{:>10}{:>14}".format("", *RESULT_COLUMNS))
+        for name, result in (("before", before), ("after", after)):
+            print("{:<10}{:>12.1f}{:>10.1f}{:>10.1f}{:>14.3f}".format(name, *result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Compares suggesting usernames with a range query on ACCOUNTS and a profile
+picture lookup against the in-process sorted index.
+
+Run from the repository root with: python benchmarks/bench_autocomplete.py
+"""
+import os
+import tempfile
+
+import student_network.helpers.helper_autocomplete as helper_autocomplete
+import student_network.helpers.helper_database as helper_database
+from common import add_users, create_database, timed
+
+USER_COUNT = 100000
+LIMIT = 10
+PREFIXES = ("user5", "user12345", "nobody")
+
+
+def complete_by_query(conn, prefix: str) -> list:
+    """
+    Suggests usernames with a query, as the endpoint did before the index.
+    """
+    return conn.execute(
+        "SELECT ACCOUNTS.username, UserProfile.profilepicture FROM ACCOUNTS "
+        "LEFT JOIN UserProfile ON UserProfile.username=ACCOUNTS.username "
+        "WHERE ACCOUNTS.username >= ? AND ACCOUNTS.username < ? "
+        "ORDER BY ACCOUNTS.username LIMIT ?;",
+        (prefix, prefix + "\U0010ffff", LIMIT),
+    ).fetchall()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "autocomplete.db")
+        conn = create_database(path)
+        add_users(conn, ["user{}".format(x) for x in range(USER_COUNT)])
+        index = helper_autocomplete.get_index(path)
+        results = [
+            (
+                prefix,
+                timed(lambda: complete_by_query(conn, prefix), repeat=100),
+                timed(lambda: index.complete(prefix, LIMIT), repeat=100),
+            )
+            for prefix in PREFIXES
+        ]
+        load = timed(lambda: helper_autocomplete.UsernameIndex.load(conn), repeat=3)
+        helper_database.get_pool(path).close()
+        conn.close()
+
+    print("users: {}, limit: {}".format(USER_COUNT, LIMIT))
+    for prefix, before, after in results:
+        print(
+            "{:<10} query {:>7.1f}us  index {:>6.1f}us".format(
+                prefix, before * 1000, after * 1000
+            )
+        )
+    print("building the index: {:.1f}ms".format(load))
+
+
+if __name__ == "__main__":
+    main()
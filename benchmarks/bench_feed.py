@@ -0,0 +1,112 @@
+"""
+Measures how many queries and how long it takes to assemble a page of the
+feed as the number of connections grows, both for the newest page and for a
+page deep into the feed's history, and how long the newest page takes when it
+is read from the precomputed timeline instead.
+
+Run from the repository root with: python benchmarks/bench_feed.py
+"""
+import os
+import random
+import tempfile
+
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_paging as helper_paging
+import student_network.helpers.helper_posts as helper_posts
+import student_network.helpers.helper_timeline as helper_timeline
+from common import add_users, count_statements, create_database, timed
+from flask import session
+from student_network.app import app
+
+CONNECTION_COUNTS = [10, 100, 500, 1000]
+POSTS_PER_USER = 20
+PAGE_SIZE = 5
+
+
+def populate(conn, connection_count: int) -> int:
+    """
+    Creates a user with the given number of connections, each of whom has
+    posted, commented and liked.
+
+    Returns:
+        The highest post ID.
+    """
+    friends = ["friend{}".format(i) for i in range(connection_count)]
+    add_users(conn, ["reader"] + friends)
+    conn.executemany(
+        "INSERT INTO Connection (user1, user2, connection_type) "
+        "VALUES ('reader', ?, 'connected');",
+        ((x,) for x in friends),
+    )
+    conn.executemany(
+        "INSERT INTO CloseFriend (user1, user2) VALUES (?, 'reader');",
+        ((x,) for x in friends[::3]),
+    )
+    privacy = ["public", "protected", "close", "private", "deleted"]
+    posts = [
+        (x, "Post body " * 10, random.choice(privacy))
+        for _ in range(POSTS_PER_USER)
+        for x in friends
+    ]
+    conn.executemany(
+        "INSERT INTO POSTS (username, body, privacy, date, timestamp) "
+        "VALUES (?, ?, ?, '2021-05-21', 1621555200);",
+        posts,
+    )
+    max_id = conn.execute("SELECT MAX(postId) FROM POSTS;").fetchone()[0]
+    conn.executemany(
+        "INSERT INTO Comments (username, body, postId) VALUES (?, 'Nice!', ?);",
+        ((random.choice(friends), random.randint(1, max_id)) for _ in posts),
+    )
+    conn.executemany(
+        "INSERT INTO UserLikes (username, postId) VALUES ('reader', ?);",
+        ((x,) for x in range(1, max_id, 2)),
+    )
+    conn.executemany(
+        "INSERT INTO PostContent (postId, contentUrl) VALUES (?, 'image');",
+        ((x,) for x in range(1, max_id, 4)),
+    )
+    conn.commit()
+    return max_id
+
+
+def main():
+    print(
+        "connections  queries  newest page (ms)  deep page (ms)  timeline page (ms)"
+    )
+    for connection_count in CONNECTION_COUNTS:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bench.sqlite3")
+            max_id = populate(create_database(path), connection_count)
+            app.config["DATABASE"] = path
+
+            deep_cursor = helper_paging.encode_cursor(max_id // 10)
+
+            with app.test_request_context("/fetch_posts"):
+                session["username"] = "reader"
+                conn = helper_database.get_db()
+                with count_statements(conn) as statements:
+                    helper_posts.fetch_posts(PAGE_SIZE)
+                latency = timed(lambda: helper_posts.fetch_posts(PAGE_SIZE))
+                deep_latency = timed(
+                    lambda: helper_posts.fetch_posts(PAGE_SIZE, deep_cursor)
+                )
+                app.config["FEED_FANOUT"] = True
+                helper_timeline.backfill()
+                timeline_latency = timed(lambda: helper_posts.fetch_posts(PAGE_SIZE))
+                app.config["FEED_FANOUT"] = False
+
+            helper_database.get_pool(path).close()
+            print(
+                "{:>11}  {:>7}  {:>16.2f}  {:>14.2f}  {:>18.2f}".format(
+                    connection_count,
+                    len(statements),
+                    latency,
+                    deep_latency,
+                    timeline_latency,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
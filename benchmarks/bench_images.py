@@ -0,0 +1,125 @@
+"""
+Measures how many photo uploads a second are accepted and finished when
+they are resized in the request against handing them to the process pool,
+and how much smaller the derivatives pages download are.
+
+Run from the repository root with: python benchmarks/bench_images.py
+"""
+import io
+import os
+import tempfile
+import time
+
+import student_network.helpers.helper_images as helper_images
+from common import timed
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+UPLOAD_COUNT = 40
+PHOTO_SIZE = (4000, 3000)
+
+
+def make_photo() -> bytes:
+    """
+    Creates a large JPEG like one straight from a phone camera, with smooth
+    areas, detail and sensor noise.
+    """
+    detail = Image.effect_mandelbrot(PHOTO_SIZE, (-2.2, -1.2, 1.0, 1.2), 256)
+    noise = Image.effect_noise(PHOTO_SIZE, 16)
+    gradient = Image.linear_gradient("L").resize(PHOTO_SIZE)
+    photo = Image.merge("RGB", (detail, gradient, noise))
+    file = io.BytesIO()
+    photo.save(file, format="JPEG", quality=90)
+    return file.getvalue()
+
+
+def upload_all(pipeline, directory: str, photo: bytes, inline: bool) -> tuple:
+    """
+    Uploads photos one after another, as requests to a single worker would.
+
+    Returns:
+        The seconds until every upload was accepted and until every image was
+        resized.
+    """
+    start = time.perf_counter()
+    for x in range(UPLOAD_COUNT):
+        file = FileStorage(io.BytesIO(photo), "photo{}.jpg".format(x))
+        pipeline.submit(file, directory, "post_imgs", inline=inline)
+    accepted = time.perf_counter() - start
+    while pipeline.pending_count():
+        time.sleep(0.001)
+    return accepted, time.perf_counter() - start
+
+
+def measure_derivatives(directory: str, image_id: str) -> list:
+    """
+    Gets the size of every derivative of an uploaded post image, and how
+    long making the WebP one takes the first time it is asked for.
+    """
+    full = os.path.getsize(
+        helper_images.get_image_path(directory, "post_imgs", image_id)
+    )
+    results = []
+    for width in helper_images.DERIVATIVE_WIDTHS:
+        sizes = []
+        for extension in helper_images.DERIVATIVE_FORMATS:
+            path = helper_images.get_derivative_path(
+                directory, "post_imgs", image_id, width, extension
+            )
+            sizes.append(os.path.getsize(path))
+            # Removes it, so it is made from scratch below.
+            os.remove(path)
+
+        def make():
+            os.remove(
+                helper_images.get_derivative(
+                    directory, "post_imgs", image_id, width, "webp"
+                )
+            )
+
+        results.append((width, full, *sizes, timed(make)))
+    return results
+
+
+def main():
+    photo = make_photo()
+    # The queue never turns uploads away here, so only throughput is measured.
+    pipeline = helper_images.ImagePipeline(limit=UPLOAD_COUNT)
+    with tempfile.TemporaryDirectory() as directory:
+        # Starts the worker processes before timing.
+        upload_all(pipeline, directory, photo, inline=False)
+        image_id = pipeline.submit(
+            FileStorage(io.BytesIO(photo), "photo.jpg"),
+            directory,
+            "post_imgs",
+            inline=True,
+        )
+        derivatives = measure_derivatives(directory, image_id)
+        results = [
+            (name, *upload_all(pipeline, directory, photo, inline))
+            for name, inline in (("in request", True), ("process pool", False))
+        ]
+    pipeline.close()
+
+    print(
+        "uploads: {}, photo: {}x{}, {} KB, cores: {}".format(
+            UPLOAD_COUNT, *PHOTO_SIZE, len(photo) // 1024, os.cpu_count()
+        )
+    )
+    for name, accepted, finished in results:
+        print(
+            "{:<13} accepted {:>7.1f}/s  resized {:>6.1f}/s".format(
+                name, UPLOAD_COUNT / accepted, UPLOAD_COUNT / finished
+            )
+        )
+    for width, full, webp, jpg, make in derivatives:
+        print(
+            "width {:>3}: {:>5.1f} KB webp, {:>5.1f} KB jpg, full {:.1f} KB, "
+            "webp made on demand in {:.1f}ms".format(
+                width, webp / 1024, jpg / 1024, full / 1024, make
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compares finding a user's rank and the top of the leaderboard by reading the
+whole UserLevel table against the in-memory ranking index.
+
+Run from the repository root with: python benchmarks/bench_leaderboard.py
+"""
+import os
+import random
+import tempfile
+
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_leaderboard as helper_leaderboard
+from common import add_users, create_database, timed
+
+USER_COUNT = 200000
+MAX_EXPERIENCE = 5000
+SAMPLE_SIZE = 20
+PAGE_SIZE = 25
+
+
+def populate(conn) -> list:
+    """
+    Creates users with random experience.
+
+    Returns:
+        The usernames.
+    """
+    random.seed(0)
+    users = ["user{}".format(i) for i in range(USER_COUNT)]
+    add_users(conn, users)
+    conn.executemany(
+        "INSERT INTO UserLevel (username, experience) VALUES (?, ?);",
+        ((x, random.randint(0, MAX_EXPERIENCE)) for x in users),
+    )
+    conn.commit()
+    return users
+
+
+def rank_from_table(conn, username: str) -> tuple:
+    """
+    Ranks a user the way the leaderboard did before the index, reading every
+    user in experience order.
+    """
+    rows = conn.execute(
+        "SELECT username, experience FROM UserLevel ORDER BY experience DESC;"
+    ).fetchall()
+    rank = next(i for i, x in enumerate(rows, 1) if x[0] == username)
+    return rank, rows[:PAGE_SIZE]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.sqlite3")
+        users = populate(create_database(path))
+        helper_database.get_pool(path)
+        load_latency = timed(lambda: helper_leaderboard.get_leaderboard(path), repeat=1)
+        leaderboard = helper_leaderboard.get_leaderboard(path)
+        sample = random.sample(users, SAMPLE_SIZE)
+
+        with helper_database.get_pool(path).connection() as conn:
+            before = sum(
+                timed(lambda: rank_from_table(conn, x), repeat=1) for x in sample
+            )
+        after = sum(
+            timed(lambda: (leaderboard.get_rank(x), leaderboard.get_page(0, PAGE_SIZE)))
+            for x in sample
+        )
+        update = sum(
+            timed(
+                lambda: leaderboard.set_experience(x, random.randint(0, MAX_EXPERIENCE))
+            )
+            for x in sample
+        )
+
+        helper_database.get_pool(path).close()
+        print("users: {}, sampled: {}".format(USER_COUNT, SAMPLE_SIZE))
+        print("index load (ms): {:.2f}".format(load_latency))
+        print("mean rank from table (ms): {:.3f}".format(before / SAMPLE_SIZE))
+        print("mean rank from index (ms): {:.4f}".format(after / SAMPLE_SIZE))
+        print("mean experience update (ms): {:.4f}".format(update / SAMPLE_SIZE))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Compares private message throughput when every message is committed as it
+is sent against buffering messages and committing them in batches.
+
+Run from the repository root with: python benchmarks/bench_messages.py
+"""
+import os
+import tempfile
+import threading
+import time
+
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_messages as helper_messages
+from common import add_users, create_database
+from student_network.app import app
+
+MESSAGE_COUNT = 5000
+SENDER_COUNT = 8
+
+
+def send_messages(path: str, durability: str) -> float:
+    """
+    Sends messages from several threads at once, as concurrent chat handlers
+    would, and waits until every message is stored.
+
+    Returns:
+        The messages stored per second.
+    """
+    app.config.update(DATABASE=path, MESSAGE_DURABILITY=durability)
+    helper_database.get_pool(path)
+
+    def sender(index: int):
+        for i in range(MESSAGE_COUNT // SENDER_COUNT):
+            with app.test_request_context():
+                helper_messages.save_message(
+                    "user{}".format(index), "user0", "message {}".format(i)
+                )
+
+    threads = [threading.Thread(target=sender, args=(x,)) for x in range(SENDER_COUNT)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    helper_messages.close_writers()
+    elapsed = time.perf_counter() - start
+
+    with helper_database.get_pool(path).connection() as conn:
+        stored = conn.execute("SELECT COUNT(*) FROM PrivateMessages;").fetchone()[0]
+    helper_database.get_pool(path).close()
+    assert stored == MESSAGE_COUNT // SENDER_COUNT * SENDER_COUNT
+    return stored / elapsed
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        results = []
+        for durability in ("immediate", "buffered"):
+            path = os.path.join(directory, "{}.db".format(durability))
+            add_users(
+                create_database(path), ["user{}".format(x) for x in range(SENDER_COUNT)]
+            )
+            results.append((durability, send_messages(path, durability)))
+
+        print("messages: {}, senders: {}".format(MESSAGE_COUNT, SENDER_COUNT))
+        for durability, throughput in results:
+            print("{:<10} {:>10.0f} messages/s".format(durability, throughput))
+
+
+if __name__ == "__main__":
+    main()
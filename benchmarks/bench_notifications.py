@@ -0,0 +1,144 @@
+"""
+Compares reading notifications by their date strings, as before, against the
+integer timestamps: the newest page, a page deep into a user's history, and
+working out the ages shown beside each notification.
+
+Run from the repository root with: python benchmarks/bench_notifications.py
+"""
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_general as helper_general
+import student_network.helpers.helper_migrations as helper_migrations
+import student_network.helpers.helper_notifications as helper_notifications
+import student_network.helpers.helper_paging as helper_paging
+from common import add_users, create_database, timed
+from student_network.app import app
+
+USER_COUNT = 1000
+NOTIFICATIONS_PER_USER = 1000
+PAGE_SIZE = 20
+DEEP_OFFSET = 900
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def add_notifications(conn):
+    """
+    Gives every user notifications spread over the last year.
+    """
+    now = int(time.time())
+    random.seed(0)
+    for i in range(USER_COUNT):
+        rows = []
+        for _ in range(NOTIFICATIONS_PER_USER):
+            timestamp = now - random.randrange(365 * 24 * 3600)
+            date = datetime.fromtimestamp(timestamp).strftime(DATE_FORMAT)
+            rows.append(("user{}".format(i), "Hello", date, timestamp, "/feed"))
+        conn.executemany(
+            "INSERT INTO notification (username, body, date, timestamp, url) "
+            "VALUES (?, ?, ?, ?, ?);",
+            rows,
+        )
+    conn.commit()
+
+
+def page_by_date(conn, username: str, cursor: tuple = None) -> list:
+    """
+    Reads a page the old way, comparing date strings and parsing each one to
+    get its age.
+    """
+    older = "AND (date, rowid) < (?, ?) " if cursor else ""
+    rows = conn.execute(
+        "SELECT rowid, body, date, url, read FROM notification WHERE username=? "
+        + older
+        + "ORDER BY date DESC, rowid DESC LIMIT ?;",
+        (username, *(cursor or ()), PAGE_SIZE),
+    ).fetchall()
+    now = datetime.now()
+    return [
+        helper_general.display_short_notification_age(
+            (now - datetime.strptime(x[2], DATE_FORMAT)).total_seconds()
+        )
+        for x in rows
+    ]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "notifications.db")
+        conn = create_database(path)
+        helper_migrations.migrate(conn)
+        add_users(conn, ["user{}".format(x) for x in range(USER_COUNT)])
+        add_notifications(conn)
+        app.config.update(DATABASE=path)
+
+        deep = conn.execute(
+            "SELECT date, rowid, timestamp FROM notification WHERE username='user7' "
+            "ORDER BY timestamp DESC, rowid DESC LIMIT 1 OFFSET ?;",
+            (DEEP_OFFSET,),
+        ).fetchone()
+        # The date index which the string queries used before.
+        conn.execute(
+            "CREATE INDEX notification_username_date_index "
+            "ON notification (username, date);"
+        )
+        conn.commit()
+        before = (
+            timed(lambda: page_by_date(conn, "user7")),
+            timed(lambda: page_by_date(conn, "user7", deep[:2])),
+            timed(
+                lambda: [
+                    helper_general.display_short_notification_age(
+                        (
+                            datetime.now() - datetime.strptime(x[0], DATE_FORMAT)
+                        ).total_seconds()
+                    )
+                    for x in conn.execute(
+                        "SELECT date FROM notification WHERE username='user7';"
+                    )
+                ]
+            ),
+        )
+        conn.execute("DROP INDEX notification_username_date_index;")
+        conn.commit()
+
+        cursor = helper_paging.encode_cursor(deep[2], deep[1])
+        with app.app_context():
+            after = (
+                timed(
+                    lambda: helper_notifications.get_notifications("user7", PAGE_SIZE)
+                ),
+                timed(
+                    lambda: helper_notifications.get_notifications(
+                        "user7", PAGE_SIZE, cursor
+                    )
+                ),
+                timed(
+                    lambda: helper_general.format_ages(
+                        x[0]
+                        for x in conn.execute(
+                            "SELECT timestamp FROM notification WHERE username='user7';"
+                        )
+                    )
+                ),
+            )
+        helper_database.get_pool(path).close()
+        conn.close()
+
+    print(
+        "notifications: {}, users: {}".format(
+            USER_COUNT * NOTIFICATIONS_PER_USER, USER_COUNT
+        )
+    )
+    print("{:<24} {:>10} {:>10}".format("", "date", "timestamp"))
+    labels = ("newest page", "page at {}".format(DEEP_OFFSET), "ages of one user")
+    for label, old, new in zip(labels, before, after):
+        print("{:<24} {:>8.3f}ms {:>8.3f}ms".format(label, old, new))
+
+
+if __name__ == "__main__":
+    main()
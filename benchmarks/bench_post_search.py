@@ -0,0 +1,111 @@
+"""
+Measures searching a million posts through the full text index against a
+LIKE scan with the same visibility rules, and the cost the index adds to
+submitting and deleting a post.
+
+Run from the repository root with: python benchmarks/bench_post_search.py
+"""
+import os
+import random
+import tempfile
+
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_migrations as helper_migrations
+import student_network.helpers.helper_search as helper_search
+from common import add_users, create_database, timed
+from student_network.app import app
+
+POST_COUNT = 1000000
+USER_COUNT = 1000
+CONNECTION_COUNT = 100
+WORDS_PER_POST = 12
+VOCABULARY = ["word{}".format(x) for x in range(5000)]
+
+
+def populate(conn):
+    """
+    Creates users who have posted, a reader connected to some of them, and
+    a few posts containing a rare phrase.
+    """
+    users = ["user{}".format(x) for x in range(USER_COUNT)]
+    add_users(conn, ["reader"] + users)
+    conn.executemany(
+        "INSERT INTO Connection (user1, user2, connection_type) "
+        "VALUES ('reader', ?, 'connected');",
+        ((x,) for x in users[:CONNECTION_COUNT]),
+    )
+    random.seed(0)
+    privacy = ["public", "protected", "close", "private"]
+    conn.executemany(
+        "INSERT INTO POSTS (username, body, privacy, date, timestamp) "
+        "VALUES (?, ?, ?, '2021-05-21', ?);",
+        (
+            (
+                random.choice(users),
+                " ".join(random.choices(VOCABULARY, k=WORDS_PER_POST))
+                + (" rare phrase" if i % 100000 == 0 else ""),
+                random.choice(privacy),
+                i,
+            )
+            for i in range(POST_COUNT)
+        ),
+    )
+    conn.commit()
+
+
+def search_by_like(conn, word: str) -> list:
+    """
+    Searches the way a search without the index would, scanning post bodies
+    newest first.
+    """
+    return conn.execute(
+        "SELECT postId FROM POSTS WHERE body LIKE :pattern AND "
+        + helper_search.VISIBLE_POST
+        + "ORDER BY postId DESC LIMIT 10;",
+        {"pattern": "%" + word + "%", "username": "reader"},
+    ).fetchall()
+
+
+def submit_and_delete(conn):
+    """
+    Adds a post and deletes it, as the post views do.
+    """
+    post_id = conn.execute(
+        "INSERT INTO POSTS (username, body, privacy) "
+        "VALUES ('user1', 'a new post about word1', 'public');"
+    ).lastrowid
+    conn.execute("UPDATE POSTS SET privacy='deleted' WHERE postId=?;", (post_id,))
+    conn.commit()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "posts.db")
+        conn = create_database(path)
+        helper_migrations.migrate(conn)
+        populate(conn)
+        app.config.update(DATABASE=path)
+
+        searches = ("word42", "rare phrase", '"rare phrase"', "word423*", "word4*")
+        results = []
+        with app.app_context():
+            for search in searches:
+                results.append(
+                    (
+                        search,
+                        timed(lambda: search_by_like(conn, search.strip('"*'))),
+                        timed(lambda: helper_search.search_posts("reader", search)),
+                    )
+                )
+        write = timed(lambda: submit_and_delete(conn), repeat=20)
+        helper_database.get_pool(path).close()
+        conn.close()
+
+    print("posts: {}, reader's connections: {}".format(POST_COUNT, CONNECTION_COUNT))
+    for search, before, after in results:
+        print("{:<16} LIKE {:>9.3f}ms  FTS {:>7.3f}ms".format(search, before, after))
+    print("submit and delete a post: {:.3f}ms".format(write))
+
+
+if __name__ == "__main__":
+    main()
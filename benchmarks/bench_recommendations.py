@@ -0,0 +1,116 @@
+"""
+Measures how many queries and how long it takes to recommend connections to
+users of a synthetic 50,000 user social graph.
+
+Run from the repository root with: python benchmarks/bench_recommendations.py
+"""
+import os
+import random
+import tempfile
+
+import student_network.helpers.helper_connections as helper_connections
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_graph as helper_graph
+from common import add_users, count_statements, create_database, timed
+from flask import session
+from student_network.app import app
+
+USER_COUNT = 50000
+CONNECTIONS_PER_USER = 10
+CLOSE_FRIEND_RATIO = 0.1
+HOBBIES = ["hobby{}".format(i) for i in range(100)]
+INTERESTS = ["interest{}".format(i) for i in range(100)]
+SAMPLE_SIZE = 20
+
+
+def populate(conn) -> list:
+    """
+    Creates users with random connections, close friends, hobbies, interests
+    and degrees.
+
+    Returns:
+        The usernames.
+    """
+    random.seed(0)
+    users = ["user{}".format(i) for i in range(USER_COUNT)]
+    add_users(conn, users)
+    edges = set()
+    while len(edges) < USER_COUNT * CONNECTIONS_PER_USER:
+        user1, user2 = random.sample(users, 2)
+        if (user2, user1) not in edges:
+            edges.add((user1, user2))
+    conn.executemany(
+        "INSERT INTO Connection (user1, user2, connection_type) "
+        "VALUES (?, ?, 'connected');",
+        edges,
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO CloseFriend (user1, user2) VALUES (?, ?);",
+        (
+            random.choice([edge, edge[::-1]])
+            for edge in random.sample(
+                sorted(edges), int(len(edges) * CLOSE_FRIEND_RATIO)
+            )
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO UserHobby (username, hobby) VALUES (?, ?);",
+        ((x, hobby) for x in users for hobby in random.sample(HOBBIES, 3)),
+    )
+    conn.executemany(
+        "INSERT INTO UserInterests (username, interest) VALUES (?, ?);",
+        ((x, interest) for x in users for interest in random.sample(INTERESTS, 3)),
+    )
+    conn.executemany(
+        "UPDATE UserProfile SET degree=? WHERE username=?;",
+        ((random.randint(2, 181), x) for x in users),
+    )
+    conn.commit()
+    return users
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.sqlite3")
+        users = populate(create_database(path))
+        app.config["DATABASE"] = path
+        helper_database.get_pool(path)
+        load_latency = timed(lambda: helper_graph.get_graph(path), repeat=1)
+
+        statement_counts = []
+        latencies = []
+        cached_latencies = []
+        for username in random.sample(users, SAMPLE_SIZE):
+            with app.test_request_context("/requests"):
+                session["username"] = username
+                conn = helper_database.get_db()
+                with count_statements(conn) as statements:
+                    latencies.append(
+                        timed(
+                            lambda: helper_connections.get_recommended_connections(
+                                username
+                            ),
+                            repeat=1,
+                        )
+                    )
+                statement_counts.append(len(statements))
+                cached_latencies.append(
+                    timed(
+                        lambda: helper_connections.get_recommended_connections(username)
+                    )
+                )
+
+        helper_database.get_pool(path).close()
+        print("users: {}, sampled: {}".format(USER_COUNT, SAMPLE_SIZE))
+        print("social graph load (ms): {:.2f}".format(load_latency))
+        print("mean queries: {:.1f}".format(sum(statement_counts) / SAMPLE_SIZE))
+        print("mean latency (ms): {:.2f}".format(sum(latencies) / SAMPLE_SIZE))
+        print(
+            "mean cached latency (ms): {:.3f}".format(
+                sum(cached_latencies) / SAMPLE_SIZE
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compares the member search's old leading wildcard LIKE join against the full
+text index.
+
+Run from the repository root with: python benchmarks/bench_search.py
+"""
+import os
+import random
+import tempfile
+
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_migrations as helper_migrations
+import student_network.helpers.helper_search as helper_search
+from common import add_users, create_database, timed
+from student_network.app import app
+
+USER_COUNT = 50000
+HOBBIES = ("coding", "swimming", "reading", "rock climbing", "chess", "running")
+INTERESTS = ("books", "films", "music", "history", "science", "travel")
+
+
+def search_by_like(conn, chars: str, hobby: str, interest: str) -> list:
+    """
+    Searches the way the members page did before the index.
+    """
+    return conn.execute(
+        "SELECT UserProfile.username, UserHobby.hobby, "
+        "UserInterests.interest FROM UserProfile "
+        "LEFT JOIN UserHobby ON UserHobby.username=UserProfile.username "
+        "LEFT JOIN UserInterests ON "
+        "UserInterests.username=UserProfile.username "
+        "WHERE (UserProfile.username LIKE ?) "
+        "AND (IFNULL(hobby, '') LIKE ?) AND (IFNULL(interest, '') LIKE ?) "
+        "GROUP BY UserProfile.username LIMIT 10;",
+        ("%" + chars + "%", "%" + hobby + "%", "%" + interest + "%"),
+    ).fetchall()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "search.db")
+        conn = create_database(path)
+        helper_migrations.migrate(conn)
+        usernames = ["user{}".format(x) for x in range(USER_COUNT)]
+        add_users(conn, usernames)
+        random.seed(0)
+        conn.executemany(
+            "INSERT INTO UserHobby (username, hobby) VALUES (?, ?);",
+            ((x, y) for x in usernames for y in random.sample(HOBBIES, 2)),
+        )
+        conn.executemany(
+            "INSERT INTO UserInterests (username, interest) VALUES (?, ?);",
+            ((x, y) for x in usernames for y in random.sample(INTERESTS, 2)),
+        )
+        conn.commit()
+        app.config.update(DATABASE=path)
+
+        searches = (
+            ("user4999", "", ""),
+            ("nobody", "", ""),
+            ("user12", "rock", "sci"),
+            ("", "rock", ""),
+        )
+        results = []
+        with app.app_context():
+            for search in searches:
+                results.append(
+                    (
+                        search,
+                        timed(lambda: search_by_like(conn, *search)),
+                        timed(lambda: helper_search.search_members(*search)),
+                    )
+                )
+        helper_database.get_pool(path).close()
+        conn.close()
+
+    print("users: {}".format(USER_COUNT))
+    for search, before, after in results:
+        print(
+            "{:<28} LIKE {:>9.3f}ms  FTS {:>7.3f}ms".format(repr(search), before, after)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Shared setup for the benchmark scripts, which run against synthetic copies of
+the database schema rather than the demo database.
+"""
+import sqlite3
+import time
+from contextlib import contextmanager
+
+SCHEMA_SOURCE = "db.sqlite3"
+
+
+def create_database(path: str) -> sqlite3.Connection:
+    """
+    Creates an empty database with the same schema as the demo database.
+
+    Args:
+        path: Where to create the database file.
+
+    Returns:
+        A connection to the new database.
+    """
+    with sqlite3.connect(SCHEMA_SOURCE) as source:
+        schema = source.execute(
+            "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL "
+            "AND name NOT LIKE 'sqlite_%' ORDER BY type='index';"
+        ).fetchall()
+        degrees = source.execute("SELECT * FROM Degree;").fetchall()
+        achievements = source.execute("SELECT * FROM Achievements;").fetchall()
+
+    conn = sqlite3.connect(path)
+    for (sql,) in schema:
+        conn.execute(sql)
+    conn.executemany("INSERT INTO Degree VALUES (?, ?);", degrees)
+    conn.executemany(
+        "INSERT INTO Achievements VALUES (?, ?, ?, ?, ?, ?);", achievements
+    )
+    conn.commit()
+    return conn
+
+
+def add_users(conn: sqlite3.Connection, usernames: list):
+    """
+    Registers accounts and profiles for the given usernames.
+
+    Args:
+        conn: Connection to the benchmark database.
+        usernames: The usernames to register.
+    """
+    conn.executemany(
+        "INSERT INTO ACCOUNTS (username, password, email) VALUES (?, '', '');",
+        ((x,) for x in usernames),
+    )
+    conn.executemany(
+        "INSERT INTO UserProfile (username, name, profilepicture) "
+        "VALUES (?, ?, '/static/images/default-pfp.jpg');",
+        ((x, x) for x in usernames),
+    )
+    conn.commit()
+
+
+@contextmanager
+def count_statements(conn: sqlite3.Connection):
+    """
+    Counts the SQL statements run on a connection inside a with block.
+
+    Yields:
+        A list which the executed statements are appended to.
+    """
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        yield statements
+    finally:
+        conn.set_trace_callback(None)
+
+
+def timed(function, repeat: int = 5) -> float:
+    """
+    Times a function, taking the best of several runs.
+
+    Args:
+        function: The function to time.
+        repeat: How many times to run it.
+
+    Returns:
+        The fastest run time in milliseconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
@@ -4,14 +4,21 @@ the Flask module. Students each have their own profile page, and they can post
 on their feed.
 """
 import os
-import sqlite3
-from datetime import datetime
 
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_events as helper_events
+import student_network.helpers.helper_images as helper_images
+import student_network.helpers.helper_messages as helper_messages
+import student_network.helpers.helper_navbar as helper_navbar
+import student_network.helpers.helper_notifications as helper_notifications
+import student_network.helpers.helper_presence as helper_presence
+import student_network.helpers.helper_timeline as helper_timeline
 import student_network.views.achievements as achievements
 import student_network.views.chat as chat
 import student_network.views.connections as connections
 import student_network.views.flashcards as flashcards
 import student_network.views.login as login
+import student_network.views.notifications as notifications
 import student_network.views.posts as posts
 import student_network.views.profile as profile
 import student_network.views.quizzes as quizzes
@@ -19,15 +26,23 @@ import student_network.views.staff as staff
 from flask import Flask, request, session
 from flask_socketio import SocketIO
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "db.sqlite3")
-
 app = Flask(__name__)
-socketio = SocketIO(app)
+# Workers share SocketIO emits through this queue, such as a Redis URL, so
+# messages reach users connected to any worker.
+socketio = SocketIO(app, message_queue=os.environ.get("SOCKETIO_MESSAGE_QUEUE"))
+helper_database.init_app(app)
+helper_timeline.init_app(app)
+helper_navbar.init_app(app)
+helper_events.init_app(app)
+helper_messages.init_app(app)
+helper_presence.init_app(app)
+helper_notifications.init_app(app)
+helper_images.init_app(app)
 app.register_blueprint(achievements.achievements_blueprint, url_prefix="")
 app.register_blueprint(chat.chat_blueprint, url_prefix="")
 app.register_blueprint(connections.connections_blueprint, url_prefix="")
 app.register_blueprint(login.login_blueprint, url_prefix="")
+app.register_blueprint(notifications.notifications_blueprint, url_prefix="")
 app.register_blueprint(posts.posts_blueprint, url_prefix="")
 app.register_blueprint(profile.profile_blueprint, url_prefix="")
 app.register_blueprint(quizzes.quizzes_blueprint, url_prefix="")
@@ -37,46 +52,61 @@ app.secret_key = (
     '\xfd{H\xe5 <\x95\xf9\xe3\x96.5\xd1\x01O <!\xd5"' "xa2\xa0\x9fR\xa1\xa8"
 )
 app.url_map.strict_slashes = False
-users = {}
 
 
 @socketio.on("username", namespace="/private")
 def receive_username(username):
-    users[username] = request.sid
+    helper_presence.get_presence().register(session["username"], request.sid)
 
+    # Pushes everything sent while the user was offline in one emit. The
+    # client acknowledges them with "delivered" once they are shown.
+    pending = helper_messages.get_pending(session["username"])
+    if pending:
+        socketio.emit(
+            "pending_private_messages",
+            [
+                {
+                    "id": x[0],
+                    "sender_username": x[1],
+                    "username": session["username"],
+                    "message": x[2],
+                    "date": x[3],
+                }
+                for x in pending
+            ],
+            room=request.sid,
+            namespace="/private",
+        )
 
-@socketio.on("private_message", namespace="/private")
-def private_message(payload):
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.cursor()
 
-        now = datetime.now()
+@socketio.on("delivered", namespace="/private")
+def delivered(message_ids):
+    helper_messages.acknowledge(session["username"], message_ids)
 
-        cur.execute(
-            "INSERT INTO PrivateMessages "
-            "(sender, receiver, message, date) VALUES (?, ?, ?, ?);",
-            (
-                session["username"],
-                payload["username"],
-                payload["message"],
-                now.strftime("%Y-%m-%d %H:%M:%S"),
-            ),
-        )
 
-        conn.commit()
+@socketio.on("disconnect", namespace="/private")
+def disconnect():
+    helper_presence.get_presence().unregister(request.sid)
+
 
-    if payload["username"] in users:
-        recipient_session_id = users[payload["username"]]
+@socketio.on("private_message", namespace="/private")
+def private_message(payload):
+    recipient_session_ids = helper_presence.get_presence().lookup(payload["username"])
+    # Messages to users who are offline are pushed when they next connect.
+    helper_messages.save_message(
+        session["username"],
+        payload["username"],
+        payload["message"],
+        offline=not recipient_session_ids,
+    )
 
+    for recipient_session_id in recipient_session_ids:
         socketio.emit(
             "new_private_message",
             payload,
             room=recipient_session_id,
             namespace="/private",
         )
-    # user is not online at the moment
-    else:
-        pass
 
 
 if __name__ == "__main__":
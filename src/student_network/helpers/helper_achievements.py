@@ -1,58 +1,131 @@
 """
 Performs checks and actions to help the achievements system work effectively.
 """
+import json
 import os
-import sqlite3
-from datetime import date
-from typing import Sized, Tuple
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Iterable, NamedTuple, Sized, Tuple
 
+import student_network.helpers.helper_cache as helper_cache
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_events as helper_events
 import student_network.helpers.helper_general as helper_general
+import student_network.helpers.helper_graph as helper_graph
+import student_network.helpers.helper_leaderboard as helper_leaderboard
+import student_network.helpers.helper_navbar as helper_navbar
 import student_network.helpers.helper_profile as helper_profile
-from flask import session
+from flask import current_app, session
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "db.sqlite3")
+CATALOG_CACHE_SIZE = 16
+CATALOG_CACHE_TTL = 3600
+UNLOCK_NOTIFICATION = "You have received an achievement badge!"
 
 
-def apply_achievement(username: str, achievement_id: int):
+class Achievement(NamedTuple):
     """
-    Marks an achievement as unlocked by the user.
+    The details of an achievement which users can unlock.
+    """
+
+    name: str
+    description: str
+    xp_value: int
+    icon: str
+    rarity: str
+
+
+# Every achievement by ID, keyed by database. The catalog only changes when
+# achievements are added to the database by hand.
+_catalog_cache = helper_cache.TTLCache(CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL)
+
+
+def get_catalog() -> dict:
+    """
+    Gets the details of every achievement, loading them only if they aren't
+    cached.
+
+    Returns:
+        The achievements by ID.
+    """
+    key = current_app.config["DATABASE"]
+    catalog = _catalog_cache.get(key)
+    if catalog is None:
+        with helper_database.get_db() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT achievement_ID, achievement_name, description, xp_value, "
+                "icon, rarity FROM Achievements;"
+            )
+            catalog = {x[0]: Achievement(*x[1:]) for x in cur.fetchall()}
+        _catalog_cache.set(key, catalog)
+    return catalog
+
+
+def award_achievements(unlocks: Iterable[tuple]) -> list:
+    """
+    Marks achievements as unlocked, giving each user the experience and a
+    notification for the ones they didn't already have. Everything is
+    written in a single transaction, and achievements already unlocked are
+    skipped by the database rather than checked for first.
 
     Args:
-        username: The user who unlocked the achievement.
-        achievement_id: The ID of the achievement unlocked.
+        unlocks: The usernames and achievement IDs which have been earned.
+
+    Returns:
+        The usernames and achievement IDs which were newly unlocked.
     """
-    with sqlite3.connect("db.sqlite3") as conn:
+    catalog = get_catalog()
+    unlocks = [x for x in dict.fromkeys(unlocks) if x[1] in catalog]
+    if not unlocks:
+        return []
+
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         cur.execute(
-            "SELECT * FROM CompleteAchievements "
-            "WHERE (username=? AND achievement_ID=?);",
-            (username, achievement_id),
+            "INSERT OR IGNORE INTO CompleteAchievements "
+            "(username, achievement_ID, date_completed) "
+            "SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), ? "
+            "FROM json_each(?) RETURNING username, achievement_ID;",
+            (date.today(), json.dumps(unlocks)),
         )
-        if cur.fetchone() is None:
-            cur.execute(
-                "INSERT INTO CompleteAchievements "
-                "(username, achievement_ID, date_completed) VALUES (?, ?, ?);",
-                (username, achievement_id, date.today()),
-            )
-            conn.commit()
-            cur.execute(
-                "SELECT xp_value FROM Achievements WHERE achievement_ID=?;",
-                (achievement_id,),
-            )
-            exp = cur.fetchone()[0]
-            helper_general.check_level_exists(username, conn)
-            cur.execute(
-                "UPDATE UserLevel "
-                "SET experience = experience + ? "
-                "WHERE username=?;",
-                (exp, username),
-            )
-            conn.commit()
+        unlocked = cur.fetchall()
+
+        experience = defaultdict(int)
+        for username, achievement_id in unlocked:
+            experience[username] += catalog[achievement_id].xp_value
+        helper_general.add_experience(cur, experience)
+        now = datetime.now()
+        cur.executemany(
+            "INSERT INTO notification (username, body, date, timestamp, url) "
+            "VALUES (?, ?, ?, ?, ?);",
+            (
+                (
+                    x[0],
+                    UNLOCK_NOTIFICATION,
+                    now.strftime("%Y-%m-%d %H:%M:%S"),
+                    int(now.timestamp()),
+                    "/achievements",
+                )
+                for x in unlocked
+            ),
+        )
+        conn.commit()
+        helper_leaderboard.refresh(cur, *experience)
+    helper_navbar.invalidate_badges(*experience)
+    return unlocked
 
-            helper_general.new_notification(
-                "You have received an achievement badge!", "/achievements"
-            )
+
+def apply_achievement(username: str, achievement_id: int):
+    """
+    Marks an achievement as unlocked by the user.
+
+    Args:
+        username: The user who unlocked the achievement.
+        achievement_id: The ID of the achievement unlocked.
+    """
+    award_achievements([(username, achievement_id)])
 
 
 def get_achievements(username: str) -> Tuple[Sized, Sized]:
@@ -62,28 +135,31 @@ def get_achievements(username: str) -> Tuple[Sized, Sized]:
     Returns:
         A list of unlocked and locked achievements and their details.
     """
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
-        # Gets unlocked achievements, sorted by XP descending.
         cur.execute(
-            "SELECT description, icon, rarity, xp_value, achievement_name "
-            "FROM CompleteAchievements "
-            "INNER JOIN Achievements ON CompleteAchievements"
-            ".achievement_ID = Achievements.achievement_ID "
-            "WHERE username=?;",
+            "SELECT achievement_ID FROM CompleteAchievements WHERE username=?;",
             (username,),
         )
-        unlocked_achievements = cur.fetchall()
-        unlocked_achievements.sort(key=lambda x: x[3], reverse=True)
-
-        # Get locked achievements, sorted by XP ascending.
-        cur.execute(
-            "SELECT description, icon, rarity, xp_value, achievement_name "
-            "FROM Achievements"
+        unlocked_ids = {x[0] for x in cur.fetchall()}
+
+    # Gets unlocked achievements sorted by XP descending, and locked
+    # achievements sorted by XP ascending.
+    unlocked_achievements, locked_achievements = [], []
+    for achievement_id, achievement in get_catalog().items():
+        details = (
+            achievement.description,
+            achievement.icon,
+            achievement.rarity,
+            achievement.xp_value,
+            achievement.name,
         )
-        all_achievements = cur.fetchall()
-        locked_achievements = list(set(all_achievements) - set(unlocked_achievements))
-        locked_achievements.sort(key=lambda x: x[3])
+        if achievement_id in unlocked_ids:
+            unlocked_achievements.append(details)
+        else:
+            locked_achievements.append(details)
+    unlocked_achievements.sort(key=lambda x: x[3], reverse=True)
+    locked_achievements.sort(key=lambda x: x[3])
 
     return unlocked_achievements, locked_achievements
 
@@ -96,242 +172,319 @@ def update_close_connection_achievements(cur):
         cur: Cursor for the SQLite database.
     """
     # Award achievement ID 12 - Friends if necessary
-    apply_achievement(session["username"], 12)
+    unlocks = [(session["username"], 12)]
 
     # Award achievement ID 13 - Friend Group if necessary
-    cur.execute("SELECT * FROM CloseFriend WHERE user1=?;", (session["username"],))
-    if len(cur.fetchall()) >= 10:
-        apply_achievement(session["username"], 13)
+    if len(helper_graph.get_graph().get_close_friends(session["username"])) >= 10:
+        unlocks.append((session["username"], 13))
 
+    award_achievements(unlocks)
 
-def update_connection_achievements(cur, username: str):
+
+def has_shared(cur, table: str, column: str, username1: str, username2: str) -> bool:
     """
-    Updates achievements after interacting with a connection request.
+    Checks whether two users share any hobbies or interests.
 
     Args:
         cur: Cursor for the SQLite database.
-        username: The username of the person who requested a connection.
-    """
-    # Award achievement ID 4 - Connected if necessary
-    apply_achievement(session["username"], 4)
+        table: UserHobby or UserInterests.
+        column: hobby or interest.
+        username1: One of the users.
+        username2: The other user.
 
-    # Award achievement ID 4 to connected user
-    apply_achievement(username, 4)
-
-    # Get user interests and hobbies
+    Returns:
+        Whether the users have a hobby or interest in common (True/False).
+    """
     cur.execute(
-        "SELECT interest FROM UserInterests WHERE username=?;",
-        (session["username"],),
+        "SELECT EXISTS (SELECT 1 FROM {0} AS Mine "
+        "INNER JOIN {0} AS Theirs ON Theirs.{1}=Mine.{1} "
+        "WHERE Mine.username=? AND Theirs.username=?);".format(table, column),
+        (username1, username2),
     )
-    row = cur.fetchall()
-    my_interests = []
-    for interest in row:
-        my_interests.append(interest[0])
-    cur.execute("SELECT hobby FROM UserHobby WHERE username=?;", (session["username"],))
-    row = cur.fetchall()
-    my_hobbies = []
-    for hobby in row:
-        my_hobbies.append(hobby[0])
-    # Get connected user interests and hobbies
-    cur.execute("SELECT interest FROM UserInterests WHERE username=?;", (username,))
-    row = cur.fetchall()
-    connection_interests = []
-    for interest in row:
-        connection_interests.append(interest[0])
-    cur.execute("SELECT hobby FROM UserHobby WHERE username=?;", (username,))
-    row = cur.fetchall()
-    connection_hobbies = []
-    for hobby in row:
-        connection_hobbies.append(hobby[0])
-    # Awards achievement ID 16 - Shared interests if necessary.
-    common_interests = set(my_interests) - (
-        set(my_interests) - set(connection_interests)
-    )
-    if common_interests:
-        apply_achievement(session["username"], 16)
-        # Award achievement ID 16 to connected user
-        apply_achievement(username, 16)
-
-    # Award achievement ID 26 - Shared hobbies if necessary
-    common_hobbies = set(my_hobbies) - (set(my_hobbies) - set(connection_hobbies))
-    if common_hobbies:
-        apply_achievement(session["username"], 26)
-        # Award achievement ID 26 to connected user
-        apply_achievement(username, 26)
-
-    # Get connections
-    cons_user = helper_general.get_all_connections(session["username"])
-    cons_user2 = helper_general.get_all_connections(username)
-    # Get user degree and connections degree
-    degree = helper_profile.get_degree(session["username"])[0]
-    degree_user2 = helper_profile.get_degree(username)[0]
-    # Get count of connections who study a different degree
-    valid_user_count = 0
-    for user in cons_user:
-        cur.execute(
-            "SELECT username from UserProfile WHERE degree!=? AND username=?;",
-            (degree, user[0]),
-        )
-        if cur.fetchone():
-            valid_user_count += 1
-    # Gets count of other user connections who study a
-    # different degree.
-    valid_user_count2 = 0
-    for user in cons_user2:
-        cur.execute(
-            "SELECT username from UserProfile WHERE degree!=? AND username=?;",
-            (degree_user2, user[0]),
-        )
-        if cur.fetchone():
-            valid_user_count2 += 1
-    # Awards achievement ID 14 - Reaching out if necessary.
-    if valid_user_count >= 1:
-        apply_achievement(session["username"], 14)
-    # Award achievement ID 14 to connected user
-    if valid_user_count2 >= 1:
-        apply_achievement(username, 14)
+    return bool(cur.fetchone()[0])
+
 
+def get_network_unlocks(username: str, connections: set, users: dict) -> list:
+    """
+    Works out the achievements a user has earned from their connections.
+
+    Args:
+        username: The user to check.
+        connections: The user's connections.
+        users: The details of the user and their connections.
+
+    Returns:
+        The usernames and IDs of the achievements earned.
+    """
+    unlocks = []
+    # Gets the number of connections who study a different degree.
+    degree = users[username].degree_id
+    other_degrees = 0
+    for connection in connections:
+        user = users.get(connection)
+        if user and user.degree_id is not None and user.degree_id != degree:
+            other_degrees += 1
+    # Awards achievement ID 14 - Reaching out if necessary.
+    if other_degrees >= 1:
+        unlocks.append((username, 14))
     # Award achievement ID 15 - Outside your bubble if necessary
-    if valid_user_count >= 10:
-        apply_achievement(session["username"], 15)
-    # Award achievement ID 15 to connected user
-    if valid_user_count2 >= 10:
-        apply_achievement(username, 15)
-
-    # Get number of connections
-    con_count_user = len(cons_user)
-    con_count_user2 = len(cons_user2)
+    if other_degrees >= 10:
+        unlocks.append((username, 15))
     # Award achievement ID 5 - Popular if necessary
-    if con_count_user >= 10:
-        apply_achievement(session["username"], 5)
-    # Award achievement ID 5 to connected user
-    if con_count_user2 >= 10:
-        apply_achievement(username, 5)
+    if len(connections) >= 10:
+        unlocks.append((username, 5))
     # Award achievement ID 6 - Centre of Attention if necessary
-    if con_count_user >= 100:
-        apply_achievement(session["username"], 6)
-    # Award achievement ID 6 to connected user
-    if con_count_user2 >= 100:
-        apply_achievement(username, 6)
+    if len(connections) >= 100:
+        unlocks.append((username, 6))
+    return unlocks
+
+
+def get_connected_unlocks(cur, username1: str, username2: str) -> list:
+    """
+    Works out the achievements earned by two users becoming connected.
 
+    Args:
+        cur: Cursor for the SQLite database.
+        username1: One of the users.
+        username2: The other user.
 
-def update_post_achievements(cur, likes: int, username: str):
+    Returns:
+        The usernames and IDs of the achievements earned.
     """
-    Unlocks achievements for a user after interaction with a post.
+    both = (username1, username2)
+    # Award achievement ID 4 - Connected to both users if necessary
+    unlocks = [(x, 4) for x in both]
+
+    # Awards achievement ID 16 - Shared interests to both users if necessary.
+    if has_shared(cur, "UserInterests", "interest", *both):
+        unlocks += [(x, 16) for x in both]
+    # Award achievement ID 26 - Shared hobbies to both users if necessary
+    if has_shared(cur, "UserHobby", "hobby", *both):
+        unlocks += [(x, 26) for x in both]
+
+    # Checks the connections of both users, loading all their degrees at once.
+    graph = helper_graph.get_graph()
+    connections = {x: graph.get_connections(x) for x in both}
+    users = helper_profile.get_users(set(both).union(*connections.values()))
+    for user in both:
+        unlocks += get_network_unlocks(user, connections[user], users)
+    return unlocks
+
+
+def get_liked_unlocks(cur, username: str, author: str, likes: int) -> list:
+    """
+    Works out the achievements earned by liking a post.
 
     Args:
         cur: Cursor for the SQLite database.
+        username: The user who liked the post.
+        author: Author of the post.
         likes: Number of likes on the post.
-        username: Author of the post.
+
+    Returns:
+        The usernames and IDs of the achievements earned.
     """
     # Award achievement ID 20 - First like if necessary
-    apply_achievement(username, 20)
+    unlocks = [(author, 20)]
 
     # Award achievement ID 22 - Everyone loves you if necessary
     if likes >= 50:
-        apply_achievement(username, 22)
+        unlocks.append((author, 22))
 
     # Checks how many posts user has liked.
-    cur.execute(
-        "SELECT COUNT(postId) FROM UserLikes WHERE username=? ;",
-        (session["username"],),
-    )
+    cur.execute("SELECT COUNT(postId) FROM UserLikes WHERE username=?;", (username,))
     row = cur.fetchone()[0]
     # Award achievement ID 19 - Liking that if necessary
-    if row == 1:
-        apply_achievement(session["username"], 19)
+    if row >= 1:
+        unlocks.append((username, 19))
     # Award achievement ID 24 - Show the love if necessary
-    elif row == 50:
-        apply_achievement(session["username"], 24)
+    if row >= 50:
+        unlocks.append((username, 24))
     # Award achievement ID 25 - Loving everything if necessary
-    elif row == 500:
-        apply_achievement(session["username"], 25)
+    if row >= 500:
+        unlocks.append((username, 25))
+    return unlocks
 
 
-def update_profile_achievements(username: str):
+def get_commented_unlocks(username: str, author: str, comments: int) -> list:
     """
-    Unlocks achievements for a user after interaction with a profile.
+    Works out the achievements earned by commenting on a post.
 
     Args:
-        username: Author of the post.
-    """
-    # Award achievement ID 1 - Look at you if necessary
-    if username == session["username"]:
-        apply_achievement(session["username"], 1)
+        username: The user who made the comment.
+        author: Author of the post.
+        comments: Number of comments on the post.
 
-    # Award achievement ID 2 - Looking good if necessary
-    if username != session["username"] and session["username"]:
-        apply_achievement(session["username"], 2)
+    Returns:
+        The usernames and IDs of the achievements earned.
+    """
+    # Award achievement ID 10 - Commentary if necessary
+    unlocks = [(username, 10)]
 
-    # Award achievement ID 23 - Secret meeting
-    # Set meeting to allow for secret achievement to be earned
-    meeting_now = False
-    special_day = (5, 27)
-    today = date.today()
-    if today.month == special_day[0] and today.day == special_day[1]:
-        meeting_now = True
-    if session["username"] and meeting_now:
-        apply_achievement(session["username"], 23)
+    # Award achievement ID 21 - Hot topic if necessary
+    if comments >= 10:
+        unlocks.append((author, 21))
+    return unlocks
 
 
-def update_quiz_achievements(score: int, other_user: bool = False):
+def get_quiz_completed_unlocks(username: str, score: int, other_author: bool) -> list:
     """
-    Updates achievements after completing a quiz.
+    Works out the achievements earned by completing a quiz.
 
     Args:
+        username: The user who completed the quiz.
         score: Number of correct answers from the quiz.
+        other_author: Whether the quiz was written by someone else.
+
+    Returns:
+        The usernames and IDs of the achievements earned.
     """
     # Award achievement ID 27 - Boffin if necessary
-    apply_achievement(session["username"], 27)
+    unlocks = [(username, 27)]
 
     # Award achievement ID 28 - Brainiac if necessary
     if score == 5:
-        apply_achievement(session["username"], 28)
+        unlocks.append((username, 28))
 
     # Award achievement ID 30 - Trivia writer if necessary
-    if other_user:
-        apply_achievement(session["username"], 30)
+    if other_author:
+        unlocks.append((username, 30))
+    return unlocks
 
 
-def update_flashcard_achievements(author, plays):
+def get_set_played_unlocks(username: str, author: str, plays: int) -> list:
     """
-    Updates achievements after playing a flashcard set.
+    Works out the achievements earned by playing a flashcard set.
 
     Args:
-        author: Author of the set being viewed
+        username: The user who played the set.
+        author: Author of the set.
+        plays: Number of times the set has been played.
+
+    Returns:
+        The usernames and IDs of the achievements earned.
     """
-    # Award achievement ID 32 - Learning if necessary
-    apply_achievement(session["username"], 31)
+    # Award achievement ID 31 - Learning if necessary
+    unlocks = [(username, 31)]
 
     # Award achievement ID 32 - Teacher if necessary
-    if session["username"] != author:
-        apply_achievement(author, 32)
+    if username != author:
+        unlocks.append((author, 32))
 
-    # Award achievement ID 32 - Professor if necessary
-    if plays == 50:
-        apply_achievement(author, 33)
+    # Award achievement ID 33 - Professor if necessary
+    if plays >= 50:
+        unlocks.append((author, 33))
+    return unlocks
 
 
-def binary_search(lst, target):
+@helper_events.handler("connected")
+def process_connected(cur, events: list):
     """
-    Binary search algorithm to find user in list of users
+    Awards the achievements for a batch of connection requests accepted.
 
     Args:
-        lst: list of users
-        target: username of target
+        cur: Cursor for the SQLite database.
+        events: The username and requester of each accepted request.
+    """
+    award_achievements(
+        unlock
+        for x in events
+        for unlock in get_connected_unlocks(cur, x["username"], x["requester"])
+    )
 
-    Returns:
-        index of target in list if found
+
+@helper_events.handler("liked")
+def process_liked(cur, events: list):
     """
-    first, last = 0, len(lst) - 1
-    while first <= last:
-        mid = (first + last) // 2
-        if lst[mid] == target:
-            return mid + 1
-        else:
-            if target[1] > lst[mid][1]:
-                last = mid - 1
-            else:
-                first = mid + 1
-    session["error"] = ["User not found"]
-    return
+    Awards the achievements for a batch of posts liked.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        events: The user, post author and number of likes of each like.
+    """
+    award_achievements(
+        unlock
+        for x in events
+        for unlock in get_liked_unlocks(cur, x["username"], x["author"], x["likes"])
+    )
+
+
+@helper_events.handler("commented")
+def process_commented(cur, events: list):
+    """
+    Awards the achievements for a batch of comments made.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        events: The user, post author and number of comments of each comment.
+    """
+    award_achievements(
+        unlock
+        for x in events
+        for unlock in get_commented_unlocks(x["username"], x["author"], x["comments"])
+    )
+
+
+@helper_events.handler("quiz_completed")
+def process_quiz_completed(cur, events: list):
+    """
+    Awards the achievements for a batch of quizzes completed.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        events: The user, score and whether someone else wrote the quiz, for
+            each quiz completed.
+    """
+    award_achievements(
+        unlock
+        for x in events
+        for unlock in get_quiz_completed_unlocks(
+            x["username"], x["score"], x["other_author"]
+        )
+    )
+
+
+@helper_events.handler("set_played")
+def process_set_played(cur, events: list):
+    """
+    Awards the achievements for a batch of flashcard sets played.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        events: The user, set author and number of plays of each set played.
+    """
+    award_achievements(
+        unlock
+        for x in events
+        for unlock in get_set_played_unlocks(x["username"], x["author"], x["plays"])
+    )
+
+
+def update_profile_achievements(username: str):
+    """
+    Unlocks achievements for a user after interaction with a profile.
+
+    Args:
+        username: Author of the post.
+    """
+    unlocks = []
+    # Award achievement ID 1 - Look at you if necessary
+    if username == session["username"]:
+        unlocks.append((session["username"], 1))
+
+    # Award achievement ID 2 - Looking good if necessary
+    if username != session["username"] and session["username"]:
+        unlocks.append((session["username"], 2))
+
+    # Award achievement ID 23 - Secret meeting
+    # Set meeting to allow for secret achievement to be earned
+    meeting_now = False
+    special_day = (5, 27)
+    today = date.today()
+    if today.month == special_day[0] and today.day == special_day[1]:
+        meeting_now = True
+    if session["username"] and meeting_now:
+        unlocks.append((session["username"], 23))
+
+    award_achievements(unlocks)
+
@@ -0,0 +1,184 @@
+"""
+Suggests usernames as they are typed from an in-process sorted index, so
+autocompletion never has to query the database.
+
+Triggers log every user whose account or profile picture changes in the
+UserChange table. Each process reads the log once per request and re-reads
+those users, so users who registered through other workers are suggested
+too.
+"""
+import json
+import threading
+from bisect import bisect_left, insort
+
+import student_network.helpers.helper_database as helper_database
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+class UsernameIndex:
+    """
+    Every username in sorted order with each user's profile picture.
+
+    The usernames starting with a prefix are next to each other, so they are
+    found by one binary search in O(log n) and read off in order.
+    """
+
+    def __init__(self, rows: list):
+        self._pictures = dict(rows)
+        self._usernames = sorted(self._pictures)
+        self._lock = threading.RLock()
+        # The last change in the UserChange log the index includes.
+        self.seq = 0
+
+    @classmethod
+    def load(cls, conn) -> "UsernameIndex":
+        """
+        Builds the index from the database.
+
+        Args:
+            conn: Connection to the database.
+
+        Returns:
+            The index of every registered user.
+        """
+        # The log position is read before the rows, so any change made in
+        # between is applied again by the next sync, which is harmless. Rows
+        # written by a transaction which hasn't committed yet may be rolled
+        # back, so the index is then loaded again next time.
+        seq = helper_database.get_last_change(conn, "UserChange")
+        index = cls(
+            conn.execute(
+                "SELECT ACCOUNTS.username, UserProfile.profilepicture FROM ACCOUNTS "
+                "LEFT JOIN UserProfile ON UserProfile.username=ACCOUNTS.username;"
+            ).fetchall()
+        )
+        index.seq = -1 if conn.in_transaction else seq
+        return index
+
+    def sync(self, conn) -> bool:
+        """
+        Applies the changes logged since the index was last brought up to
+        date, re-reading each user changed.
+
+        Args:
+            conn: Connection to the database.
+
+        Returns:
+            Whether the index is up to date, or False if the log no longer
+            goes back far enough and the index must be loaded again.
+        """
+        changes = helper_database.get_changes(conn, "UserChange", self.seq)
+        if changes is None:
+            return False
+        if not changes:
+            return True
+
+        usernames = sorted({x[1] for x in changes})
+        pictures = dict(
+            conn.execute(
+                "SELECT ACCOUNTS.username, UserProfile.profilepicture FROM ACCOUNTS "
+                "LEFT JOIN UserProfile ON UserProfile.username=ACCOUNTS.username "
+                "WHERE ACCOUNTS.username IN (SELECT value FROM json_each(?));",
+                (json.dumps(usernames),),
+            )
+        )
+        with self._lock:
+            # Another request may have applied these changes, or later ones,
+            # while they were being read.
+            if changes[-1][0] <= self.seq:
+                return True
+            for username in usernames:
+                if username in pictures:
+                    self.set_user(username, pictures[username])
+                else:
+                    self.remove(username)
+            # Changes which haven't committed yet are read again next time,
+            # in case they are rolled back.
+            if not conn.in_transaction:
+                self.seq = changes[-1][0]
+        return True
+
+    def __len__(self) -> int:
+        return len(self._usernames)
+
+    def set_user(self, username: str, picture: str):
+        """
+        Adds a user to the index, or changes their profile picture.
+
+        Args:
+            username: The user who registered or changed their picture.
+            picture: Their profile picture.
+        """
+        with self._lock:
+            if username not in self._pictures:
+                insort(self._usernames, username)
+            self._pictures[username] = picture
+
+    def remove(self, username: str):
+        """
+        Takes a user whose account was deleted out of the index.
+
+        Args:
+            username: The user to remove.
+        """
+        with self._lock:
+            if username in self._pictures:
+                del self._pictures[username]
+                del self._usernames[bisect_left(self._usernames, username)]
+
+    def complete(self, prefix: str, limit: int) -> list:
+        """
+        Gets the usernames which start with the given characters.
+
+        Args:
+            prefix: The start of the username.
+            limit: The maximum number of usernames.
+
+        Returns:
+            The username and profile picture of each match, in alphabetical
+            order.
+        """
+        with self._lock:
+            start = bisect_left(self._usernames, prefix)
+            matches = []
+            for username in self._usernames[start : start + limit]:
+                if not username.startswith(prefix):
+                    break
+                matches.append((username, self._pictures[username]))
+        return matches
+
+
+def get_index(path: str = None) -> UsernameIndex:
+    """
+    Gets the username index for the database, loading it on first use and
+    applying changes made by other processes once per request.
+
+    Args:
+        path: The database file, defaulting to the app's DATABASE setting.
+
+    Returns:
+        The username index for the database.
+    """
+    return helper_database.get_index(_indexes, _indexes_lock, UsernameIndex, path)
+
+
+def refresh(cur, *usernames: str):
+    """
+    Re-reads users into the index after their account or profile picture is
+    committed.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        usernames: The users who registered or changed their picture.
+    """
+    index = get_index()
+    cur.execute(
+        "SELECT ACCOUNTS.username, UserProfile.profilepicture FROM ACCOUNTS "
+        "LEFT JOIN UserProfile ON UserProfile.username=ACCOUNTS.username "
+        "WHERE ACCOUNTS.username IN (SELECT value FROM json_each(?));",
+        (json.dumps(usernames),),
+    )
+    for username, picture in cur.fetchall():
+        index.set_user(username, picture)
@@ -0,0 +1,84 @@
+"""
+Provides a small thread-safe in-process cache with least recently used
+eviction and a time to live for each entry.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    A bounded mapping whose entries expire after a fixed number of seconds.
+
+    When the cache is full, the least recently used entry is evicted to make
+    room for a new one.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Gets a value from the cache.
+
+        Args:
+            key: The key of the value.
+            default: What to return if the key is missing or has expired.
+
+        Returns:
+            The cached value, or the default.
+        """
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires, value = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """
+        Stores a value in the cache, evicting the least recently used entry
+        if the cache is full.
+
+        Args:
+            key: The key of the value.
+            value: The value to store.
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Removes a value from the cache if it is present.
+
+        Args:
+            key: The key of the value.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes every value from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,333 @@
+"""
+Provides shared access to the SQLite database, handing out one pooled
+connection per Flask request.
+"""
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import student_network.helpers.helper_migrations as helper_migrations
+from flask import current_app, g, has_app_context
+
+DEFAULT_DB_PATH = "db.sqlite3"
+POOL_SIZE = 8
+POOL_TIMEOUT = 10
+CACHED_STATEMENTS = 256
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA busy_timeout=5000;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA cache_size=-8000;",
+)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe pool of SQLite connections to a single database.
+
+    Connections are created lazily up to the maximum size, configured with
+    write-ahead logging and the tuned pragmas above, and keep a prepared
+    statement cache which survives between requests.
+    """
+
+    def __init__(self, path: str, max_size: int = POOL_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.opened = 0
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Opens a new physical connection to the database.
+
+        Returns:
+            The configured connection.
+        """
+        conn = sqlite3.connect(
+            self.path, check_same_thread=False, cached_statements=CACHED_STATEMENTS
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def acquire(self, timeout: float = POOL_TIMEOUT) -> sqlite3.Connection:
+        """
+        Takes a connection from the pool, waiting if all are in use.
+
+        Args:
+            timeout: How long to wait for a free connection, in seconds.
+
+        Returns:
+            A connection to the database.
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("No database connection available in the pool.")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                return self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+
+    def release(self, conn: sqlite3.Connection):
+        """
+        Returns a connection to the pool, discarding any unfinished
+        transaction.
+
+        Args:
+            conn: The connection to return.
+        """
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a connection for the duration of a with block, committing on
+        success and rolling back on error.
+        """
+        conn = self.acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.release(conn)
+
+    def migrate(self) -> int:
+        """
+        Applies any schema migrations which the database is missing.
+
+        Returns:
+            The schema version of the database.
+        """
+        conn = self.acquire()
+        try:
+            return helper_migrations.migrate(conn)
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """
+        Closes every idle connection held by the pool.
+        """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def get_pool(path: str = None) -> ConnectionPool:
+    """
+    Gets the connection pool for the database, creating it on first use.
+
+    Args:
+        path: The database file, defaulting to the app's DATABASE setting.
+
+    Returns:
+        The connection pool for the database.
+    """
+    if path is None:
+        path = DEFAULT_DB_PATH
+        if has_app_context():
+            path = current_app.config.get("DATABASE", DEFAULT_DB_PATH)
+    with _pools_lock:
+        if path not in _pools:
+            _pools[path] = ConnectionPool(path)
+            _pools[path].migrate()
+        return _pools[path]
+
+
+def get_db() -> sqlite3.Connection:
+    """
+    Gets the database connection for the current request, taking one from
+    the pool the first time it is needed.
+
+    Returns:
+        The connection shared by everything handling this request.
+    """
+    if "db" not in g:
+        g.db = get_pool().acquire()
+        g.db_connections_opened = g.get("db_connections_opened", 0) + 1
+    return g.db
+
+
+def connection():
+    """
+    Borrows a pooled connection outside of a request, such as in background
+    workers and CLI commands.
+
+    Returns:
+        A context manager yielding the connection.
+    """
+    return get_pool().connection()
+
+
+def get_connection_count() -> int:
+    """
+    Gets the number of connections opened while handling this request.
+
+    Returns:
+        The number of connections taken from the pool by this request.
+    """
+    return g.get("db_connections_opened", 0)
+
+
+def close_db(exception=None):
+    """
+    Commits or rolls back the request's connection and returns it to the
+    pool.
+
+    Args:
+        exception: The error which ended the request, if any.
+    """
+    conn = g.pop("db", None)
+    if conn is not None:
+        if exception is None and conn.in_transaction:
+            conn.commit()
+        get_pool().release(conn)
+
+
+def get_last_change(conn, log: str) -> int:
+    """
+    Gets the position of the latest change in a change log table, which
+    triggers fill with the keys of rows changed in another table.
+
+    Args:
+        conn: Connection to the database.
+        log: The name of the change log table.
+
+    Returns:
+        The sequence number of the latest change, or 0 if there are none.
+    """
+    row = conn.execute(
+        "SELECT seq FROM sqlite_sequence WHERE name=?;", (log,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def get_changes(conn, log: str, seq: int):
+    """
+    Gets the changes logged after a position in a change log table.
+
+    Args:
+        conn: Connection to the database.
+        log: The name of the change log table, whose first column is seq.
+        seq: The last change already seen.
+
+    Returns:
+        The rows logged since, oldest first, or None if the log has been
+        pruned past the position, so the changes can't be known.
+    """
+    if get_last_change(conn, log) == seq:
+        return []
+    changes = conn.execute(
+        "SELECT * FROM {} WHERE seq>? ORDER BY seq;".format(log), (seq,)
+    ).fetchall()
+    if not changes or changes[0][0] != seq + 1:
+        return None
+    return changes
+
+
+def sync_index(indexes: dict, lock, path: str, index_class, conn):
+    """
+    Brings an in-process index of a database up to date, loading it if
+    there is none or it has fallen too far behind its change log.
+
+    Args:
+        indexes: The indexes already loaded, by database file.
+        lock: The lock guarding indexes.
+        path: The database file.
+        index_class: The class of index, with load(conn) and sync(conn)
+            methods.
+        conn: Connection to the database.
+
+    Returns:
+        The index for the database.
+    """
+    # The lock is only held to look the index up, so requests never wait on
+    # each other's queries.
+    with lock:
+        index = indexes.get(path)
+    if index is None or not index.sync(conn):
+        loaded = index_class.load(conn)
+        with lock:
+            index = indexes[path] = loaded
+    return index
+
+
+def get_index(indexes: dict, lock, index_class, path: str = None):
+    """
+    Gets an in-process index of a database, loading it on first use and
+    applying changes made by other processes once per request.
+
+    Within a request the changes are read on the request's own connection,
+    so looking up an index never waits for a second one from the pool.
+
+    Args:
+        indexes: The indexes already loaded, by database file.
+        lock: The lock guarding indexes.
+        index_class: The class of index, with load(conn) and sync(conn)
+            methods.
+        path: The database file, defaulting to the app's DATABASE setting.
+
+    Returns:
+        The index for the database.
+    """
+    app_path = None
+    if has_app_context():
+        app_path = current_app.config.get("DATABASE", DEFAULT_DB_PATH)
+    if path is None:
+        path = app_path or DEFAULT_DB_PATH
+    if path != app_path:
+        with get_pool(path).connection() as conn:
+            return sync_index(indexes, lock, path, index_class, conn)
+
+    synced = g.setdefault("synced_indexes", set())
+    key = (index_class.__name__, path)
+    if key in synced:
+        with lock:
+            index = indexes.get(path)
+        if index is not None:
+            return index
+    index = sync_index(indexes, lock, path, index_class, get_db())
+    synced.add(key)
+    return index
+
+
+def add_connection_count_header(response):
+    """
+    Reports how many connections the request opened in a response header.
+
+    Args:
+        response: The response being sent.
+
+    Returns:
+        The response with the X-DB-Connections header set.
+    """
+    response.headers["X-DB-Connections"] = str(get_connection_count())
+    return response
+
+
+def init_app(app):
+    """
+    Registers the request hooks which manage the shared connection.
+
+    Args:
+        app: The Flask application.
+    """
+    app.config.setdefault("DATABASE", DEFAULT_DB_PATH)
+    app.after_request(add_connection_count_header)
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,236 @@
+"""
+Queues domain events in the database so their side effects, such as
+awarding achievements, run on a background worker instead of while the user
+waits for a response.
+
+Events are delivered at least once: a worker leases a batch, runs the
+handlers and only then deletes the events, so events from a worker which
+dies part way are handed out again once the lease expires. Handlers must
+therefore be safe to run twice for the same event.
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+
+import student_network.helpers.helper_database as helper_database
+from flask import after_this_request, current_app, has_request_context
+
+BATCH_SIZE = 100
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 5
+POLL_INTERVAL = 1.0
+
+# Handler functions by event name, each taking a cursor and the payloads of
+# a batch of events.
+_handlers = {}
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def handler(name: str):
+    """
+    Registers a function to process every batch of events with this name.
+
+    Args:
+        name: The name of the event.
+
+    Returns:
+        A decorator which registers the function.
+    """
+
+    def register(function):
+        _handlers[name] = function
+        return function
+
+    return register
+
+
+def publish(cur, name: str, **payload):
+    """
+    Adds an event to the queue as part of the caller's transaction, so it is
+    only processed if the change which caused it is committed.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        name: The name of the event.
+        **payload: The details handlers need, which must be JSON serialisable.
+    """
+    cur.execute(
+        "INSERT INTO EventQueue (name, payload) VALUES (?, ?);",
+        (name, json.dumps(payload)),
+    )
+    if current_app.config["EVENT_WORKER"]:
+        worker = get_worker(current_app._get_current_object())
+        if has_request_context():
+            # Wakes the worker once the request has committed the event.
+            @after_this_request
+            def wake_worker(response):
+                worker.wake()
+                return response
+
+        else:
+            worker.wake()
+
+
+def claim_events(conn, limit: int = BATCH_SIZE) -> list:
+    """
+    Leases the oldest events which are ready to be processed, taking new
+    events before ones whose lease has expired.
+
+    Args:
+        conn: Connection to the database.
+        limit: The maximum number of events to lease.
+
+    Returns:
+        The ID, name and payload of each leased event.
+    """
+    now = time.time()
+    rows = conn.execute(
+        "UPDATE EventQueue SET locked_until=?, attempts=attempts + 1 "
+        "WHERE eventId IN (SELECT eventId FROM EventQueue "
+        "WHERE locked_until<=? AND attempts<? "
+        "ORDER BY locked_until, eventId LIMIT ?) RETURNING eventId, name, payload;",
+        (now + LEASE_SECONDS, now, MAX_ATTEMPTS, limit),
+    ).fetchall()
+    conn.commit()
+    return sorted(rows)
+
+
+def process_events(limit: int = BATCH_SIZE) -> int:
+    """
+    Processes one batch of events, running each handler once for all of the
+    events with its name. Events whose handler fails are left to be retried
+    when their lease expires.
+
+    Args:
+        limit: The maximum number of events to process.
+
+    Returns:
+        The number of events processed successfully.
+    """
+    conn = helper_database.get_db()
+    batches = defaultdict(list)
+    for event_id, name, payload in claim_events(conn, limit):
+        batches[name].append((event_id, json.loads(payload)))
+
+    if not batches:
+        return 0
+
+    done = []
+    for name, events in batches.items():
+        try:
+            _handlers[name](conn.cursor(), [x[1] for x in events])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            current_app.logger.exception("Failed to process %s events.", name)
+        else:
+            done += [x[0] for x in events]
+
+    conn.execute(
+        "DELETE FROM EventQueue WHERE eventId IN (SELECT value FROM json_each(?));",
+        (json.dumps(done),),
+    )
+    conn.commit()
+    return len(done)
+
+
+def get_queue_depth() -> dict:
+    """
+    Counts the events waiting in the queue.
+
+    Returns:
+        The number of events ready to process, leased by a worker, and given
+        up on after too many failed attempts.
+    """
+    with helper_database.get_db() as conn:
+        pending, leased, failed = conn.execute(
+            "SELECT TOTAL(attempts<:max AND locked_until<=:now), "
+            "TOTAL(attempts<:max AND locked_until>:now), TOTAL(attempts>=:max) "
+            "FROM EventQueue;",
+            {"max": MAX_ATTEMPTS, "now": time.time()},
+        ).fetchone()
+    return {"pending": int(pending), "leased": int(leased), "failed": int(failed)}
+
+
+class EventWorker(threading.Thread):
+    """
+    A daemon thread which processes queued events, waking up when an event
+    is published or after the poll interval.
+    """
+
+    def __init__(self, app):
+        super().__init__(name="event-worker", daemon=True)
+        self.app = app
+        self._wake = threading.Event()
+
+    def wake(self):
+        """
+        Asks the worker to check the queue now instead of waiting.
+        """
+        self._wake.set()
+
+    def run(self):
+        while True:
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    while process_events() == BATCH_SIZE:
+                        pass
+            except Exception:
+                self.app.logger.exception("Event worker failed.")
+
+
+def get_worker(app) -> EventWorker:
+    """
+    Gets the worker for this process, starting it on first use.
+
+    Args:
+        app: The Flask application.
+
+    Returns:
+        The running worker.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = EventWorker(app)
+            _worker.start()
+        return _worker
+
+
+def init_app(app):
+    """
+    Sets the worker default and registers the queue commands.
+
+    Args:
+        app: The Flask application.
+    """
+    app.config.setdefault("EVENT_WORKER", True)
+
+    @app.cli.command("process-events")
+    def process_events_command():
+        """
+        Processes every queued event, for deployments which turn off
+        EVENT_WORKER and run this on a schedule instead.
+        """
+        total = 0
+        while True:
+            processed = process_events()
+            total += processed
+            if processed < BATCH_SIZE:
+                break
+        print("Processed {} events.".format(total))
+
+    @app.cli.command("event-queue-depth")
+    def event_queue_depth_command():
+        """
+        Shows how many events are queued.
+        """
+        print(
+            "Pending: {pending}, leased: {leased}, failed: {failed}".format(
+                **get_queue_depth()
+            )
+        )
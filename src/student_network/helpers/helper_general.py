@@ -1,12 +1,17 @@
 """
 Performs checks and actions to help the general system work effectively.
 """
+import json
 import os
-import sqlite3
+import time
 from datetime import datetime
 from math import floor
-from typing import Tuple
 
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_graph as helper_graph
+import student_network.helpers.helper_leaderboard as helper_leaderboard
+import student_network.helpers.helper_messages as helper_messages
+import student_network.helpers.helper_navbar as helper_navbar
 import student_network.helpers.helper_profile as helper_profile
 from flask import session
 
@@ -43,72 +48,43 @@ def display_short_notification_age(seconds):
     return "Just Now"
 
 
-def get_all_connections(username: str) -> list:
+def format_ages(timestamps, now: float = None) -> list:
     """
-    Gets a list of all usernames that are connected to the logged in user.
+    Gets how long ago each of a batch of times was, reading the clock once
+    for the whole batch.
+
+    Args:
+        timestamps: Unix timestamps, in seconds.
+        now: The time to measure ages from, defaulting to the current time.
 
     Returns:
-        A list of all usernames that are connected to the logged in user.
+        The short age of each timestamp, such as "5m", in the same order.
     """
-    with sqlite3.connect("db.sqlite3") as conn:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT user2 FROM Connection "
-            "WHERE user1=? AND connection_type='connected' UNION ALL "
-            "SELECT user1 FROM Connection "
-            "WHERE user2=? AND connection_type='connected'",
-            (username, username),
-        )
-        connections = cur.fetchall()
-
-        return connections
+    now = time.time() if now is None else now
+    return [display_short_notification_age(now - x) for x in timestamps]
 
 
-def get_all_usernames() -> list:
+def format_dates(timestamps) -> list:
     """
-    Gets a list of all usernames that are registered.
+    Gets the day each of a batch of times fell on, as shown on posts.
+
+    Args:
+        timestamps: Unix timestamps, in seconds.
 
     Returns:
-        A list of all usernames that have been registered.
+        The UTC date of each timestamp, such as "21-05-21", in the same order.
     """
-    with sqlite3.connect("db.sqlite3") as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT username FROM Accounts")
-
-        row = cur.fetchall()
-
-        return row
+    return [time.strftime("%d-%m-%y", time.gmtime(x)) for x in timestamps]
 
 
-def get_notifications():
-    with sqlite3.connect("db.sqlite3") as conn:
-        cur = conn.cursor()
-
-        cur.execute(
-            "SELECT body, date, url FROM notification WHERE username=? ORDER "
-            "BY date DESC",
-            (session["username"],),
-        )
-
-        row = cur.fetchall()
-
-        notification_metadata = list(
-            map(
-                lambda x: (
-                    x[0],
-                    display_short_notification_age(
-                        (
-                            datetime.now()
-                            - datetime.strptime(x[1], "%Y-%m-%d " "%H:%M:%S")
-                        ).total_seconds()
-                    ),
-                    x[2],
-                ),
-                row,
-            )
-        )
+def get_all_connections(username: str) -> list:
+    """
+    Gets a list of all usernames that are connected to the logged in user.
 
-        return notification_metadata
+    Returns:
+        A list of all usernames that are connected to the logged in user.
+    """
+    return [(x,) for x in sorted(helper_graph.get_graph().get_connections(username))]
 
 
 def check_level_exists(username: str, conn):
@@ -126,95 +102,80 @@ def check_level_exists(username: str, conn):
             "INSERT INTO UserLevel (username, experience) VALUES (?, ?);", (username, 0)
         )
         conn.commit()
+        helper_leaderboard.get_leaderboard().set_experience(username, 0)
 
 
-def get_messages(username: str):
+def get_rooms():
     """
-    Get messages between logged in user and each user with chats
+    Get chat rooms for user, with the latest message of each conversation
+    read from the Conversation table
 
-    Args:
-        username: user to get messages of
+    Returns:
+        chat rooms of user, each the other user's username, profile picture,
+        latest message, time since it was sent and unread message count
     """
-    with sqlite3.connect("db.sqlite3") as conn:
-        cur = conn.cursor()
-
-        cur.execute(
-            "SELECT message, sender, date FROM PrivateMessages WHERE (sender=? AND receiver=?) ",
-            (session["username"], username),
-        )
-        row = cur.fetchall()
-
-        cur.execute(
-            "SELECT message, sender, date FROM PrivateMessages WHERE (sender=? AND receiver=?) ",
-            (username, session["username"]),
-        )
-        row += cur.fetchall()
-
-        if row == []:
-            return [[""], "", ""]
+    chat_rooms = get_all_connections(session["username"])
+    helper_profile.get_users(x[0] for x in chat_rooms)
+    conversations = helper_messages.get_conversations(session["username"])
 
-        row.sort(key=lambda x: x[2], reverse=True)
+    actives, inactives = [], []
+    for (username,) in chat_rooms:
+        picture = helper_profile.get_profile_picture(username)
+        if username in conversations:
+            message, _, timestamp, unread = conversations[username]
+            actives.append((username, picture, message, timestamp, unread))
+        else:
+            inactives.append((username, picture, "", "", 0))
+    actives.sort(key=lambda x: x[3], reverse=True)
+    ages = format_ages(x[3] for x in actives)
 
-        return [row, "", ""]
+    return [
+        (username, picture, message, age, unread)
+        for (username, picture, message, _, unread), age in zip(actives, ages)
+    ] + inactives
 
 
-def recent_message(date: str) -> Tuple[str, int]:
+def add_experience(cur, experience: dict) -> list:
     """
-    Get time since the most recent message
+    Adds experience points to users in the caller's transaction, creating
+    their level records if needed, and stores the new level of any user who
+    passed the threshold for the next one.
 
     Args:
-        date: datetime of message
+        cur: Cursor for the SQLite database.
+        experience: The experience points to add for each username.
 
     Returns:
-        [type]: [description]
+        The username and new experience points of each user.
     """
-    seconds = (
-        datetime.now() - datetime.strptime(date, "%Y-%m-%d " "%H:%M:%S")
-    ).total_seconds()
-    elapsed = display_short_notification_age(seconds)
-
-    return (elapsed, seconds)
-
-
-def get_rooms():
-    """
-    Get chat rooms for user
-
-    Returns:
-        chat rooms of user
-    """
-    chat_rooms = get_all_connections(session["username"])
-    chat_rooms = list(
-        map(lambda x: (x[0], helper_profile.get_profile_picture(x[0])), chat_rooms)
+    cur.execute(
+        "INSERT INTO UserLevel (username, experience) "
+        "SELECT key, value FROM json_each(?) WHERE true "
+        "ON CONFLICT (username) "
+        "DO UPDATE SET experience = experience + excluded.experience "
+        "RETURNING username, experience, next_level_experience;",
+        (json.dumps(experience),),
     )
-
-    chat_rooms = [list(x) for x in chat_rooms]
-
-    for i, room in enumerate(chat_rooms):
-        message = get_messages(room[0])
-        if message[0][0] != "":
-            message[1], message[2] = recent_message(message[0][0][2])
-        chat_rooms[i].append(message)
-
-    actives = [x for x in chat_rooms if x[2][2] != ""]
-    inactives = [x for x in chat_rooms if x[2][2] == ""]
-    actives.sort(key=lambda x: x[2][2])
-    chat_rooms = actives + inactives
-
-    return chat_rooms
+    rows = cur.fetchall()
+    levels = [
+        (x[0], helper_profile.calculate_level(x[1])[0]) for x in rows if x[1] >= x[2]
+    ]
+    cur.executemany(
+        "UPDATE UserLevel SET level=?, next_level_experience=? WHERE username=?;",
+        ((x[1], helper_profile.get_level_threshold(x[1] + 1), x[0]) for x in levels),
+    )
+    return [x[:2] for x in rows]
 
 
 def one_exp(cur, username: str):
     """
-    Awards 1 exp point
+    Awards 1 exp point. The caller must refresh the user's leaderboard rank
+    once it commits.
 
     Args:
         username: user to award exp to
     """
-    cur.execute(
-        "UPDATE UserLevel SET experience = experience + 1 WHERE username=?;",
-        (username,),
-    )
+    add_experience(cur, {username: 1})
 
 
 def get_exp(username: str):
@@ -225,43 +186,55 @@ def get_exp(username: str):
         username: user to find exp value of
 
     Returns:
-        exp of user
+        exp of user, or 0 if they have no level record yet
     """
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
-        check_level_exists(username, conn)
-        # Get user experience
         cur.execute("SELECT experience FROM UserLevel WHERE username=?;", (username,))
         row = cur.fetchone()
 
-        return int(row[0])
+        return int(row[0]) if row else 0
 
 
 def new_notification(body, url):
     now = datetime.now()
 
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
 
         cur.execute(
-            "INSERT INTO notification (username, body, date, url) VALUES (?, "
-            "?, ?, ?);",
-            (session["username"], body, now.strftime("%Y-%m-%d %H:%M:%S"), url),
+            "INSERT INTO notification (username, body, date, timestamp, url) "
+            "VALUES (?, ?, ?, ?, ?);",
+            (
+                session["username"],
+                body,
+                now.strftime("%Y-%m-%d %H:%M:%S"),
+                int(now.timestamp()),
+                url,
+            ),
         )
 
         conn.commit()
+    helper_navbar.invalidate_badges(session["username"])
 
 
 def new_notification_username(username, body, url):
     now = datetime.now()
 
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
 
         cur.execute(
-            "INSERT INTO notification (username, body, date, url) VALUES (?, "
-            "?, ?, ?);",
-            (username, body, now.strftime("%Y-%m-%d %H:%M:%S"), url),
+            "INSERT INTO notification (username, body, date, timestamp, url) "
+            "VALUES (?, ?, ?, ?, ?);",
+            (
+                username,
+                body,
+                now.strftime("%Y-%m-%d %H:%M:%S"),
+                int(now.timestamp()),
+                url,
+            ),
         )
 
         conn.commit()
+    helper_navbar.invalidate_badges(username)
@@ -0,0 +1,357 @@
+"""
+Keeps an in-process index of the social graph, so relationship checks and
+connection lists are answered from memory instead of the Connection and
+CloseFriend tables.
+
+Triggers log every pair of users whose edges change in the GraphChange
+table. Each process reads the log once per request and re-reads those pairs,
+so changes made by other workers are seen before access is checked.
+"""
+import json
+import threading
+from collections import defaultdict
+
+import student_network.helpers.helper_database as helper_database
+
+CONNECTED = "connected"
+REQUEST = "request"
+BLOCK = "block"
+CLOSE = "close"
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+
+class SocialGraph:
+    """
+    Adjacency sets for each kind of edge between users, holding interned
+    integer IDs rather than usernames.
+
+    Connections are stored in both directions. Requests, blocks and close
+    friendships are directed from user1 to user2, as in the database, with
+    a reverse index for looking them up by user2.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._names = []
+        self._outgoing = {kind: defaultdict(set) for kind in (REQUEST, BLOCK, CLOSE)}
+        self._incoming = {kind: defaultdict(set) for kind in (REQUEST, BLOCK, CLOSE)}
+        # Connections are undirected, so adding or removing one edge updates
+        # both directions.
+        self._outgoing[CONNECTED] = self._incoming[CONNECTED] = defaultdict(set)
+        self._lock = threading.RLock()
+        # The last change in the GraphChange log the index includes.
+        self.seq = 0
+
+    @classmethod
+    def load(cls, conn) -> "SocialGraph":
+        """
+        Builds the index from the database.
+
+        Args:
+            conn: Connection to the database.
+
+        Returns:
+            The index of every connection and close friendship.
+        """
+        graph = cls()
+        # The log position is read before the edges, so any change made in
+        # between is applied again by the next sync, which is harmless.
+        # Edges written by a transaction which hasn't committed yet may be
+        # rolled back, so the index is then loaded again next time.
+        graph.seq = helper_database.get_last_change(conn, "GraphChange")
+        if conn.in_transaction:
+            graph.seq = -1
+        edges = conn.execute(
+            "SELECT user1, user2, connection_type FROM Connection UNION ALL "
+            "SELECT user1, user2, ? FROM CloseFriend;",
+            (CLOSE,),
+        )
+        intern = graph._intern
+        for user1, user2, kind in edges:
+            user1_id, user2_id = intern(user1), intern(user2)
+            graph._outgoing[kind][user1_id].add(user2_id)
+            graph._incoming[kind][user2_id].add(user1_id)
+        return graph
+
+    def sync(self, conn) -> bool:
+        """
+        Applies the changes logged since the index was last brought up to
+        date, re-reading the edges between each pair of users changed.
+
+        Args:
+            conn: Connection to the database.
+
+        Returns:
+            Whether the index is up to date, or False if the log no longer
+            goes back far enough and the index must be loaded again.
+        """
+        changes = helper_database.get_changes(conn, "GraphChange", self.seq)
+        if changes is None:
+            return False
+        if not changes:
+            return True
+
+        pairs = set()
+        for _, user1, user2 in changes:
+            pairs.update(((user1, user2), (user2, user1)))
+        edges = conn.execute(
+            "WITH Pairs AS (SELECT json_extract(value, '$[0]') AS user1, "
+            "json_extract(value, '$[1]') AS user2 FROM json_each(?)) "
+            "SELECT Connection.user1, Connection.user2, connection_type "
+            "FROM Pairs CROSS JOIN Connection ON Connection.user1=Pairs.user1 "
+            "AND Connection.user2=Pairs.user2 UNION ALL "
+            "SELECT CloseFriend.user1, CloseFriend.user2, ? "
+            "FROM Pairs CROSS JOIN CloseFriend ON CloseFriend.user1=Pairs.user1 "
+            "AND CloseFriend.user2=Pairs.user2;",
+            (json.dumps(sorted(pairs)), CLOSE),
+        ).fetchall()
+        with self._lock:
+            # Another request may have applied these changes, or later ones,
+            # while they were being read.
+            if changes[-1][0] <= self.seq:
+                return True
+            for user1, user2 in pairs:
+                self.remove_connection(user1, user2)
+                self.remove_close_friend(user1, user2)
+            for user1, user2, kind in edges:
+                self._add_edge(kind, user1, user2)
+            # Changes which haven't committed yet are read again next time,
+            # in case they are rolled back.
+            if not conn.in_transaction:
+                self.seq = changes[-1][0]
+        return True
+
+    def _intern(self, username: str) -> int:
+        """
+        Gets the ID of a user, assigning the next one if they have none.
+        """
+        user_id = self._ids.get(username)
+        if user_id is None:
+            user_id = self._ids[username] = len(self._names)
+            self._names.append(username)
+        return user_id
+
+    def _neighbours(self, edges: dict, username: str) -> set:
+        """
+        Gets the usernames of a user's neighbours along one kind of edge.
+        """
+        with self._lock:
+            user_id = self._ids.get(username)
+            if user_id is None or user_id not in edges:
+                return set()
+            return {self._names[x] for x in edges[user_id]}
+
+    def _has_edge(self, kind: str, user1: str, user2: str) -> bool:
+        """
+        Checks whether there is an edge of one kind from user1 to user2.
+        """
+        with self._lock:
+            user1_id, user2_id = self._ids.get(user1), self._ids.get(user2)
+            edges = self._outgoing[kind].get(user1_id)
+            return edges is not None and user2_id in edges
+
+    def _add_edge(self, kind: str, user1: str, user2: str):
+        """
+        Adds an edge of one kind from user1 to user2.
+        """
+        with self._lock:
+            user1_id, user2_id = self._intern(user1), self._intern(user2)
+            self._outgoing[kind][user1_id].add(user2_id)
+            self._incoming[kind][user2_id].add(user1_id)
+
+    def _remove_edge(self, kind: str, user1: str, user2: str):
+        """
+        Removes an edge of one kind from user1 to user2, if there is one.
+        """
+        with self._lock:
+            user1_id, user2_id = self._ids.get(user1), self._ids.get(user2)
+            self._outgoing[kind].get(user1_id, set()).discard(user2_id)
+            self._incoming[kind].get(user2_id, set()).discard(user1_id)
+
+    def add_connection(self, user1: str, user2: str, connection_type: str):
+        """
+        Records a row added to the Connection table.
+
+        Args:
+            user1: The user who made the connection, request or block.
+            user2: The other user.
+            connection_type: Either connected, request or block.
+        """
+        self._add_edge(connection_type, user1, user2)
+
+    def remove_connection(self, user1: str, user2: str):
+        """
+        Records a row of any type removed from the Connection table.
+
+        Args:
+            user1: The user who made the connection, request or block.
+            user2: The other user.
+        """
+        for kind in (CONNECTED, REQUEST, BLOCK):
+            self._remove_edge(kind, user1, user2)
+
+    def accept_request(self, user1: str, user2: str):
+        """
+        Records the rows between two users being changed to connected, as
+        when a request is accepted.
+
+        Args:
+            user1: One of the users.
+            user2: The other user.
+        """
+        with self._lock:
+            self.remove_connection(user1, user2)
+            self.remove_connection(user2, user1)
+            self._add_edge(CONNECTED, user1, user2)
+
+    def add_close_friend(self, user1: str, user2: str):
+        """
+        Records user1 adding user2 as a close friend.
+
+        Args:
+            user1: The user adding the close friend.
+            user2: The close friend.
+        """
+        self._add_edge(CLOSE, user1, user2)
+
+    def remove_close_friend(self, user1: str, user2: str):
+        """
+        Records user1 removing user2 as a close friend.
+
+        Args:
+            user1: The user removing the close friend.
+            user2: The close friend.
+        """
+        self._remove_edge(CLOSE, user1, user2)
+
+    def get_connections(self, username: str) -> set:
+        """
+        Gets the users connected to a user.
+
+        Args:
+            username: The user to get the connections of.
+
+        Returns:
+            The usernames of the user's connections.
+        """
+        return self._neighbours(self._outgoing[CONNECTED], username)
+
+    def get_mutual_connections(self, user1: str, user2: str) -> set:
+        """
+        Gets the users connected to both of two users.
+
+        Args:
+            user1: One of the users.
+            user2: The other user.
+
+        Returns:
+            The usernames of their mutual connections.
+        """
+        with self._lock:
+            edges = self._outgoing[CONNECTED]
+            user1_id, user2_id = self._ids.get(user1), self._ids.get(user2)
+            if user1_id not in edges or user2_id not in edges:
+                return set()
+            return {self._names[x] for x in edges[user1_id] & edges[user2_id]}
+
+    def get_requests(self, username: str) -> set:
+        """
+        Gets the users a user has sent a connection request to.
+
+        Args:
+            username: The user who sent the requests.
+
+        Returns:
+            The usernames the requests were sent to.
+        """
+        return self._neighbours(self._outgoing[REQUEST], username)
+
+    def get_incoming_requests(self, username: str) -> set:
+        """
+        Gets the users who have sent a connection request to a user.
+
+        Args:
+            username: The user the requests were sent to.
+
+        Returns:
+            The usernames who sent the requests.
+        """
+        return self._neighbours(self._incoming[REQUEST], username)
+
+    def get_blocked(self, username: str) -> set:
+        """
+        Gets the users a user has blocked.
+
+        Args:
+            username: The user who blocked them.
+
+        Returns:
+            The usernames of the blocked users.
+        """
+        return self._neighbours(self._outgoing[BLOCK], username)
+
+    def get_close_friends(self, username: str) -> set:
+        """
+        Gets the users a user has as close friends.
+
+        Args:
+            username: The user to get the close friends of.
+
+        Returns:
+            The usernames of the user's close friends.
+        """
+        return self._neighbours(self._outgoing[CLOSE], username)
+
+    def is_close_friend(self, user1: str, user2: str) -> bool:
+        """
+        Checks whether user1 has user2 as a close friend.
+
+        Args:
+            user1: The user who may have the close friend.
+            user2: The possible close friend.
+
+        Returns:
+            Whether user2 is a close friend of user1 (True/False).
+        """
+        return self._has_edge(CLOSE, user1, user2)
+
+    def get_connection_type(self, user1: str, user2: str):
+        """
+        Checks what type of connection user1 has with user2.
+
+        Args:
+            user1: The user checking.
+            user2: The user to check the connection type with.
+
+        Returns:
+            connected, request or block for rows made by user1, connected,
+            blocked or incoming for rows made by user2, or None if there is
+            no connection.
+        """
+        with self._lock:
+            if self._has_edge(CONNECTED, user1, user2):
+                return CONNECTED
+            if self._has_edge(REQUEST, user1, user2):
+                return REQUEST
+            if self._has_edge(BLOCK, user1, user2):
+                return BLOCK
+            if self._has_edge(BLOCK, user2, user1):
+                return "blocked"
+            if self._has_edge(REQUEST, user2, user1):
+                return "incoming"
+            return None
+
+
+def get_graph(path: str = None) -> SocialGraph:
+    """
+    Gets the social graph index for the database, loading it on first use
+    and applying changes made by other processes once per request.
+
+    Args:
+        path: The database file, defaulting to the app's DATABASE setting.
+
+    Returns:
+        The social graph index for the database.
+    """
+    return helper_database.get_index(_graphs, _graphs_lock, SocialGraph, path)
@@ -0,0 +1,530 @@
+"""
+Resizes and encodes uploaded images in a pool of worker processes, so an
+upload only has to store the original before the request returns.
+
+Each upload is given an ID straight away and its resized image appears in
+the static images folder under that ID once a worker has finished it, when
+the original is deleted. Only
+IMAGE_QUEUE_LIMIT images can be waiting at once, after which uploads are
+turned away until the workers catch up. Setting IMAGE_PIPELINE to "inline"
+processes images in the request instead, as before.
+
+Smaller copies of every image are made in WebP and JPEG, so pages can
+download one sized for where the image is shown. Images from before the
+copies existed get theirs made the first time they are asked for.
+"""
+import atexit
+import multiprocessing
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from PIL import Image
+
+# The folders each kind of image is saved in.
+KINDS = ("post_imgs", "avatars")
+ORIGINALS_FOLDER = "originals"
+DERIVATIVES_FOLDER = "derivatives"
+# The widths smaller copies of each image are made at, and their formats by
+# file extension, WebP first as it is preferred.
+DERIVATIVE_WIDTHS = (48, 96, 200, 400, 800)
+DERIVATIVE_FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+# The width avatars are shown at across the site, for screens with twice as
+# many pixels as the page size.
+AVATAR_WIDTH = 96
+UPLOADED_IMAGE_URL = re.compile(r"/static/images/(post_imgs|avatars)/([\w-]+)\.jpg")
+# The number of failed uploads remembered for the status endpoint.
+MAX_FAILURES = 1000
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+class QueueFull(Exception):
+    """
+    Raised when too many images are waiting to be processed.
+    """
+
+
+def resize_image(img: Image.Image, kind: str) -> Image.Image:
+    """
+    Resizes an image for where it is shown on the website.
+
+    Args:
+        img: The uploaded image.
+        kind: The folder the image is for, "post_imgs" or "avatars".
+
+    Returns:
+        The resized image in RGB.
+    """
+    if kind == "avatars":
+        img = img.resize((400, 400))
+    else:
+        fixed_height = 600
+        height_percent = fixed_height / float(img.size[1])
+        width_size = int((float(img.size[0]) * float(height_percent)))
+        width_size = min(width_size, 800)
+        img = img.resize((width_size, fixed_height))
+    return img.convert("RGB")
+
+
+def save_image(img: Image.Image, path: str, image_format: str):
+    """
+    Saves an image through a temporary file which is then renamed, so it
+    never appears half written, even to another process saving it too.
+
+    Args:
+        img: The image to save.
+        path: Where to save it.
+        image_format: The format to encode it in, such as "JPEG".
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = "{}.{}.part".format(path, uuid.uuid4().hex)
+    img.save(partial, format=image_format)
+    os.replace(partial, path)
+
+
+def make_derivative(img: Image.Image, width: int) -> Image.Image:
+    """
+    Scales an image down to a width, keeping its shape.
+
+    Args:
+        img: The resized upload.
+        width: The width wanted, which is capped at the image's own.
+
+    Returns:
+        The scaled image.
+    """
+    width = min(width, img.width)
+    height = max(round(img.height * width / img.width), 1)
+    return img.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def process_image(directory: str, kind: str, image_id: str):
+    """
+    Resizes an original and saves it as a JPEG along with every derivative.
+    This runs in the worker processes, so it only takes arguments which can
+    be pickled.
+
+    The resized image is saved last, so once it exists the upload is done.
+    The original is deleted whether or not it could be resized, as it sits
+    in the public folder with the photo's metadata, such as its location.
+
+    Args:
+        directory: The static images folder.
+        kind: The folder the image is for, "post_imgs" or "avatars".
+        image_id: The ID the upload was given.
+    """
+    source = get_original_path(directory, image_id)
+    try:
+        with Image.open(source) as img:
+            resized = resize_image(img, kind)
+        for width in DERIVATIVE_WIDTHS:
+            derivative = make_derivative(resized, width)
+            for extension, image_format in DERIVATIVE_FORMATS.items():
+                save_image(
+                    derivative,
+                    get_derivative_path(directory, kind, image_id, width, extension),
+                    image_format,
+                )
+        save_image(resized, get_image_path(directory, kind, image_id), "JPEG")
+    finally:
+        delete_original(directory, image_id)
+
+
+def get_original_path(directory: str, image_id: str) -> str:
+    """
+    Gets where an upload is stored as it was sent.
+
+    Args:
+        directory: The static images folder.
+        image_id: The ID the upload was given.
+
+    Returns:
+        The path of the original.
+    """
+    return os.path.join(directory, ORIGINALS_FOLDER, image_id)
+
+
+def check_path(directory: str, path: str) -> str:
+    """
+    Checks that a path is inside the static images folder before a file is
+    deleted there.
+
+    Args:
+        directory: The static images folder.
+        path: The path of the file.
+
+    Returns:
+        The path, unchanged.
+
+    Raises:
+        ValueError: If the path leads outside the folder.
+    """
+    directory = os.path.realpath(directory)
+    if os.path.commonpath([directory, os.path.realpath(path)]) != directory:
+        raise ValueError("The path is outside the images folder.")
+    return path
+
+
+def delete_original(directory: str, image_id: str):
+    """
+    Deletes an upload as it was sent, if it is still stored.
+
+    Args:
+        directory: The static images folder.
+        image_id: The ID the upload was given.
+
+    Raises:
+        ValueError: If the ID leads outside the folder.
+    """
+    try:
+        os.remove(check_path(directory, get_original_path(directory, image_id)))
+    except FileNotFoundError:
+        pass
+
+
+def get_image_path(directory: str, kind: str, image_id: str) -> str:
+    """
+    Gets where the resized copy of an upload is saved.
+
+    Args:
+        directory: The static images folder.
+        kind: The folder the image is for.
+        image_id: The ID the upload was given.
+
+    Returns:
+        The path of the resized image.
+    """
+    return os.path.join(directory, kind, image_id + ".jpg")
+
+
+def get_derivative_path(
+    directory: str, kind: str, image_id: str, width: int, extension: str
+) -> str:
+    """
+    Gets where a smaller copy of an upload is cached.
+
+    Args:
+        directory: The static images folder.
+        kind: The folder the image is for.
+        image_id: The ID the upload was given.
+        width: The width of the copy.
+        extension: The format of the copy, "webp" or "jpg".
+
+    Returns:
+        The path of the copy.
+    """
+    return os.path.join(
+        directory,
+        DERIVATIVES_FOLDER,
+        kind,
+        "{}-{}.{}".format(image_id, width, extension),
+    )
+
+
+def get_derivative(
+    directory: str, kind: str, image_id: str, width: int, extension: str
+):
+    """
+    Gets a smaller copy of an image, making it from the resized image the
+    first time it is asked for. This covers images uploaded before copies
+    were made, and uploads whose copies aren't finished yet.
+
+    Args:
+        directory: The static images folder.
+        kind: The folder the image is for.
+        image_id: The ID the upload was given.
+        width: One of DERIVATIVE_WIDTHS.
+        extension: One of the DERIVATIVE_FORMATS.
+
+    Returns:
+        The path of the copy, or None if there is no such image.
+    """
+    path = get_derivative_path(directory, kind, image_id, width, extension)
+    if os.path.exists(path):
+        return path
+    source = get_image_path(directory, kind, image_id)
+    if not os.path.exists(source):
+        return None
+    with Image.open(source) as img:
+        # Lets the JPEG decoder scale down by up to 8 times as it reads,
+        # which is far quicker than decoding every pixel for a thumbnail.
+        img.draft("RGB", (width, width))
+        save_image(
+            make_derivative(img.convert("RGB"), width),
+            path,
+            DERIVATIVE_FORMATS[extension],
+        )
+    return path
+
+
+def delete_derivatives(directory: str, kind: str, image_id: str):
+    """
+    Deletes every cached copy of an image once the image is deleted.
+
+    Args:
+        directory: The static images folder.
+        kind: The folder the image is for.
+        image_id: The ID the upload was given.
+
+    Raises:
+        ValueError: If the ID leads outside the folder.
+    """
+    for width in DERIVATIVE_WIDTHS:
+        for extension in DERIVATIVE_FORMATS:
+            path = get_derivative_path(directory, kind, image_id, width, extension)
+            if os.path.exists(check_path(directory, path)):
+                os.remove(path)
+
+
+def pick_width(width: int) -> int:
+    """
+    Picks the smallest derivative at least as wide as an image is shown.
+
+    Args:
+        width: The width the image is shown at, in device pixels.
+
+    Returns:
+        The width of the derivative to use.
+    """
+    return next((x for x in DERIVATIVE_WIDTHS if x >= width), DERIVATIVE_WIDTHS[-1])
+
+
+def image_url(url: str, width: int) -> str:
+    """
+    Gets the URL of a copy of an uploaded image sized for where it is shown.
+    The copy is WebP for browsers which accept it and JPEG otherwise.
+
+    Args:
+        url: The URL of the image, such as a profile picture.
+        width: The width the image is shown at, in device pixels.
+
+    Returns:
+        The URL of the copy, or the URL unchanged if it isn't an upload.
+    """
+    match = UPLOADED_IMAGE_URL.fullmatch(url or "")
+    if match is None:
+        return url
+    return "/images/{}/{}/{}".format(match[1], match[2], pick_width(width))
+
+
+def post_image_url(image_id: str, width: int) -> str:
+    """
+    Gets the URL of a copy of a post's image sized for where it is shown.
+
+    Args:
+        image_id: The ID the image was given when uploaded.
+        width: The width the image is shown at, in device pixels.
+
+    Returns:
+        The URL of the copy.
+    """
+    return "/images/post_imgs/{}/{}".format(image_id, pick_width(width))
+
+
+class ImagePipeline:
+    """
+    Hands uploaded images to a process pool and tracks the ones in progress.
+    """
+
+    def __init__(self, workers: int = None, limit: int = 64):
+        """
+        Args:
+            workers: The number of worker processes, defaulting to one per
+                core.
+            limit: The maximum number of images waiting to be processed.
+        """
+        self.limit = limit
+        self._pending = {}
+        self._failed = OrderedDict()
+        self._lock = threading.Lock()
+        # Worker processes are spawned rather than forked, as forking while
+        # other threads hold locks can leave the child deadlocked.
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def submit(self, file, directory: str, kind: str, inline: bool = False) -> str:
+        """
+        Stores an uploaded image and queues it to be resized.
+
+        Args:
+            file: The file uploaded by the user.
+            directory: The static images folder.
+            kind: The folder the image is for.
+            inline: Whether to resize the image before returning.
+
+        Returns:
+            The ID of the image, which is its file name once resized.
+
+        Raises:
+            QueueFull: If too many images are already waiting.
+            ValueError: If the file is not an image.
+        """
+        image_id = str(uuid.uuid4())
+        source = get_original_path(directory, image_id)
+        with self._lock:
+            if len(self._pending) >= self.limit:
+                raise QueueFull("Too many images are being processed.")
+            self._pending[image_id] = kind
+
+        try:
+            os.makedirs(os.path.dirname(source), exist_ok=True)
+            file.save(source)
+            # Opening only reads the header, so this rejects files which
+            # aren't images without decoding them.
+            with Image.open(source):
+                pass
+        except Exception as error:
+            self._finish(image_id)
+            delete_original(directory, image_id)
+            raise ValueError("The file is not an image.") from error
+
+        if inline:
+            try:
+                process_image(directory, kind, image_id)
+            finally:
+                self._finish(image_id)
+        else:
+            future = self._executor.submit(process_image, directory, kind, image_id)
+            future.add_done_callback(
+                lambda x: self._finish(image_id, x.exception() is not None)
+            )
+        return image_id
+
+    def _finish(self, image_id: str, failed: bool = False):
+        with self._lock:
+            self._pending.pop(image_id, None)
+            if failed:
+                self._failed[image_id] = True
+                if len(self._failed) > MAX_FAILURES:
+                    self._failed.popitem(last=False)
+
+    def get_status(self, directory: str, image_id: str):
+        """
+        Gets how far along an upload is.
+
+        Args:
+            directory: The static images folder.
+            image_id: The ID the upload was given.
+
+        Returns:
+            "pending", "done" or "failed", or None if there is no such
+            upload.
+        """
+        with self._lock:
+            if image_id in self._pending:
+                return "pending"
+            if image_id in self._failed:
+                return "failed"
+        # Uploads accepted by another worker process are found on disk, where
+        # the original is kept only until it has been resized.
+        for kind in KINDS:
+            if os.path.exists(get_image_path(directory, kind, image_id)):
+                return "done"
+        if os.path.exists(get_original_path(directory, image_id)):
+            return "pending"
+        return None
+
+    def pending_count(self) -> int:
+        """
+        Gets the number of images waiting to be processed.
+
+        Returns:
+            The number of queued and running images.
+        """
+        with self._lock:
+            return len(self._pending)
+
+    def close(self):
+        """
+        Waits for queued images to finish and stops the workers.
+        """
+        self._executor.shutdown(wait=True)
+
+
+def get_pipeline() -> ImagePipeline:
+    """
+    Gets the pipeline for this process, starting it on first use.
+
+    Returns:
+        The image pipeline.
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = ImagePipeline(
+                current_app.config["IMAGE_WORKERS"],
+                current_app.config["IMAGE_QUEUE_LIMIT"],
+            )
+        return _pipeline
+
+
+def submit(file, kind: str) -> str:
+    """
+    Stores an uploaded image and resizes it in the background, or straight
+    away depending on the IMAGE_PIPELINE setting.
+
+    Args:
+        file: The file uploaded by the user.
+        kind: The folder the image is for, "post_imgs" or "avatars".
+
+    Returns:
+        The ID of the image, which is its file name once resized.
+
+    Raises:
+        QueueFull: If too many images are already waiting.
+        ValueError: If the file is not an image.
+    """
+    return get_pipeline().submit(
+        file,
+        current_app.config["IMAGE_DIRECTORY"],
+        kind,
+        inline=current_app.config["IMAGE_PIPELINE"] == "inline",
+    )
+
+
+def get_status(image_id: str):
+    """
+    Gets how far along an upload is.
+
+    Args:
+        image_id: The ID the upload was given.
+
+    Returns:
+        "pending", "done" or "failed", or None if there is no such upload.
+    """
+    return get_pipeline().get_status(current_app.config["IMAGE_DIRECTORY"], image_id)
+
+
+def close_pipeline():
+    """
+    Finishes queued images before the process exits.
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is not None:
+            _pipeline.close()
+            _pipeline = None
+
+
+def init_app(app):
+    """
+    Sets the pipeline defaults, lets templates size images and finishes
+    queued images on shutdown.
+
+    Args:
+        app: The Flask application.
+    """
+    app.config.setdefault("IMAGE_PIPELINE", "process")
+    app.config.setdefault("IMAGE_DIRECTORY", "./static/images")
+    app.config.setdefault("IMAGE_WORKERS", None)
+    app.config.setdefault("IMAGE_QUEUE_LIMIT", 64)
+    app.add_template_global(image_url)
+    app.add_template_global(post_image_url)
+    atexit.register(close_pipeline)
@@ -0,0 +1,218 @@
+"""
+Ranks users by experience using an in-process sorted index, so the
+leaderboard can find any user's rank or page of rankings without reading
+the whole UserLevel table.
+
+Triggers log every user whose experience changes in the LevelChange table.
+Each process reads the log once per request and re-reads those users, so
+experience gained through other workers is ranked too.
+"""
+import json
+import threading
+from bisect import bisect_left, insort
+
+import student_network.helpers.helper_database as helper_database
+
+_leaderboards = {}
+_leaderboards_lock = threading.Lock()
+
+
+class Leaderboard:
+    """
+    Every user's experience, kept sorted from the most experience to the
+    least with ties broken by username.
+
+    Ranks are found by binary search in O(log n). Changing a user's
+    experience moves one entry, which costs a memory move rather than a
+    re-sort.
+    """
+
+    def __init__(self, rows: list):
+        self._experience = dict(rows)
+        # Rows already in rank order are sorted in linear time.
+        self._ranking = sorted((-x[1], x[0]) for x in rows)
+        self._lock = threading.RLock()
+        # The last change in the LevelChange log the index includes.
+        self.seq = 0
+
+    @classmethod
+    def load(cls, conn) -> "Leaderboard":
+        """
+        Builds the index from the database.
+
+        Args:
+            conn: Connection to the database.
+
+        Returns:
+            The ranking of every user with a level.
+        """
+        # The log position is read before the rows, so any change made in
+        # between is applied again by the next sync, which is harmless. Rows
+        # written by a transaction which hasn't committed yet may be rolled
+        # back, so the index is then loaded again next time.
+        seq = helper_database.get_last_change(conn, "LevelChange")
+        leaderboard = cls(
+            conn.execute(
+                "SELECT username, experience FROM UserLevel "
+                "ORDER BY experience DESC, username;"
+            ).fetchall()
+        )
+        leaderboard.seq = -1 if conn.in_transaction else seq
+        return leaderboard
+
+    def sync(self, conn) -> bool:
+        """
+        Applies the changes logged since the index was last brought up to
+        date, re-reading the experience of each user changed.
+
+        Args:
+            conn: Connection to the database.
+
+        Returns:
+            Whether the index is up to date, or False if the log no longer
+            goes back far enough and the index must be loaded again.
+        """
+        changes = helper_database.get_changes(conn, "LevelChange", self.seq)
+        if changes is None:
+            return False
+        if not changes:
+            return True
+
+        usernames = sorted({x[1] for x in changes})
+        experience = dict(
+            conn.execute(
+                "SELECT username, experience FROM UserLevel "
+                "WHERE username IN (SELECT value FROM json_each(?));",
+                (json.dumps(usernames),),
+            )
+        )
+        with self._lock:
+            # Another request may have applied these changes, or later ones,
+            # while they were being read.
+            if changes[-1][0] <= self.seq:
+                return True
+            for username in usernames:
+                if username in experience:
+                    self.set_experience(username, experience[username])
+                else:
+                    self.remove(username)
+            # Changes which haven't committed yet are read again next time,
+            # in case they are rolled back.
+            if not conn.in_transaction:
+                self.seq = changes[-1][0]
+        return True
+
+    def __len__(self) -> int:
+        return len(self._ranking)
+
+    def set_experience(self, username: str, experience: int):
+        """
+        Moves a user to the rank for their new experience.
+
+        Args:
+            username: The user whose experience changed.
+            experience: Their experience now.
+        """
+        with self._lock:
+            old = self._experience.get(username)
+            if old == experience:
+                return
+            if old is not None:
+                del self._ranking[bisect_left(self._ranking, (-old, username))]
+            insort(self._ranking, (-experience, username))
+            self._experience[username] = experience
+
+    def remove(self, username: str):
+        """
+        Takes a user whose level was deleted off the leaderboard.
+
+        Args:
+            username: The user to remove.
+        """
+        with self._lock:
+            old = self._experience.pop(username, None)
+            if old is not None:
+                del self._ranking[bisect_left(self._ranking, (-old, username))]
+
+    def get_rank(self, username: str):
+        """
+        Gets a user's position on the leaderboard.
+
+        Args:
+            username: The user to rank.
+
+        Returns:
+            The user's rank, starting from 1, or None if they have no level.
+        """
+        with self._lock:
+            experience = self._experience.get(username)
+            if experience is None:
+                return None
+            return bisect_left(self._ranking, (-experience, username)) + 1
+
+    def get_page(self, offset: int, limit: int) -> list:
+        """
+        Gets a slice of the leaderboard.
+
+        Args:
+            offset: The number of higher ranked users to skip.
+            limit: The maximum number of users to get.
+
+        Returns:
+            The rank, username and experience of each user on the page.
+        """
+        with self._lock:
+            page = self._ranking[offset : offset + limit]
+        return [(offset + i + 1, x[1], -x[0]) for i, x in enumerate(page)]
+
+    def get_neighbours(self, username: str, count: int) -> list:
+        """
+        Gets the users ranked just above and below a user.
+
+        Args:
+            username: The user in the middle.
+            count: The number of users to get either side.
+
+        Returns:
+            The rank, username and experience of the user and their
+            neighbours, or an empty list if the user has no level.
+        """
+        rank = self.get_rank(username)
+        if rank is None:
+            return []
+        offset = max(rank - 1 - count, 0)
+        return self.get_page(offset, rank + count - offset)
+
+
+def get_leaderboard(path: str = None) -> Leaderboard:
+    """
+    Gets the leaderboard for the database, loading it on first use and
+    applying changes made by other processes once per request.
+
+    Args:
+        path: The database file, defaulting to the app's DATABASE setting.
+
+    Returns:
+        The leaderboard for the database.
+    """
+    return helper_database.get_index(
+        _leaderboards, _leaderboards_lock, Leaderboard, path
+    )
+
+
+def refresh(cur, *usernames: str):
+    """
+    Re-reads the experience of users after a change to it is committed.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        usernames: The users whose experience changed.
+    """
+    leaderboard = get_leaderboard()
+    cur.execute(
+        "SELECT username, experience FROM UserLevel "
+        "WHERE username IN (SELECT value FROM json_each(?));",
+        (json.dumps(usernames),),
+    )
+    for username, experience in cur.fetchall():
+        leaderboard.set_experience(username, experience)
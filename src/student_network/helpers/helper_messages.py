@@ -0,0 +1,474 @@
+"""
+Saves private messages through a write-behind buffer, so chat handlers hand
+messages over in memory and a background writer stores them in batches with
+one commit per batch instead of one per message.
+
+Buffered messages are lost if the process is killed before the writer
+flushes them, at most one flush interval's worth. Setting
+MESSAGE_DURABILITY to "immediate" commits every message before it is
+delivered instead.
+"""
+import atexit
+import json
+import logging
+import threading
+from datetime import datetime
+
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_paging as helper_paging
+from flask import current_app, has_app_context
+
+FLUSH_SIZE = 100
+FLUSH_INTERVAL = 0.05
+# Failed flushes in a row before messages are written one at a time, and
+# those which still fail are set aside in FailedPrivateMessage.
+MAX_FLUSH_ATTEMPTS = 5
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+INSERT_MESSAGE = (
+    "INSERT INTO PrivateMessages (sender, receiver, message, date, timestamp) "
+    "VALUES (?, ?, ?, ?, ?);"
+)
+# Moves a message to the top of its conversation and counts it as unread by
+# the receiver.
+UPDATE_CONVERSATION = (
+    "INSERT INTO Conversation "
+    "(user1, user2, last_message, last_sender, last_date, last_timestamp, "
+    "unread1, unread2) "
+    "VALUES (:user1, :user2, :message, :sender, :date, :timestamp, "
+    ":receiver = :user1, :receiver = :user2) "
+    "ON CONFLICT (user1, user2) DO UPDATE SET "
+    "last_message=excluded.last_message, last_sender=excluded.last_sender, "
+    "last_date=excluded.last_date, last_timestamp=excluded.last_timestamp, "
+    "unread1=unread1 + excluded.unread1, unread2=unread2 + excluded.unread2;"
+)
+# Rebuilds the chat room list from every private message, keeping the latest
+# message of each conversation, with the last one inserted winning ties.
+# Read state isn't known for old messages, so nothing starts unread.
+CONVERSATION_BACKFILL = (
+    "DELETE FROM Conversation;",
+    "INSERT INTO Conversation "
+    "(user1, user2, last_message, last_sender, last_date, last_timestamp) "
+    "SELECT user1, user2, message, sender, date, timestamp FROM ("
+    "SELECT MIN(sender, receiver) AS user1, MAX(sender, receiver) AS user2, "
+    "message, sender, date, timestamp, ROW_NUMBER() OVER (PARTITION BY "
+    "MIN(sender, receiver), MAX(sender, receiver) "
+    "ORDER BY timestamp DESC, id DESC) AS position FROM PrivateMessages) "
+    "WHERE position=1;",
+)
+_writers = {}
+_writers_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+
+def write_messages(conn, rows: list):
+    """
+    Inserts messages and updates their conversations in the caller's
+    transaction, queueing the messages for offline receivers to be pushed
+    to them when they reconnect.
+
+    Args:
+        conn: Connection to the database.
+        rows: The sender, receiver, message, date and timestamp of each
+            message, and whether the receiver was offline, oldest first.
+    """
+    pending = []
+    for sender, receiver, message, date, timestamp, offline in rows:
+        message_id = conn.execute(
+            INSERT_MESSAGE, (sender, receiver, message, date, timestamp)
+        ).lastrowid
+        if offline:
+            pending.append((receiver, message_id))
+    conn.executemany(
+        "INSERT INTO PendingDelivery (username, messageId) VALUES (?, ?);", pending
+    )
+    conn.executemany(
+        UPDATE_CONVERSATION,
+        (
+            {
+                "user1": min(sender, receiver),
+                "user2": max(sender, receiver),
+                "sender": sender,
+                "receiver": receiver,
+                "message": message,
+                "date": date,
+                "timestamp": timestamp,
+            }
+            for sender, receiver, message, date, timestamp, _ in rows
+        ),
+    )
+
+
+class MessageWriter(threading.Thread):
+    """
+    A daemon thread which writes buffered messages to one database, flushing
+    once the buffer holds FLUSH_SIZE messages or FLUSH_INTERVAL seconds after
+    the last flush, whichever comes first.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(name="message-writer", daemon=True)
+        self.path = path
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        # Held for a whole flush, so batches are committed in order.
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._failures = 0
+
+    def add(self, row: tuple):
+        """
+        Buffers a message to be written by the next flush.
+
+        Args:
+            row: The sender, receiver, message, date and timestamp, and
+                whether the receiver was offline.
+        """
+        with self._pending_lock:
+            self._pending.append(row)
+            full = len(self._pending) >= FLUSH_SIZE
+        if self._closed:
+            self.flush()
+        elif full:
+            self._wake.set()
+
+    def _connect(self, conn=None):
+        """
+        Gets a context manager which commits a write on the given connection,
+        or on one borrowed from the pool if none is given.
+        """
+        if conn is None:
+            return helper_database.get_pool(self.path).connection()
+        return conn
+
+    def flush(self, conn=None) -> int:
+        """
+        Writes every buffered message in one transaction. If the write
+        fails, the messages are put back to be retried by the next flush,
+        until MAX_FLUSH_ATTEMPTS have failed in a row. They are then written
+        one at a time, so one bad message can't hold up the rest.
+
+        Args:
+            conn: A connection with no transaction open to write with, such
+                as the request's, or None to borrow one from the pool.
+
+        Returns:
+            The number of messages written.
+        """
+        with self._flush_lock:
+            with self._pending_lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            try:
+                with self._connect(conn) as write_conn:
+                    write_messages(write_conn, rows)
+            except Exception:
+                self._failures += 1
+                if self._failures < MAX_FLUSH_ATTEMPTS:
+                    with self._pending_lock:
+                        self._pending[:0] = rows
+                    raise
+                logger.exception("Failed to write private messages, retrying each.")
+                self._failures = 0
+                return self._write_each(rows, conn)
+            self._failures = 0
+            return len(rows)
+
+    def _write_each(self, rows: list, conn=None) -> int:
+        """
+        Writes messages in a transaction each, setting aside the ones which
+        fail in FailedPrivateMessage.
+
+        Returns:
+            The number of messages written.
+        """
+        written = 0
+        for row in rows:
+            try:
+                with self._connect(conn) as write_conn:
+                    write_messages(write_conn, [row])
+                written += 1
+            except Exception as error:
+                try:
+                    with self._connect(conn) as write_conn:
+                        write_conn.execute(
+                            "INSERT INTO FailedPrivateMessage (sender, receiver, "
+                            "message, date, timestamp, offline, error) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?);",
+                            (*row, repr(error)),
+                        )
+                except Exception:
+                    logger.exception(
+                        "Dropped a private message from %s to %s.", row[0], row[1]
+                    )
+        return written
+
+    def run(self):
+        while not self._closed:
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to write private messages.")
+
+    def close(self):
+        """
+        Stops the writer and flushes whatever is left in the buffer. Messages
+        added afterwards are written straight away.
+        """
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+
+def get_writer(path: str = None) -> MessageWriter:
+    """
+    Gets the message writer for the database, starting it on first use.
+
+    Args:
+        path: The database file, defaulting to the app's DATABASE setting.
+
+    Returns:
+        The running writer for the database.
+    """
+    if path is None:
+        path = helper_database.DEFAULT_DB_PATH
+        if has_app_context():
+            path = current_app.config.get("DATABASE", path)
+    with _writers_lock:
+        if path not in _writers:
+            _writers[path] = MessageWriter(path)
+            _writers[path].start()
+        return _writers[path]
+
+
+def save_message(sender: str, receiver: str, message: str, offline: bool = False):
+    """
+    Saves a private message, either buffering it or committing it now
+    depending on the MESSAGE_DURABILITY setting.
+
+    Args:
+        sender: The user who sent the message.
+        receiver: The user the message is for.
+        message: The text of the message.
+        offline: Whether the receiver isn't connected, so the message should
+            be pushed to them when they next connect.
+    """
+    now = datetime.now()
+    row = (
+        sender,
+        receiver,
+        message,
+        now.strftime("%Y-%m-%d %H:%M:%S"),
+        int(now.timestamp()),
+        offline,
+    )
+    if current_app.config["MESSAGE_DURABILITY"] == "immediate":
+        conn = helper_database.get_db()
+        write_messages(conn, [row])
+        conn.commit()
+    else:
+        get_writer().add(row)
+
+
+def flush():
+    """
+    Writes any buffered messages for the app's database, so that reading
+    messages straight after sending one finds it. A failed write is logged
+    rather than raised, so messages already stored can still be read.
+
+    The messages are written on the request's connection, so reading never
+    waits for a second connection from the pool. If the request has changes
+    of its own waiting to commit, the messages are left to the writer
+    thread, as writing them would wait behind those changes.
+    """
+    path = current_app.config.get("DATABASE", helper_database.DEFAULT_DB_PATH)
+    writer = _writers.get(path)
+    if writer is not None:
+        conn = helper_database.get_db()
+        if conn.in_transaction:
+            return
+        try:
+            writer.flush(conn)
+        except Exception:
+            logger.exception("Failed to write private messages before reading.")
+
+
+def get_conversations(username: str) -> dict:
+    """
+    Gets the latest message of each conversation a user has had, writing
+    any buffered messages first.
+
+    Args:
+        username: The user whose conversations to get.
+
+    Returns:
+        The latest message, its sender and timestamp, and the number of
+        unread messages, by the other user in each conversation.
+    """
+    flush()
+    conn = helper_database.get_db()
+    rows = conn.execute(
+        "SELECT user2, last_message, last_sender, last_timestamp, unread1 "
+        "FROM Conversation WHERE user1=:username UNION ALL "
+        "SELECT user1, last_message, last_sender, last_timestamp, unread2 "
+        "FROM Conversation WHERE user2=:username;",
+        {"username": username},
+    ).fetchall()
+    return {x[0]: x[1:] for x in rows}
+
+
+def get_history(
+    username: str, other: str, limit: int = HISTORY_PAGE_SIZE, cursor: str = None
+) -> tuple:
+    """
+    Gets a page of the messages between two users, newest first, with one
+    query over the pair's index whatever the length of the conversation.
+
+    Args:
+        username: One of the users.
+        other: The other user.
+        limit: The maximum number of messages to get.
+        cursor: The next cursor from the previous page, or None for the
+            newest messages.
+
+    Returns:
+        The message, sender, date and ID of each message, and the cursor for
+        older messages or None if there are none.
+    """
+    parameters = {
+        "user1": min(username, other),
+        "user2": max(username, other),
+        "limit": limit + 1,
+    }
+    # The cursor is only added to the query when given, so that older pages
+    # start their index search at the cursor.
+    older = ""
+    if cursor:
+        parameters["timestamp"], parameters["id"] = helper_paging.decode_cursor(
+            cursor, 2
+        )
+        older = "AND (timestamp, id) < (:timestamp, :id) "
+    flush()
+    conn = helper_database.get_db()
+    rows = conn.execute(
+        "SELECT id, message, sender, date, timestamp FROM PrivateMessages "
+        "WHERE MIN(sender, receiver)=:user1 AND MAX(sender, receiver)=:user2 "
+        + older
+        + "ORDER BY timestamp DESC, id DESC LIMIT :limit;",
+        parameters,
+    ).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = helper_paging.encode_cursor(rows[-1][4], rows[-1][0])
+    return [(*x[1:4], x[0]) for x in rows], next_cursor
+
+
+def mark_read(username: str, other: str):
+    """
+    Marks every message in a conversation as read by a user.
+
+    Args:
+        username: The user reading the conversation.
+        other: The other user in the conversation.
+    """
+    flush()
+    conn = helper_database.get_db()
+    column = "unread1" if username < other else "unread2"
+    conn.execute(
+        "UPDATE Conversation SET {}=0 WHERE user1=? AND user2=?;".format(column),
+        (min(username, other), max(username, other)),
+    )
+    conn.commit()
+
+
+def get_pending(username: str) -> list:
+    """
+    Gets the messages sent to a user while they were offline which they
+    haven't acknowledged yet.
+
+    Args:
+        username: The user who has connected.
+
+    Returns:
+        The ID, sender, message and date of each message, oldest first.
+    """
+    flush()
+    conn = helper_database.get_db()
+    return conn.execute(
+        "SELECT PendingDelivery.messageId, sender, message, date "
+        "FROM PendingDelivery JOIN PrivateMessages "
+        "ON PrivateMessages.id=PendingDelivery.messageId "
+        "WHERE PendingDelivery.username=? ORDER BY PendingDelivery.messageId;",
+        (username,),
+    ).fetchall()
+
+
+def acknowledge(username: str, message_ids: list):
+    """
+    Removes messages which a user's client has received from their pending
+    deliveries.
+
+    Args:
+        username: The user who received the messages.
+        message_ids: The IDs of the messages received.
+    """
+    conn = helper_database.get_db()
+    conn.execute(
+        "DELETE FROM PendingDelivery WHERE username=? "
+        "AND messageId IN (SELECT value FROM json_each(?));",
+        (username, json.dumps(message_ids)),
+    )
+    conn.commit()
+
+
+def backfill_conversations(conn):
+    """
+    Rebuilds the Conversation table from the stored private messages.
+
+    Args:
+        conn: Connection to the database.
+    """
+    for statement in CONVERSATION_BACKFILL:
+        conn.execute(statement)
+    conn.commit()
+
+
+def close_writers():
+    """
+    Flushes and stops every writer, called when the process exits.
+    """
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        try:
+            writer.close()
+        except Exception:
+            logger.exception("Failed to write private messages on shutdown.")
+
+
+def init_app(app):
+    """
+    Sets the durability default, flushes buffered messages on shutdown and
+    registers the conversation backfill command.
+
+    Args:
+        app: The Flask application.
+    """
+    app.config.setdefault("MESSAGE_DURABILITY", "buffered")
+    atexit.register(close_writers)
+
+    @app.cli.command("backfill-conversations")
+    def backfill_conversations_command():
+        """
+        Rebuilds the chat room list from every stored private message.
+        """
+        close_writers()
+        with helper_database.connection() as conn:
+            backfill_conversations(conn)
+            count = conn.execute("SELECT COUNT(*) FROM Conversation;").fetchone()[0]
+        print("Backfilled {} conversations.".format(count))
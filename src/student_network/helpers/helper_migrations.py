@@ -0,0 +1,407 @@
+"""
+Applies versioned schema changes to the SQLite database, tracking the applied
+version in the database's user_version pragma.
+"""
+import sqlite3
+
+# Rewrites a user's row of the member search index from their profile,
+# hobbies, interests and degree. Used by the triggers in migration 13, so it
+# must not be edited either.
+MEMBER_SEARCH_REFRESH = (
+    "INSERT OR REPLACE INTO MemberSearch "
+    "(rowid, username, name, hobbies, interests, degree, picture) "
+    "SELECT UserProfile.rowid, UserProfile.username, UserProfile.name, "
+    "(SELECT group_concat(hobby, ', ') FROM UserHobby "
+    "WHERE UserHobby.username=UserProfile.username), "
+    "(SELECT group_concat(interest, ', ') FROM UserInterests "
+    "WHERE UserInterests.username=UserProfile.username), "
+    "Degree.degree, UserProfile.profilepicture FROM UserProfile "
+    "LEFT JOIN Degree ON Degree.degreeId=UserProfile.degree "
+    "WHERE UserProfile.username={};"
+)
+
+# Each entry is one migration, applied in order. The database's version is
+# the number of migrations applied so far, so new changes must be appended
+# and shipped migrations never edited.
+MIGRATIONS = (
+    # 1: Keyset feed pagination and the fan-out home timeline.
+    (
+        "CREATE INDEX IF NOT EXISTS POSTS_username_postId_index "
+        "ON POSTS (username, postId);",
+        "CREATE TABLE IF NOT EXISTS Timeline (username TEXT NOT NULL, "
+        "postId INTEGER NOT NULL, PRIMARY KEY (username, postId)) WITHOUT ROWID;",
+        "CREATE INDEX IF NOT EXISTS Timeline_postId_index ON Timeline (postId);",
+        "CREATE TABLE IF NOT EXISTS TimelineExempt "
+        "(username TEXT PRIMARY KEY REFERENCES ACCOUNTS (username));",
+    ),
+    # 2: Indexes for columns filtered on by the hot paths.
+    (
+        "DROP INDEX IF EXISTS Connection_user2_index;",
+        "CREATE INDEX IF NOT EXISTS Connection_user2_connection_type_index "
+        "ON Connection (user2, connection_type);",
+        "CREATE INDEX IF NOT EXISTS Comments_postId_index "
+        "ON Comments (postId, commentId);",
+        "CREATE INDEX IF NOT EXISTS UserLikes_postId_username_index "
+        "ON UserLikes (postId, username);",
+        "CREATE INDEX IF NOT EXISTS AllUserLikes_postId_username_index "
+        "ON AllUserLikes (postId, username);",
+        "CREATE INDEX IF NOT EXISTS PostContent_postId_index "
+        "ON PostContent (postId);",
+        "CREATE INDEX IF NOT EXISTS notification_username_date_index "
+        "ON notification (username, date);",
+        "CREATE INDEX IF NOT EXISTS PrivateMessages_sender_receiver_date_index "
+        "ON PrivateMessages (sender, receiver, date);",
+        "CREATE INDEX IF NOT EXISTS UserHobby_hobby_index ON UserHobby (hobby);",
+        "CREATE INDEX IF NOT EXISTS UserInterests_interest_index "
+        "ON UserInterests (interest);",
+        "CREATE INDEX IF NOT EXISTS UserProfile_degree_index "
+        "ON UserProfile (degree);",
+    ),
+    # 3: Close friendships by the friend, for connection recommendations.
+    ("CREATE INDEX IF NOT EXISTS CloseFriend_user2_index ON CloseFriend (user2);",),
+    # 4: Domain events waiting for the background worker.
+    (
+        "CREATE TABLE IF NOT EXISTS EventQueue "
+        "(eventId INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, "
+        "payload TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+        "locked_until REAL NOT NULL DEFAULT 0);",
+        "CREATE INDEX IF NOT EXISTS EventQueue_locked_until_index "
+        "ON EventQueue (locked_until, eventId);",
+    ),
+    # 5: Users in leaderboard order.
+    (
+        "CREATE INDEX IF NOT EXISTS UserLevel_experience_index "
+        "ON UserLevel (experience DESC, username);",
+    ),
+    # 6: Stored levels, so reading a level doesn't work it out from the
+    # experience. Existing levels are filled in from the series of level
+    # thresholds in helper_profile.
+    (
+        "ALTER TABLE UserLevel ADD COLUMN level INTEGER NOT NULL DEFAULT 1;",
+        "ALTER TABLE UserLevel "
+        "ADD COLUMN next_level_experience INTEGER NOT NULL DEFAULT 100;",
+        "WITH RECURSIVE Threshold (level, experience) AS (SELECT 1, 0 UNION ALL "
+        "SELECT level + 1, experience + 85 + 15 * level FROM Threshold "
+        "WHERE experience <= (SELECT MAX(experience) FROM UserLevel)) "
+        "UPDATE UserLevel SET "
+        "level = (SELECT MAX(level) FROM Threshold "
+        "WHERE Threshold.experience <= UserLevel.experience), "
+        "next_level_experience = (SELECT MIN(experience) FROM Threshold "
+        "WHERE Threshold.experience > UserLevel.experience);",
+    ),
+    # 7: The latest message and unread counts of each pair of users who have
+    # chatted, with user1 sorting before user2.
+    (
+        "CREATE TABLE IF NOT EXISTS Conversation "
+        "(user1 TEXT NOT NULL, user2 TEXT NOT NULL, last_message TEXT, "
+        "last_sender TEXT, last_date DATETIME, "
+        "unread1 INTEGER NOT NULL DEFAULT 0, unread2 INTEGER NOT NULL DEFAULT 0, "
+        "PRIMARY KEY (user1, user2)) WITHOUT ROWID;",
+        "CREATE INDEX IF NOT EXISTS Conversation_user2_index "
+        "ON Conversation (user2, user1);",
+        # Fills in the latest message of each pair, with the last one
+        # inserted winning ties. Read state isn't known for old messages, so
+        # nothing starts unread.
+        "DELETE FROM Conversation;",
+        "INSERT INTO Conversation "
+        "(user1, user2, last_message, last_sender, last_date) "
+        "SELECT user1, user2, message, sender, date FROM ("
+        "SELECT MIN(sender, receiver) AS user1, MAX(sender, receiver) AS user2, "
+        "message, sender, date, ROW_NUMBER() OVER (PARTITION BY "
+        "MIN(sender, receiver), MAX(sender, receiver) ORDER BY date DESC, rowid DESC"
+        ") AS position FROM PrivateMessages) WHERE position=1;",
+    ),
+    # 8: Chat history of a pair of users in date order, whichever of them
+    # sent each message.
+    (
+        "DROP INDEX IF EXISTS PrivateMessages_sender_receiver_date_index;",
+        "CREATE INDEX IF NOT EXISTS PrivateMessages_pair_date_index "
+        "ON PrivateMessages (MIN(sender, receiver), MAX(sender, receiver), date);",
+    ),
+    # 9: Chat sessions shared between worker processes.
+    (
+        "CREATE TABLE IF NOT EXISTS Presence "
+        "(sid TEXT PRIMARY KEY, username TEXT NOT NULL) WITHOUT ROWID;",
+        "CREATE INDEX IF NOT EXISTS Presence_username_index "
+        "ON Presence (username);",
+    ),
+    # 10: Messages sent to users while they were offline, until their client
+    # acknowledges receiving them.
+    (
+        "CREATE TABLE IF NOT EXISTS PendingDelivery "
+        "(username TEXT NOT NULL, messageId INTEGER NOT NULL, "
+        "PRIMARY KEY (username, messageId)) WITHOUT ROWID;",
+    ),
+    # 11: Read flags on notifications, with the unread ones indexed for the
+    # navigation bar's count.
+    (
+        "ALTER TABLE notification ADD COLUMN read INTEGER NOT NULL DEFAULT 0;",
+        "CREATE INDEX IF NOT EXISTS notification_unread_index "
+        "ON notification (username) WHERE read=0;",
+    ),
+    # 12: Integer Unix timestamps beside the date strings, for ordering and
+    # ages without parsing. Notifications and messages were dated in local
+    # time and posts and comments by SQLite in UTC.
+    (
+        "ALTER TABLE notification ADD COLUMN timestamp INTEGER;",
+        "UPDATE notification "
+        "SET timestamp=CAST(strftime('%s', date, 'utc') AS INTEGER);",
+        "DROP INDEX IF EXISTS notification_username_date_index;",
+        "CREATE INDEX IF NOT EXISTS notification_username_timestamp_index "
+        "ON notification (username, timestamp);",
+        "ALTER TABLE PrivateMessages ADD COLUMN timestamp INTEGER;",
+        "UPDATE PrivateMessages "
+        "SET timestamp=CAST(strftime('%s', date, 'utc') AS INTEGER);",
+        "DROP INDEX IF EXISTS PrivateMessages_pair_date_index;",
+        "CREATE INDEX IF NOT EXISTS PrivateMessages_pair_timestamp_index "
+        "ON PrivateMessages "
+        "(MIN(sender, receiver), MAX(sender, receiver), timestamp);",
+        "ALTER TABLE Conversation ADD COLUMN last_timestamp INTEGER;",
+        "UPDATE Conversation "
+        "SET last_timestamp=CAST(strftime('%s', last_date, 'utc') AS INTEGER);",
+        "ALTER TABLE POSTS ADD COLUMN timestamp INTEGER;",
+        "UPDATE POSTS SET timestamp=CAST(strftime('%s', date) AS INTEGER);",
+        "ALTER TABLE Comments ADD COLUMN timestamp INTEGER;",
+        "UPDATE Comments SET timestamp=CAST(strftime('%s', date) AS INTEGER);",
+    ),
+    # 13: Full text member search, kept in step with profiles by triggers.
+    (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS MemberSearch USING fts5 "
+        "(username, name, hobbies, interests, degree, picture UNINDEXED, "
+        "prefix='2 3');",
+        "CREATE TRIGGER IF NOT EXISTS UserProfile_search_insert "
+        "AFTER INSERT ON UserProfile BEGIN "
+        + MEMBER_SEARCH_REFRESH.format("NEW.username")
+        + " END;",
+        "CREATE TRIGGER IF NOT EXISTS UserProfile_search_update "
+        "AFTER UPDATE ON UserProfile BEGIN "
+        "DELETE FROM MemberSearch WHERE rowid=OLD.rowid; "
+        + MEMBER_SEARCH_REFRESH.format("NEW.username")
+        + " END;",
+        "CREATE TRIGGER IF NOT EXISTS UserProfile_search_delete "
+        "AFTER DELETE ON UserProfile BEGIN "
+        "DELETE FROM MemberSearch WHERE rowid=OLD.rowid; END;",
+        "CREATE TRIGGER IF NOT EXISTS UserHobby_search_insert "
+        "AFTER INSERT ON UserHobby BEGIN "
+        + MEMBER_SEARCH_REFRESH.format("NEW.username")
+        + " END;",
+        "CREATE TRIGGER IF NOT EXISTS UserHobby_search_delete "
+        "AFTER DELETE ON UserHobby BEGIN "
+        + MEMBER_SEARCH_REFRESH.format("OLD.username")
+        + " END;",
+        "CREATE TRIGGER IF NOT EXISTS UserInterests_search_insert "
+        "AFTER INSERT ON UserInterests BEGIN "
+        + MEMBER_SEARCH_REFRESH.format("NEW.username")
+        + " END;",
+        "CREATE TRIGGER IF NOT EXISTS UserInterests_search_delete "
+        "AFTER DELETE ON UserInterests BEGIN "
+        + MEMBER_SEARCH_REFRESH.format("OLD.username")
+        + " END;",
+        "DELETE FROM MemberSearch;",
+        MEMBER_SEARCH_REFRESH.format("UserProfile.username"),
+    ),
+    # 14: Full text search over posts and comments. The indexes read their
+    # text from POSTS and Comments, and triggers add and remove rows as they
+    # change. Deleted posts are taken out of the index.
+    (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS PostSearch USING fts5 "
+        "(body, content='POSTS', content_rowid='postId');",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS CommentSearch USING fts5 "
+        "(body, content='Comments', content_rowid='commentId');",
+        "CREATE TRIGGER IF NOT EXISTS POSTS_search_insert "
+        "AFTER INSERT ON POSTS WHEN NEW.privacy IS NOT 'deleted' BEGIN "
+        "INSERT INTO PostSearch (rowid, body) VALUES (NEW.postId, NEW.body); END;",
+        "CREATE TRIGGER IF NOT EXISTS POSTS_search_update "
+        "AFTER UPDATE OF body, privacy ON POSTS BEGIN "
+        "INSERT INTO PostSearch (PostSearch, rowid, body) "
+        "SELECT 'delete', OLD.postId, OLD.body WHERE OLD.privacy IS NOT 'deleted'; "
+        "INSERT INTO PostSearch (rowid, body) "
+        "SELECT NEW.postId, NEW.body WHERE NEW.privacy IS NOT 'deleted'; END;",
+        "CREATE TRIGGER IF NOT EXISTS POSTS_search_delete "
+        "AFTER DELETE ON POSTS WHEN OLD.privacy IS NOT 'deleted' BEGIN "
+        "INSERT INTO PostSearch (PostSearch, rowid, body) "
+        "VALUES ('delete', OLD.postId, OLD.body); END;",
+        "CREATE TRIGGER IF NOT EXISTS Comments_search_insert "
+        "AFTER INSERT ON Comments BEGIN "
+        "INSERT INTO CommentSearch (rowid, body) "
+        "VALUES (NEW.commentId, NEW.body); END;",
+        "CREATE TRIGGER IF NOT EXISTS Comments_search_update "
+        "AFTER UPDATE OF body ON Comments BEGIN "
+        "INSERT INTO CommentSearch (CommentSearch, rowid, body) "
+        "VALUES ('delete', OLD.commentId, OLD.body); "
+        "INSERT INTO CommentSearch (rowid, body) "
+        "VALUES (NEW.commentId, NEW.body); END;",
+        "CREATE TRIGGER IF NOT EXISTS Comments_search_delete "
+        "AFTER DELETE ON Comments BEGIN "
+        "INSERT INTO CommentSearch (CommentSearch, rowid, body) "
+        "VALUES ('delete', OLD.commentId, OLD.body); END;",
+        "INSERT INTO PostSearch (PostSearch) VALUES ('delete-all');",
+        "INSERT INTO PostSearch (rowid, body) "
+        "SELECT postId, body FROM POSTS WHERE privacy IS NOT 'deleted';",
+        "INSERT INTO CommentSearch (CommentSearch) VALUES ('delete-all');",
+        "INSERT INTO CommentSearch (rowid, body) SELECT commentId, body FROM Comments;",
+    ),
+    # 15: A log of the pairs of users whose connection or close friendship
+    # changed, so every process can bring its social graph index up to date.
+    # Only the latest 10000 changes are kept.
+    (
+        "CREATE TABLE IF NOT EXISTS GraphChange (seq INTEGER PRIMARY KEY "
+        "AUTOINCREMENT, user1 TEXT NOT NULL, user2 TEXT NOT NULL);",
+        "CREATE TRIGGER IF NOT EXISTS GraphChange_prune "
+        "AFTER INSERT ON GraphChange BEGIN "
+        "DELETE FROM GraphChange WHERE seq<=NEW.seq-10000; END;",
+        "CREATE TRIGGER IF NOT EXISTS Connection_graph_insert "
+        "AFTER INSERT ON Connection BEGIN "
+        "INSERT INTO GraphChange (user1, user2) VALUES (NEW.user1, NEW.user2); END;",
+        "CREATE TRIGGER IF NOT EXISTS Connection_graph_update "
+        "AFTER UPDATE ON Connection BEGIN "
+        "INSERT INTO GraphChange (user1, user2) VALUES (OLD.user1, OLD.user2); "
+        "INSERT INTO GraphChange (user1, user2) VALUES (NEW.user1, NEW.user2); END;",
+        "CREATE TRIGGER IF NOT EXISTS Connection_graph_delete "
+        "AFTER DELETE ON Connection BEGIN "
+        "INSERT INTO GraphChange (user1, user2) VALUES (OLD.user1, OLD.user2); END;",
+        "CREATE TRIGGER IF NOT EXISTS CloseFriend_graph_insert "
+        "AFTER INSERT ON CloseFriend BEGIN "
+        "INSERT INTO GraphChange (user1, user2) VALUES (NEW.user1, NEW.user2); END;",
+        "CREATE TRIGGER IF NOT EXISTS CloseFriend_graph_update "
+        "AFTER UPDATE ON CloseFriend BEGIN "
+        "INSERT INTO GraphChange (user1, user2) VALUES (OLD.user1, OLD.user2); "
+        "INSERT INTO GraphChange (user1, user2) VALUES (NEW.user1, NEW.user2); END;",
+        "CREATE TRIGGER IF NOT EXISTS CloseFriend_graph_delete "
+        "AFTER DELETE ON CloseFriend BEGIN "
+        "INSERT INTO GraphChange (user1, user2) VALUES (OLD.user1, OLD.user2); END;",
+    ),
+    # 16: Buffered private messages which repeatedly failed to be written,
+    # kept aside so they can be looked into and written again by hand.
+    (
+        "CREATE TABLE IF NOT EXISTS FailedPrivateMessage "
+        "(sender STRING, receiver STRING, message TEXT, date, timestamp INTEGER, "
+        "offline BOOLEAN, error TEXT);",
+    ),
+    # 17: The worker holding each chat session and when it stops counting as
+    # connected unless the worker renews it. Sessions from before can't be
+    # renewed, so they are cleared.
+    (
+        "DELETE FROM Presence;",
+        "ALTER TABLE Presence ADD COLUMN worker TEXT NOT NULL DEFAULT '';",
+        "ALTER TABLE Presence ADD COLUMN expires INTEGER NOT NULL DEFAULT 0;",
+        "CREATE INDEX IF NOT EXISTS Presence_worker_index ON Presence (worker);",
+        "CREATE INDEX IF NOT EXISTS Presence_expires_index ON Presence (expires);",
+    ),
+    # 18: A log of the users whose experience changed, so every process can
+    # bring its leaderboard up to date. Only the latest 10000 changes are
+    # kept.
+    (
+        "CREATE TABLE IF NOT EXISTS LevelChange (seq INTEGER PRIMARY KEY "
+        "AUTOINCREMENT, username TEXT NOT NULL);",
+        "CREATE TRIGGER IF NOT EXISTS LevelChange_prune "
+        "AFTER INSERT ON LevelChange BEGIN "
+        "DELETE FROM LevelChange WHERE seq<=NEW.seq-10000; END;",
+        "CREATE TRIGGER IF NOT EXISTS UserLevel_level_insert "
+        "AFTER INSERT ON UserLevel BEGIN "
+        "INSERT INTO LevelChange (username) VALUES (NEW.username); END;",
+        "CREATE TRIGGER IF NOT EXISTS UserLevel_level_update "
+        "AFTER UPDATE OF username, experience ON UserLevel BEGIN "
+        "INSERT INTO LevelChange (username) VALUES (OLD.username); "
+        "INSERT INTO LevelChange (username) VALUES (NEW.username); END;",
+        "CREATE TRIGGER IF NOT EXISTS UserLevel_level_delete "
+        "AFTER DELETE ON UserLevel BEGIN "
+        "INSERT INTO LevelChange (username) VALUES (OLD.username); END;",
+    ),
+    # 19: A log of the users whose account or profile picture changed, so
+    # every process can bring its username index up to date. Only the latest
+    # 10000 changes are kept.
+    (
+        "CREATE TABLE IF NOT EXISTS UserChange (seq INTEGER PRIMARY KEY "
+        "AUTOINCREMENT, username TEXT NOT NULL);",
+        "CREATE TRIGGER IF NOT EXISTS UserChange_prune "
+        "AFTER INSERT ON UserChange BEGIN "
+        "DELETE FROM UserChange WHERE seq<=NEW.seq-10000; END;",
+        "CREATE TRIGGER IF NOT EXISTS ACCOUNTS_user_insert "
+        "AFTER INSERT ON ACCOUNTS BEGIN "
+        "INSERT INTO UserChange (username) VALUES (NEW.username); END;",
+        "CREATE TRIGGER IF NOT EXISTS ACCOUNTS_user_update "
+        "AFTER UPDATE OF username ON ACCOUNTS BEGIN "
+        "INSERT INTO UserChange (username) VALUES (OLD.username); "
+        "INSERT INTO UserChange (username) VALUES (NEW.username); END;",
+        "CREATE TRIGGER IF NOT EXISTS ACCOUNTS_user_delete "
+        "AFTER DELETE ON ACCOUNTS BEGIN "
+        "INSERT INTO UserChange (username) VALUES (OLD.username); END;",
+        "CREATE TRIGGER IF NOT EXISTS UserProfile_user_insert "
+        "AFTER INSERT ON UserProfile BEGIN "
+        "INSERT INTO UserChange (username) VALUES (NEW.username); END;",
+        "CREATE TRIGGER IF NOT EXISTS UserProfile_user_update "
+        "AFTER UPDATE OF username, profilepicture ON UserProfile BEGIN "
+        "INSERT INTO UserChange (username) VALUES (OLD.username); "
+        "INSERT INTO UserChange (username) VALUES (NEW.username); END;",
+        "CREATE TRIGGER IF NOT EXISTS UserProfile_user_delete "
+        "AFTER DELETE ON UserProfile BEGIN "
+        "INSERT INTO UserChange (username) VALUES (OLD.username); END;",
+    ),
+    # 20: An explicit ID on private messages for pending deliveries and
+    # cursors to refer to, as VACUUM may renumber an implicit rowid. Each
+    # message keeps its rowid as its ID so existing references stay valid.
+    (
+        "CREATE TABLE PrivateMessagesNew (id INTEGER PRIMARY KEY, "
+        "sender STRING REFERENCES ACCOUNTS (username), "
+        "receiver STRING REFERENCES ACCOUNTS (username), "
+        "message TEXT, date DATETIME, timestamp INTEGER);",
+        "INSERT INTO PrivateMessagesNew "
+        "(id, sender, receiver, message, date, timestamp) "
+        "SELECT rowid, sender, receiver, message, date, timestamp "
+        "FROM PrivateMessages;",
+        "DROP TABLE PrivateMessages;",
+        "ALTER TABLE PrivateMessagesNew RENAME TO PrivateMessages;",
+        "CREATE INDEX IF NOT EXISTS PrivateMessages_pair_timestamp_index "
+        "ON PrivateMessages "
+        "(MIN(sender, receiver), MAX(sender, receiver), timestamp);",
+        "CREATE TABLE PendingDeliveryNew (username TEXT NOT NULL, "
+        "messageId INTEGER NOT NULL REFERENCES PrivateMessages (id), "
+        "PRIMARY KEY (username, messageId)) WITHOUT ROWID;",
+        "INSERT INTO PendingDeliveryNew (username, messageId) "
+        "SELECT username, messageId FROM PendingDelivery;",
+        "DROP TABLE PendingDelivery;",
+        "ALTER TABLE PendingDeliveryNew RENAME TO PendingDelivery;",
+    ),
+)
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    """
+    Gets the number of migrations applied to the database.
+
+    Args:
+        conn: Connection to the database.
+
+    Returns:
+        The schema version of the database.
+    """
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Applies every migration the database is missing. Each migration runs in
+    its own write transaction and the version is checked again once the lock
+    is held, so processes starting at the same time apply it only once.
+
+    Args:
+        conn: Connection to the database.
+
+    Returns:
+        The schema version of the database after migrating.
+    """
+    for version, statements in enumerate(MIGRATIONS, 1):
+        if get_version(conn) >= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            if get_version(conn) < version:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute("PRAGMA user_version={};".format(version))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return get_version(conn)
@@ -0,0 +1,89 @@
+"""
+Builds the navigation bar data shared by every page, computing it at most
+once per request and caching each user's badge counts between requests.
+"""
+import student_network.helpers.helper_cache as helper_cache
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_notifications as helper_notifications
+from flask import current_app, g, session
+
+NOTIFICATION_LIMIT = 10
+BADGE_CACHE_SIZE = 4096
+BADGE_CACHE_TTL = 30
+
+# Pending connection request and notification counts, keyed by database and
+# username.
+_badge_cache = helper_cache.TTLCache(BADGE_CACHE_SIZE, BADGE_CACHE_TTL)
+
+
+def get_badge_counts(username: str) -> tuple:
+    """
+    Gets the numbers shown on the user's navigation bar badges.
+
+    Args:
+        username: The user logged in.
+
+    Returns:
+        The number of pending connection requests and unread notifications.
+    """
+    key = (current_app.config["DATABASE"], username)
+    counts = _badge_cache.get(key)
+    if counts is None:
+        with helper_database.get_db() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT (SELECT COUNT(*) FROM Connection "
+                "WHERE user2=:username AND connection_type='request'), "
+                "(SELECT COUNT(*) FROM notification "
+                "WHERE username=:username AND read=0);",
+                {"username": username},
+            )
+            counts = cur.fetchone()
+        _badge_cache.set(key, counts)
+    return counts
+
+
+def invalidate_badges(*usernames: str):
+    """
+    Forgets the cached badge counts of users after they receive a connection
+    request or notification, one is removed, or they read notifications.
+
+    Args:
+        usernames: The users whose counts changed.
+    """
+    for username in usernames:
+        _badge_cache.delete((current_app.config["DATABASE"], username))
+
+
+def get_navbar() -> dict:
+    """
+    Gets the variables used by the navigation bar in base.html.
+
+    Returns:
+        The pending connection request count, the number of unread
+        notifications and the most recent notifications of the user logged in.
+    """
+    if "navbar" not in g:
+        if "username" in session:
+            request_count, notification_count = get_badge_counts(session["username"])
+            notifications, _ = helper_notifications.get_notifications(
+                session["username"], NOTIFICATION_LIMIT
+            )
+        else:
+            request_count, notification_count, notifications = 0, 0, []
+        g.navbar = {
+            "requestCount": request_count,
+            "notificationCount": notification_count,
+            "notifications": notifications,
+        }
+    return g.navbar
+
+
+def init_app(app):
+    """
+    Makes the navigation bar variables available to every template.
+
+    Args:
+        app: The Flask application.
+    """
+    app.context_processor(get_navbar)
@@ -0,0 +1,154 @@
+"""
+Reads notifications a page at a time, tracks which ones have been read, and
+compacts old ones so each user's notifications stay a bounded size.
+"""
+import json
+import time
+
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_general as helper_general
+import student_network.helpers.helper_navbar as helper_navbar
+import student_network.helpers.helper_paging as helper_paging
+from flask import current_app
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def get_notifications(username: str, limit: int, cursor: str = None) -> tuple:
+    """
+    Gets a page of a user's notifications, newest first, from the
+    (username, timestamp) index.
+
+    Args:
+        username: The user whose notifications to get.
+        limit: The maximum number of notifications.
+        cursor: The next cursor from the previous page, or None for the
+            newest notifications.
+
+    Returns:
+        The body, age, link, ID and read flag of each notification, and the
+        cursor for older notifications or None if there are none.
+    """
+    parameters = {"username": username, "limit": limit + 1}
+    older = ""
+    if cursor:
+        parameters["timestamp"], parameters["id"] = helper_paging.decode_cursor(
+            cursor, 2
+        )
+        older = "AND (timestamp, rowid) < (:timestamp, :id) "
+    conn = helper_database.get_db()
+    rows = conn.execute(
+        "SELECT rowid, body, timestamp, url, read FROM notification "
+        "WHERE username=:username "
+        + older
+        + "ORDER BY timestamp DESC, rowid DESC LIMIT :limit;",
+        parameters,
+    ).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = helper_paging.encode_cursor(rows[-1][2], rows[-1][0])
+    ages = helper_general.format_ages(x[2] for x in rows)
+    notifications = [
+        (body, age, url, notification_id, bool(read))
+        for (notification_id, body, _, url, read), age in zip(rows, ages)
+    ]
+    return notifications, next_cursor
+
+
+def mark_read(username: str, notification_ids: list = None) -> int:
+    """
+    Marks a user's notifications as read.
+
+    Args:
+        username: The user who read the notifications.
+        notification_ids: The notifications read, or None for all of them.
+
+    Returns:
+        The number of notifications which were unread.
+    """
+    conn = helper_database.get_db()
+    if notification_ids is None:
+        cur = conn.execute(
+            "UPDATE notification SET read=1 WHERE username=? AND read=0;",
+            (username,),
+        )
+    else:
+        cur = conn.execute(
+            "UPDATE notification SET read=1 WHERE username=? AND read=0 "
+            "AND rowid IN (SELECT value FROM json_each(?));",
+            (username, json.dumps(notification_ids)),
+        )
+    conn.commit()
+    if cur.rowcount:
+        helper_navbar.invalidate_badges(username)
+    return cur.rowcount
+
+
+def get_url(username: str, notification_id: int):
+    """
+    Gets where a user's notification links to.
+
+    Args:
+        username: The user the notification belongs to.
+        notification_id: The ID of the notification.
+
+    Returns:
+        The link, or None if the user has no such notification.
+    """
+    conn = helper_database.get_db()
+    row = conn.execute(
+        "SELECT url FROM notification WHERE rowid=? AND username=?;",
+        (notification_id, username),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def compact_notifications(conn, now: float = None) -> int:
+    """
+    Deletes read notifications older than the retention period, and every
+    notification beyond each user's newest NOTIFICATION_MAX_PER_USER.
+
+    Args:
+        conn: Connection to the database.
+        now: The Unix time to measure the retention period back from.
+
+    Returns:
+        The number of notifications deleted.
+    """
+    now = time.time() if now is None else now
+    cutoff = now - current_app.config["NOTIFICATION_RETENTION_DAYS"] * 24 * 3600
+    deleted = conn.execute(
+        "DELETE FROM notification WHERE read=1 AND timestamp<?;", (cutoff,)
+    ).rowcount
+    deleted += conn.execute(
+        "DELETE FROM notification WHERE rowid IN (SELECT rowid FROM ("
+        "SELECT rowid, ROW_NUMBER() OVER (PARTITION BY username "
+        "ORDER BY timestamp DESC, rowid DESC) AS position FROM notification) "
+        "WHERE position>?);",
+        (current_app.config["NOTIFICATION_MAX_PER_USER"],),
+    ).rowcount
+    conn.commit()
+    return deleted
+
+
+def init_app(app):
+    """
+    Sets the retention defaults and registers the compaction command.
+
+    Args:
+        app: The Flask application.
+    """
+    app.config.setdefault("NOTIFICATION_RETENTION_DAYS", 90)
+    app.config.setdefault("NOTIFICATION_MAX_PER_USER", 500)
+
+    @app.cli.command("compact-notifications")
+    def compact_notifications_command():
+        """
+        Deletes old notifications, for running on a schedule.
+        """
+        with helper_database.connection() as conn:
+            deleted = compact_notifications(conn)
+        print("Deleted {} notifications.".format(deleted))
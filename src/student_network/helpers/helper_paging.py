@@ -0,0 +1,80 @@
+"""
+Reads the page size from API requests and encodes the opaque cursors which
+keyset paginated endpoints hand out for fetching the next page.
+"""
+import base64
+import json
+
+from flask import request
+
+
+def encode_cursor(*values: int) -> str:
+    """
+    Creates an opaque cursor pointing just past the last row on a page.
+
+    Args:
+        values: The sort key of that row, such as its timestamp and ID.
+
+    Returns:
+        The cursor for the next page.
+    """
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str, length: int) -> tuple:
+    """
+    Gets the sort key of the row which a cursor points past.
+
+    Args:
+        cursor: The cursor from the previous page.
+        length: The number of values in the sort key.
+
+    Returns:
+        The values the cursor was created from.
+
+    Raises:
+        ValueError: If the cursor wasn't created by encode_cursor with that
+            many values.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as error:
+        raise ValueError("Invalid cursor.") from error
+    if (
+        not isinstance(values, list)
+        or len(values) != length
+        or not all(isinstance(x, int) for x in values)
+    ):
+        raise ValueError("Invalid cursor.")
+    return tuple(values)
+
+
+def get_limit(default: int, maximum: int) -> int:
+    """
+    Gets the page size asked for by the limit parameter of the request.
+
+    Args:
+        default: The page size if none is given.
+        maximum: The largest page size allowed.
+
+    Returns:
+        The page size, clamped between 1 and the maximum.
+
+    Raises:
+        ValueError: If the limit isn't a whole number.
+    """
+    return min(max(int(request.args.get("limit", default)), 1), maximum)
+
+
+def get_offset() -> int:
+    """
+    Gets the number of rows to skip asked for by the offset parameter of the
+    request.
+
+    Returns:
+        The offset, which is at least 0.
+
+    Raises:
+        ValueError: If the offset isn't a whole number.
+    """
+    return max(int(request.args.get("offset", 0)), 0)
@@ -1,20 +1,22 @@
 """
 Performs checks and actions to help the post system work effectively.
 """
+import heapq
+import json
 import os
 import re
-import sqlite3
-import uuid
-from datetime import datetime
+import sys
+from itertools import islice
 from typing import Tuple
 
 import student_network.helpers.helper_achievements as helper_achievements
-import student_network.helpers.helper_connections as helper_connections
+import student_network.helpers.helper_database as helper_database
 import student_network.helpers.helper_general as helper_general
+import student_network.helpers.helper_images as helper_images
+import student_network.helpers.helper_paging as helper_paging
 import student_network.helpers.helper_profile as helper_profile
-from flask import request, session
-from PIL import Image
-from werkzeug.utils import secure_filename
+import student_network.helpers.helper_timeline as helper_timeline
+from flask import current_app, request, session
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "db.sqlite3")
@@ -41,183 +43,324 @@ def check_if_liked(cur, post_id: int, username: str) -> bool:
     return False
 
 
-def fetch_posts(number: int, starting_id: int) -> Tuple[dict, str, bool]:
+def get_feed_heads(
+    cur, username: str, before_id: int, exempt_only: bool = False
+) -> list:
+    """
+    Gets the authors whose posts appear on the user's feed, with the newest
+    post of each which the user can see.
+
+    Visibility level 2 is the user's own posts, 1 is an author who has marked
+    the user as a close friend, and 0 is any other connection.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        username: The user viewing the feed.
+        before_id: Only posts older than this ID are considered.
+        exempt_only: Whether to only include authors whose posts are left out
+                     of the precomputed timeline.
+
+    Returns:
+        A list of authors, the visibility level of their posts and the ID of
+        their newest visible post (None if they have none).
+    """
+    if exempt_only:
+        friends = (
+            "SELECT username FROM TimelineExempt WHERE EXISTS ("
+            "SELECT 1 FROM Connection WHERE connection_type='connected' AND "
+            "((user1=:username AND user2=TimelineExempt.username) OR "
+            "(user1=TimelineExempt.username AND user2=:username)))"
+        )
+    else:
+        friends = (
+            "SELECT user2 FROM Connection "
+            "WHERE user1=:username AND connection_type='connected' UNION "
+            "SELECT user1 FROM Connection "
+            "WHERE user2=:username AND connection_type='connected'"
+        )
+    cur.execute(
+        "WITH Friends(username) AS (" + friends + "), "
+        "Authors(username, level) AS ("
+        "SELECT :username, 2 UNION ALL "
+        "SELECT username, EXISTS (SELECT 1 FROM CloseFriend "
+        "WHERE user1=Friends.username AND user2=:username) "
+        "FROM Friends WHERE username!=:username) "
+        "SELECT username, level, (SELECT postId FROM POSTS "
+        "WHERE POSTS.username=Authors.username AND postId < :before_id "
+        "AND privacy!='deleted' AND (level=2 OR privacy!='private') "
+        "AND (level>=1 OR privacy!='close') "
+        "ORDER BY postId DESC LIMIT 1) FROM Authors "
+        "WHERE NOT :exempt_only "
+        "OR username IN (SELECT username FROM TimelineExempt);",
+        {"username": username, "before_id": before_id, "exempt_only": exempt_only},
+    )
+    return cur.fetchall()
+
+
+def get_next_post_id(cur, author: str, level: int, before_id: int):
+    """
+    Gets the newest post by an author older than the given post which is
+    visible at the given level.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        author: The author of the post.
+        level: The visibility level of the author's posts.
+        before_id: Only posts older than this ID are considered.
+
+    Returns:
+        The ID of the post, or None if there isn't one.
+    """
+    cur.execute(
+        "SELECT postId FROM POSTS WHERE username=:author AND postId < :before_id "
+        "AND privacy!='deleted' AND (:level=2 OR privacy!='private') "
+        "AND (:level>=1 OR privacy!='close') "
+        "ORDER BY postId DESC LIMIT 1;",
+        {"author": author, "level": level, "before_id": before_id},
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def merge_author_posts(cur, heads: list):
+    """
+    Yields the visible posts of several authors, newest first, using a k-way
+    merge which seeks the (username, postId) index for an author's next post
+    only once their previous one has been taken.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        heads: The authors, visibility levels and newest post IDs from
+               get_feed_heads.
+
+    Yields:
+        The IDs of the posts.
+    """
+    heap = [(-head, author, level) for author, level, head in heads if head is not None]
+    heapq.heapify(heap)
+    while heap:
+        post_id, author, level = heapq.heappop(heap)
+        yield -post_id
+        next_id = get_next_post_id(cur, author, level, -post_id)
+        if next_id is not None:
+            heapq.heappush(heap, (-next_id, author, level))
+
+
+def get_visible_posts(cur, username: str, number: int, before_id: int) -> list:
+    """
+    Gets a page of posts from the user and their connections which the user
+    is allowed to see, along with each author's account type and avatar.
+
+    With fan-out on write switched on, the page is a range scan of the user's
+    timeline merged with the posts of any authors too widely connected to be
+    fanned out. Otherwise the newest visible post of every author is found
+    with one query and merged on read. Either way the work done depends on
+    the page size rather than how far back the page is.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        username: The user viewing the posts.
+        number: Number of posts.
+        before_id: Only posts older than this ID are returned.
+
+    Returns:
+        A list of post rows, newest first, with one row more than the page
+        size if there are further pages.
+    """
+    if helper_timeline.is_enabled():
+        heads = get_feed_heads(cur, username, before_id, exempt_only=True)
+        post_ids = heapq.merge(
+            helper_timeline.get_post_ids(cur, username, before_id, number + 1),
+            merge_author_posts(cur, heads),
+            reverse=True,
+        )
+    else:
+        post_ids = merge_author_posts(cur, get_feed_heads(cur, username, before_id))
+    post_ids = list(islice(post_ids, number + 1))
+
+    cur.execute(
+        "SELECT POSTS.postId, POSTS.body, POSTS.likes, POSTS.username, "
+        "POSTS.timestamp, POSTS.privacy, ACCOUNTS.type, UserProfile.profilepicture "
+        "FROM POSTS "
+        "INNER JOIN ACCOUNTS ON ACCOUNTS.username=POSTS.username "
+        "LEFT JOIN UserProfile ON UserProfile.username=POSTS.username "
+        "WHERE POSTS.postId IN (SELECT value FROM json_each(?)) "
+        "ORDER BY POSTS.postId DESC;",
+        (json.dumps(post_ids),),
+    )
+    return cur.fetchall()
+
+
+def get_post_details(
+    cur, post_ids: list, username: str
+) -> Tuple[dict, dict, dict, set]:
+    """
+    Gets the comments, images and likes for a set of posts.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        post_ids: IDs of the posts to get details for.
+        username: The user viewing the posts.
+
+    Returns:
+        The first five comments of each post, the comment count of each
+        post, the images of each post, and the IDs of posts liked by the user.
+    """
+    post_ids = json.dumps(post_ids)
+    comments = {}
+    comment_counts = {}
+    cur.execute(
+        "SELECT commentId, Ranked.username, body, date, postId, "
+        "UserProfile.profilepicture, total FROM ("
+        "SELECT *, ROW_NUMBER() OVER (PARTITION BY postId ORDER BY commentId) "
+        "AS position, COUNT(*) OVER (PARTITION BY postId) AS total "
+        "FROM Comments WHERE postId IN (SELECT value FROM json_each(?))) "
+        "AS Ranked LEFT JOIN UserProfile "
+        "ON UserProfile.username=Ranked.username "
+        "WHERE position <= 5 ORDER BY postId, commentId;",
+        (post_ids,),
+    )
+    for comment in cur.fetchall():
+        comments.setdefault(comment[4], []).append(comment[:6])
+        comment_counts[comment[4]] = comment[6]
+
+    images = {}
+    cur.execute(
+        "SELECT postId, contentUrl FROM PostContent "
+        "WHERE postId IN (SELECT value FROM json_each(?));",
+        (post_ids,),
+    )
+    for post_id, content_url in cur.fetchall():
+        images.setdefault(post_id, []).append((content_url,))
+
+    cur.execute(
+        "SELECT postId FROM UserLikes "
+        "WHERE username=? AND postId IN (SELECT value FROM json_each(?));",
+        (username, post_ids),
+    )
+    liked = {x[0] for x in cur.fetchall()}
+
+    return comments, comment_counts, images, liked
+
+
+def fetch_posts(number: int, cursor: str = None) -> Tuple[dict, str, bool]:
     """
     Fetches posts which are visible by the user logged in.
 
     Args:
         number: Number of posts.
-        starting_id: ID of the first post to fetch, in descending order.
+        cursor: The next cursor from the previous page, or None for the
+                newest posts.
 
     Returns:
-        A dictionary of details in the post, type of post, and validity of
-        post.
+        A dictionary of details in the post and the cursor for the next page,
+        type of post, and validity of post.
     """
     content = ""
-    all_posts = {"AllPosts": []}
+    all_posts = {"AllPosts": [], "next_cursor": None}
     if "username" in session:
         session["prev-page"] = request.url
-        with sqlite3.connect("db.sqlite3") as conn:
+        number = int(number)
+        before_id = sys.maxsize
+        if cursor:
+            (before_id,) = helper_paging.decode_cursor(cursor, 1)
+        with helper_database.get_db() as conn:
             cur = conn.cursor()
 
-            connections = helper_general.get_all_connections(session["username"])
-            connections.append((session["username"],))
-            row = []
-            for user in connections:
-                if user[0] == session["username"]:
-                    cur.execute(
-                        "SELECT * FROM POSTS "
-                        "WHERE username=? AND postId <= ? "
-                        "AND privacy!='deleted' "
-                        "ORDER BY postId DESC LIMIT ?;",
-                        (user[0], starting_id, number),
-                    )
-                elif (
-                    helper_connections.is_close_friend(user[0], session["username"])
-                    or user[0] == session["username"]
-                ):
-                    cur.execute(
-                        "SELECT * FROM POSTS "
-                        "WHERE username=? AND postId <= ? "
-                        "AND privacy!='private' "
-                        "AND privacy!='deleted' "
-                        "ORDER BY postId DESC LIMIT ?;",
-                        (user[0], starting_id, number),
-                    )
-                else:
-                    cur.execute(
-                        "SELECT * FROM POSTS "
-                        "WHERE username=? AND postId <= ? "
-                        "AND privacy!='private' AND privacy!='close' "
-                        "AND privacy!='deleted' "
-                        "ORDER BY postId DESC LIMIT ?;",
-                        (user[0], starting_id, number),
-                    )
-                row += cur.fetchall()
-
-            # Sort reverse chronologically
-            row.sort(key=lambda x: x[0], reverse=True)
-            i = 0
-
-            # account type differentiation in posts db
-            for user_post in row:
-                if i == int(number):
-                    break
+            row = get_visible_posts(cur, session["username"], number, before_id)
+            if len(row) > number:
+                row = row[:number]
+                all_posts["next_cursor"] = helper_paging.encode_cursor(row[-1][0])
+            comments, comment_counts, images, liked = get_post_details(
+                cur, [x[0] for x in row], session["username"]
+            )
+
+            dates = helper_general.format_dates(x[4] for x in row)
+            for user_post, time in zip(row, dates):
                 add = ""
                 if len(user_post[1]) > 250:
                     add = "..."
-                time = datetime.strptime(user_post[4], "%Y-%m-%d").strftime("%d-%m-%y")
-
-                # Get account type
-                cur.execute(
-                    "SELECT type FROM ACCOUNTS WHERE username=? ", (user_post[3],)
-                )
-
-                accounts = cur.fetchone()
-                account_type = accounts[0]
-
                 post_id = user_post[0]
 
-                cur.execute(
-                    "SELECT * FROM Comments WHERE postId=? LIMIT 5;", (post_id,)
-                )
-                comments = cur.fetchall()
-
-                comments = list(
-                    map(
-                        lambda x: (
-                            x[0],
-                            x[1],
-                            x[2],
-                            x[3],
-                            x[4],
-                            helper_profile.get_profile_picture(x[1]),
-                        ),
-                        comments,
-                    )
-                )
-
-                cur.execute(
-                    "SELECT COUNT(commentID) FROM Comments WHERE postId=?;",
-                    (post_id,),
-                )
-                comment_count = cur.fetchone()[0]
-
-                cur.execute("SELECT likes FROM POSTS WHERE postId=?;", (post_id,))
-                like_count = cur.fetchone()[0]
-
-                liked = check_if_liked(cur, post_id, session["username"])
-
-                cur.execute(
-                    "SELECT (contentUrl) FROM PostContent WHERE postId=?", (post_id,)
-                )
-                images = cur.fetchall()
-
                 all_posts["AllPosts"].append(
                     {
-                        "postId": user_post[0],
-                        "profile_pic": helper_profile.get_profile_picture(user_post[3]),
+                        "postId": post_id,
+                        "profile_pic": helper_images.image_url(
+                            user_post[7], helper_images.AVATAR_WIDTH
+                        ),
                         "author": user_post[3],
-                        "account_type": account_type,
+                        "account_type": user_post[6],
                         "date_posted": time,
                         "body": (user_post[1])[:250] + add,
                         "privacy": user_post[5],
                         "content": content,
-                        "comment_count": comment_count,
-                        "like_count": like_count,
-                        "liked": liked,
-                        "comments": comments,
-                        "images": images,
+                        "comment_count": comment_counts.get(post_id, 0),
+                        "like_count": user_post[2],
+                        "liked": post_id in liked,
+                        "comments": [
+                            (
+                                *x[:5],
+                                helper_images.image_url(
+                                    x[5], helper_images.AVATAR_WIDTH
+                                ),
+                            )
+                            for x in comments.get(post_id, [])
+                        ],
+                        "images": images.get(post_id, []),
                     }
                 )
-                i += 1
         return all_posts, content, True
     else:
         return all_posts, content, False
 
 
-def update_comment_achievements(row: int, username: str):
+def upload_image(file):
     """
-    Unlocks achievements for a user after making a comment.
+    Uploads the image to the website, resizing it in the background.
 
     Args:
-        row: Number of comments on the post.
-        username: Author of the post.
-    """
-    # Award achievement ID 10 - Commentary if necessary
-    helper_achievements.apply_achievement(session["username"], 10)
+        file: The file uploaded by the user.
 
-    # Award achievement ID 21 - Hot topic if necessary
-    if row >= 10:
-        helper_achievements.apply_achievement(username, 21)
+    Returns:
+        The hashed file name, which is empty if the file isn't an image.
 
+    Raises:
+        QueueFull: If too many images are already waiting to be resized.
+    """
+    file_name_hashed = ""
+    if helper_general.is_allowed_photo_file(file.filename):
+        try:
+            file_name_hashed = helper_images.submit(file, "post_imgs")
+        except ValueError:
+            pass
+    return file_name_hashed
 
-def upload_image(file):
+
+def can_delete_image(username: str, image_id: str, uploads: list) -> bool:
     """
-    Uploads the image to the website.
+    Checks whether a user may delete a post image, which they must have
+    uploaded themselves, and which must only be on their own posts.
 
     Args:
-        file: The file uploaded by the user.
+        username: The user deleting the image.
+        image_id: The ID the image was given when uploaded.
+        uploads: The IDs of images uploaded in the user's session.
 
     Returns:
-        The hashed file name.
+        Whether the user may delete the image (True/False).
     """
-    file_name_hashed = ""
-    # Hashes the name of the file and resizes it.
-    if helper_general.is_allowed_photo_file(file.filename):
-        secure_filename(file.filename)
-        file_name_hashed = str(uuid.uuid4())
-        file_path = os.path.join("./static/images" + "//post_imgs", file_name_hashed)
-
-        img = Image.open(file)
-        fixed_height = 600
-        height_percent = fixed_height / float(img.size[1])
-        width_size = int((float(img.size[0]) * float(height_percent)))
-        width_size = min(width_size, 800)
-        img = img.resize((width_size, fixed_height))
-        img = img.convert("RGB")
-        img.save(file_path + ".jpg")
-    return file_name_hashed
+    owners = {
+        x[0]
+        for x in helper_database.get_db().execute(
+            "SELECT POSTS.username FROM PostContent "
+            "INNER JOIN POSTS ON POSTS.postId=PostContent.postId "
+            "WHERE PostContent.contentUrl=?;",
+            (image_id,),
+        )
+    }
+    if owners:
+        return owners == {username}
+    return image_id in uploads
 
 
 def delete_file(filename):
@@ -226,12 +369,20 @@ def delete_file(filename):
 
     Args:
         filename: Post image file name
+
+    Raises:
+        ValueError: If the file name leads outside the images folder.
     """
     if filename == "":
         return
 
-    file_path = os.path.join("./static/images" + "//post_imgs", filename)
-    os.remove(file_path)
+    directory = current_app.config["IMAGE_DIRECTORY"]
+    image_id = os.path.splitext(filename)[0]
+    file_path = os.path.join(directory, "post_imgs", filename)
+    if os.path.exists(helper_images.check_path(directory, file_path)):
+        os.remove(file_path)
+    helper_images.delete_original(directory, image_id)
+    helper_images.delete_derivatives(directory, "post_imgs", image_id)
 
 
 def update_submission_achievements(cur):
@@ -242,16 +393,18 @@ def update_submission_achievements(cur):
         cur: Cursor for the SQLite database.
     """
     # Award achievement ID 7 - Express yourself if necessary
-    helper_achievements.apply_achievement(session["username"], 7)
+    unlocks = [(session["username"], 7)]
 
-    cur.execute("SELECT * FROM POSTS WHERE username=?;", (session["username"],))
-    num_posts = cur.fetchall()
+    cur.execute("SELECT COUNT(*) FROM POSTS WHERE username=?;", (session["username"],))
+    num_posts = cur.fetchone()[0]
     # Award achievement ID 8 - 5 posts if necessary
-    if len(num_posts) >= 5:
-        helper_achievements.apply_achievement(session["username"], 8)
+    if num_posts >= 5:
+        unlocks.append((session["username"], 8))
     # Award achievement ID 9 - 20 posts, if necessary
-    if len(num_posts) >= 20:
-        helper_achievements.apply_achievement(session["username"], 9)
+    if num_posts >= 20:
+        unlocks.append((session["username"], 9))
+
+    helper_achievements.award_achievements(unlocks)
 
 
 def validate_youtube(url: str):
@@ -279,11 +432,6 @@ def get_account_type(username):
     Returns the type of an account for username
         username: The username to check the type for
     """
-    with sqlite3.connect("db.sqlite3") as conn:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT type FROM ACCOUNTS WHERE username=?;",
-            (username,),
-        )
-
-        return cur.fetchone()
+    user = helper_profile.get_user(username)
+    if user:
+        return (user.account_type,)
@@ -0,0 +1,202 @@
+"""
+Tracks which SocketIO sessions each user has connected to chat with, so
+messages can be delivered to them.
+
+The in-process registry only sees users connected to the same worker. The
+SQLite registry is shared by every worker using the database, and with the
+SocketIO message queue set up, emitting to a session reaches whichever
+worker holds it.
+
+Workers renew their SQLite sessions every third of PRESENCE_TTL seconds.
+Sessions held by a worker which crashed stop counting once they expire, and
+are cleared straight away when a worker with the same PRESENCE_WORKER_ID
+starts again.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import student_network.helpers.helper_database as helper_database
+from flask import current_app
+
+_registries = {}
+_registries_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+
+class PresenceRegistry:
+    """
+    The operations every presence backend provides.
+    """
+
+    def register(self, username: str, sid: str):
+        """
+        Records that a user is connected with a session.
+
+        Args:
+            username: The user who connected.
+            sid: The SocketIO session ID.
+        """
+        raise NotImplementedError
+
+    def unregister(self, sid: str):
+        """
+        Forgets a session once it disconnects.
+
+        Args:
+            sid: The SocketIO session ID.
+        """
+        raise NotImplementedError
+
+    def lookup(self, username: str) -> list:
+        """
+        Gets the sessions a user is connected with.
+
+        Args:
+            username: The user to find.
+
+        Returns:
+            The user's session IDs, empty if they are offline.
+        """
+        raise NotImplementedError
+
+
+class MemoryPresence(PresenceRegistry):
+    """
+    Presence kept in this process, for running a single worker.
+    """
+
+    def __init__(self, path: str = None):
+        self._sessions = defaultdict(set)
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def register(self, username: str, sid: str):
+        with self._lock:
+            self._unregister(sid)
+            self._sessions[username].add(sid)
+            self._users[sid] = username
+
+    def unregister(self, sid: str):
+        with self._lock:
+            self._unregister(sid)
+
+    def _unregister(self, sid: str):
+        username = self._users.pop(sid, None)
+        if username is not None:
+            self._sessions[username].discard(sid)
+            if not self._sessions[username]:
+                del self._sessions[username]
+
+    def lookup(self, username: str) -> list:
+        with self._lock:
+            return sorted(self._sessions.get(username, ()))
+
+
+class SQLitePresence(PresenceRegistry):
+    """
+    Presence kept in the Presence table, shared by every worker process
+    using the database.
+    """
+
+    def __init__(self, path: str, worker: str = None, ttl: int = None):
+        """
+        Args:
+            path: The database file.
+            worker: The name of this worker, defaulting to the
+                PRESENCE_WORKER_ID setting or else one unique to this process.
+            ttl: The seconds a session counts as connected without being
+                renewed, defaulting to the PRESENCE_TTL setting.
+        """
+        self.path = path
+        self.worker = worker or current_app.config["PRESENCE_WORKER_ID"]
+        if not self.worker:
+            self.worker = "{}:{}:{}".format(
+                socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8]
+            )
+        self.ttl = ttl or current_app.config["PRESENCE_TTL"]
+        # Sessions left by this worker's previous run were disconnected
+        # when it stopped.
+        with helper_database.get_pool(self.path).connection() as conn:
+            conn.execute("DELETE FROM Presence WHERE worker=?;", (self.worker,))
+        threading.Thread(
+            target=self._renew_forever, name="presence-heartbeat", daemon=True
+        ).start()
+
+    def register(self, username: str, sid: str):
+        with helper_database.get_pool(self.path).connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO Presence (sid, username, worker, expires) "
+                "VALUES (?, ?, ?, ?);",
+                (sid, username, self.worker, int(time.time()) + self.ttl),
+            )
+
+    def unregister(self, sid: str):
+        with helper_database.get_pool(self.path).connection() as conn:
+            conn.execute("DELETE FROM Presence WHERE sid=?;", (sid,))
+
+    def lookup(self, username: str) -> list:
+        with helper_database.get_pool(self.path).connection() as conn:
+            rows = conn.execute(
+                "SELECT sid FROM Presence WHERE username=? AND expires>? "
+                "ORDER BY sid;",
+                (username, int(time.time())),
+            ).fetchall()
+        return [x[0] for x in rows]
+
+    def renew(self):
+        """
+        Extends this worker's sessions and deletes every expired session.
+        """
+        now = int(time.time())
+        with helper_database.get_pool(self.path).connection() as conn:
+            conn.execute(
+                "UPDATE Presence SET expires=? WHERE worker=?;",
+                (now + self.ttl, self.worker),
+            )
+            conn.execute("DELETE FROM Presence WHERE expires<=?;", (now,))
+
+    def _renew_forever(self):
+        while True:
+            time.sleep(self.ttl / 3)
+            try:
+                self.renew()
+            except Exception:
+                logger.exception("Failed to renew chat sessions.")
+
+
+BACKENDS = {"memory": MemoryPresence, "sqlite": SQLitePresence}
+
+
+def get_presence() -> PresenceRegistry:
+    """
+    Gets the presence registry chosen by the PRESENCE_BACKEND setting for the
+    app's database, creating it on first use.
+
+    Returns:
+        The presence registry.
+    """
+    backend = current_app.config["PRESENCE_BACKEND"]
+    path = current_app.config.get("DATABASE", helper_database.DEFAULT_DB_PATH)
+    with _registries_lock:
+        if (backend, path) not in _registries:
+            _registries[(backend, path)] = BACKENDS[backend](path)
+        return _registries[(backend, path)]
+
+
+def init_app(app):
+    """
+    Sets the presence defaults.
+
+    Args:
+        app: The Flask application.
+    """
+    app.config.setdefault("PRESENCE_BACKEND", "memory")
+    app.config.setdefault("PRESENCE_TTL", 90)
+    # A name kept by the same worker across restarts, such as from its
+    # process manager, lets it clear its old sessions as soon as it starts.
+    app.config.setdefault("PRESENCE_WORKER_ID", os.environ.get("PRESENCE_WORKER_ID"))
@@ -1,18 +1,127 @@
 """
 Performs checks and actions to help the profile system work effectively.
 """
+import json
 import os
-import sqlite3
-import uuid
 from datetime import date, datetime
-from typing import List, Tuple
+from math import isqrt
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
 
+import student_network.helpers.helper_cache as helper_cache
+import student_network.helpers.helper_database as helper_database
 import student_network.helpers.helper_general as helper_general
-from PIL import Image
-from werkzeug.utils import secure_filename
+import student_network.helpers.helper_images as helper_images
+from flask import current_app, g, has_app_context
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "db.sqlite3")
+USER_CACHE_SIZE = 4096
+USER_CACHE_TTL = 60
+# Experience points needed to leave level 1, and how many more each level
+# after needs than the one before.
+LEVEL_ONE_EXPERIENCE = 100
+LEVEL_EXPERIENCE_INCREASE = 15
+
+
+class UserMetadata(NamedTuple):
+    """
+    The details of a user shown alongside their posts, comments and
+    messages.
+    """
+
+    profile_picture: Optional[str]
+    degree_id: Optional[int]
+    degree: Optional[str]
+    account_type: str
+
+
+# Shared by every request in the process, keyed by database and username.
+_user_cache = helper_cache.TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def _get_request_users() -> dict:
+    """
+    Gets the user details already looked up while handling this request.
+
+    Returns:
+        The request's user details by username.
+    """
+    if not has_app_context():
+        return {}
+    if "user_metadata" not in g:
+        g.user_metadata = {}
+    return g.user_metadata
+
+
+def get_users(usernames: Iterable[str]) -> Dict[str, Optional[UserMetadata]]:
+    """
+    Gets the profile picture, degree and account type of several users,
+    looking up any which aren't cached with a single query.
+
+    Args:
+        usernames: The users to get the details of.
+
+    Returns:
+        The details of each user by username, or None if the user doesn't
+        exist.
+    """
+    request_users = _get_request_users()
+    database = current_app.config["DATABASE"]
+    users = {}
+    missing = []
+    for username in set(usernames):
+        if username in request_users:
+            users[username] = request_users[username]
+            continue
+        user = _user_cache.get((database, username))
+        if user is None:
+            missing.append(username)
+        else:
+            users[username] = request_users[username] = user
+
+    if missing:
+        with helper_database.get_db() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT ACCOUNTS.username, UserProfile.profilepicture, "
+                "UserProfile.degree, Degree.degree, ACCOUNTS.type FROM ACCOUNTS "
+                "LEFT JOIN UserProfile ON UserProfile.username=ACCOUNTS.username "
+                "LEFT JOIN Degree ON Degree.degreeId=UserProfile.degree "
+                "WHERE ACCOUNTS.username IN (SELECT value FROM json_each(?));",
+                (json.dumps(missing),),
+            )
+            for username, *details in cur.fetchall():
+                users[username] = UserMetadata(*details)
+                _user_cache.set((database, username), users[username])
+        for username in missing:
+            request_users[username] = users.setdefault(username, None)
+
+    return users
+
+
+def get_user(username: str) -> Optional[UserMetadata]:
+    """
+    Gets the profile picture, degree and account type of a user.
+
+    Args:
+        username: The user to get the details of.
+
+    Returns:
+        The details of the user, or None if the user doesn't exist.
+    """
+    return get_users([username])[username]
+
+
+def invalidate_user(username: str):
+    """
+    Forgets the cached details of a user after their profile or account
+    changes.
+
+    Args:
+        username: The user whose details changed.
+    """
+    _get_request_users().pop(username, None)
+    _user_cache.delete((current_app.config["DATABASE"], username))
 
 
 def calculate_age(born: datetime) -> int:
@@ -40,14 +149,49 @@ def get_degree(username: str) -> Tuple[int, str]:
         The degree of the user.
         The degreeID of the user.
     """
-    with sqlite3.connect("db.sqlite3") as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT degree FROM UserProfile WHERE username=?;", (username,))
-        degree_id = cur.fetchone()
-        if degree_id:
-            cur.execute("SELECT degree FROM Degree WHERE degreeId=?;", (degree_id[0],))
-            degree = cur.fetchone()
-            return degree_id[0], degree[0]
+    user = get_user(username)
+    if user and user.degree_id is not None:
+        return user.degree_id, user.degree
+
+
+def get_level_threshold(level: int) -> int:
+    """
+    Gets the total experience points needed to reach a level, which is the
+    sum of the arithmetic series of experience needed for each level below.
+
+    Args:
+        level: The level to reach.
+
+    Returns:
+        The experience points needed.
+    """
+    n = level - 1
+    return n * LEVEL_ONE_EXPERIENCE + LEVEL_EXPERIENCE_INCREASE * n * (n - 1) // 2
+
+
+def calculate_level(experience: int) -> List[int]:
+    """
+    Works out the level for an amount of experience, solving the quadratic
+    for the series of level thresholds instead of counting up level by
+    level.
+
+    Args:
+        experience: The user's total experience points.
+
+    Returns:
+        The level, XP gained since reaching it, and XP to reach the next level.
+    """
+    a = LEVEL_EXPERIENCE_INCREASE
+    b = 2 * LEVEL_ONE_EXPERIENCE - a
+    # Largest n with (a * n^2 + b * n) / 2 <= experience. isqrt rounds down,
+    # which can't move the result below the next integer root.
+    n = (isqrt(b * b + 8 * a * max(experience, 0)) - b) // (2 * a)
+    level = n + 1
+    return [
+        level,
+        experience - get_level_threshold(level),
+        LEVEL_ONE_EXPERIENCE + LEVEL_EXPERIENCE_INCREASE * n,
+    ]
 
 
 def get_level(username: str) -> List[int]:
@@ -61,17 +205,17 @@ def get_level(username: str) -> List[int]:
     Returns:
         The user's level, XP, and XP to reach the next level.
     """
-    level = 1
-    xp_next_level = 100
-    xp_increase_per_level = 15
-
-    exp = helper_general.get_exp(username)
-    while exp >= xp_next_level:
-        level += 1
-        exp -= xp_next_level
-        xp_next_level += xp_increase_per_level
-
-    return [level, exp, xp_next_level]
+    with helper_database.get_db() as conn:
+        row = conn.execute(
+            "SELECT experience, level, next_level_experience FROM UserLevel "
+            "WHERE username=?;",
+            (username,),
+        ).fetchone()
+    if row is None:
+        return calculate_level(0)
+    exp, level, next_level_experience = row
+    threshold = get_level_threshold(level)
+    return [level, exp - threshold, next_level_experience - threshold]
 
 
 def get_profile_picture(username: str) -> str:
@@ -84,14 +228,9 @@ def get_profile_picture(username: str) -> str:
     Returns:
         The profile picture of the user.
     """
-    with sqlite3.connect("db.sqlite3") as conn:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT profilepicture FROM UserProfile WHERE username=?;", (username,)
-        )
-        row = cur.fetchone()
-        if row:
-            return row[0]
+    user = get_user(username)
+    if user:
+        return user.profile_picture
 
 
 def read_socials(username: str):
@@ -102,7 +241,7 @@ def read_socials(username: str):
     Returns:
         The social media accounts of that user.
     """
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         socials = {}
         # Gets the user's socials
@@ -186,15 +325,16 @@ def validate_profile_pic(file) -> Tuple[bool, List[str], str]:
     message = []
     file_name_hashed = ""
 
-    # Hashes the name of the file and resizes it.
+    # Stores the file under a hashed name and resizes it in the background.
     if helper_general.is_allowed_photo_file(file.filename):
-        secure_filename(file.filename)
-        file_name_hashed = str(uuid.uuid4())
-        file_path = os.path.join("./static/images" + "//avatars", file_name_hashed)
-        img = Image.open(file)
-        img = img.resize((400, 400))
-        img = img.convert("RGB")
-        img.save(file_path + ".jpg")
+        try:
+            file_name_hashed = helper_images.submit(file, "avatars")
+        except ValueError:
+            valid = False
+            message.append("Your file must be an image.")
+        except helper_images.QueueFull:
+            valid = False
+            message.append("Too many images are being uploaded, please try again.")
     elif file:
         valid = False
         message.append("Your file must be an image.")
@@ -0,0 +1,214 @@
+"""
+Recommends connections by scoring friends of friends, found with the social
+graph index, and users with shared hobbies, interests or degrees, loaded in
+bulk.
+"""
+import heapq
+from collections import defaultdict
+
+import student_network.helpers.helper_cache as helper_cache
+import student_network.helpers.helper_connections as helper_connections
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_graph as helper_graph
+import student_network.helpers.helper_profile as helper_profile
+from flask import current_app
+
+RECOMMENDATION_COUNT = 5
+RECOMMENDATION_CACHE_SIZE = 4096
+RECOMMENDATION_CACHE_TTL = 300
+
+# Points for each mutual connection, depending on whether the user has the
+# mutual connection as a close friend, and whether the mutual connection is
+# also close with the candidate.
+MUTUAL_SCORE = 10
+CLOSE_MUTUAL_SCORE = 20
+SUPER_CLOSE_MUTUAL_SCORE = 50
+# Points for each shared hobby or interest, and for a shared degree.
+SHARED_SCORE = 5
+NO_DEGREE = 1
+
+# Recommendations by database and username.
+_recommendation_cache = helper_cache.TTLCache(
+    RECOMMENDATION_CACHE_SIZE, RECOMMENDATION_CACHE_TTL
+)
+
+
+def get_shared_users(cur, table: str, column: str, username: str) -> dict:
+    """
+    Gets the other users who share each of the user's hobbies or interests.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        table: UserHobby or UserInterests.
+        column: hobby or interest.
+        username: The user to find shared hobbies or interests for.
+
+    Returns:
+        The users sharing each hobby or interest, in the order the user's
+        hobbies or interests are stored.
+    """
+    cur.execute(
+        "SELECT Mine.{1}, Other.username FROM {0} AS Mine "
+        "INNER JOIN {0} AS Other ON Other.{1}=Mine.{1} "
+        "WHERE Mine.username=:username AND Other.username!=:username "
+        "ORDER BY Mine.{1};".format(table, column),
+        {"username": username},
+    )
+    shared = {}
+    for value, other in cur.fetchall():
+        shared.setdefault(value, set()).add(other)
+    return shared
+
+
+def score_candidates(
+    mutuals: dict,
+    close_friends: set,
+    graph: helper_graph.SocialGraph,
+    hobbies: dict,
+    interests: dict,
+    shared_degree: set,
+) -> dict:
+    """
+    Scores each candidate on mutual connections, hobbies, interests and
+    degree.
+
+    Args:
+        mutuals: The mutual connections with each candidate.
+        close_friends: The user's close friends.
+        graph: The social graph index, for close friendships between mutual
+            connections and candidates.
+        hobbies: The candidates sharing each of the user's hobbies.
+        interests: The candidates sharing each of the user's interests.
+        shared_degree: The candidates studying the same degree.
+
+    Returns:
+        The mutual connection, hobby, interest and degree scores of each
+        candidate.
+    """
+    scores = defaultdict(lambda: [0, 0, 0, 0])
+    for candidate, connections in mutuals.items():
+        for conec in connections:
+            if conec not in close_friends:
+                scores[candidate][0] += MUTUAL_SCORE
+            elif graph.is_close_friend(conec, candidate) or graph.is_close_friend(
+                candidate, conec
+            ):
+                scores[candidate][0] += SUPER_CLOSE_MUTUAL_SCORE
+            else:
+                scores[candidate][0] += CLOSE_MUTUAL_SCORE
+    for index, shared in ((1, hobbies), (2, interests)):
+        for users in shared.values():
+            for candidate in users:
+                scores[candidate][index] += SHARED_SCORE
+    for candidate in shared_degree:
+        scores[candidate][3] += SHARED_SCORE
+    return scores
+
+
+def recommend(username: str, count: int = RECOMMENDATION_COUNT) -> list:
+    """
+    Works out the best connections to recommend to a user.
+
+    Args:
+        username: The user to recommend connections to.
+        count: The number of recommendations.
+
+    Returns:
+        List of recommended connections for a user, the reason for each, and
+        their score.
+    """
+    graph = helper_graph.get_graph()
+    invalid = helper_connections.get_pending_connections(username)
+    invalid |= helper_connections.get_blocked_users(username)
+    invalid |= graph.get_connections(username)
+    invalid.add(username)
+
+    mutuals = defaultdict(list)
+    for conec in sorted(graph.get_connections(username)):
+        for candidate in graph.get_connections(conec):
+            if candidate not in invalid:
+                mutuals[candidate].append(conec)
+    close_friends = graph.get_close_friends(username)
+
+    with helper_database.get_db() as conn:
+        cur = conn.cursor()
+        hobbies = get_shared_users(cur, "UserHobby", "hobby", username)
+        interests = get_shared_users(cur, "UserInterests", "interest", username)
+        for shared in (hobbies, interests):
+            for users in shared.values():
+                users -= invalid
+
+        degree = helper_profile.get_degree(username)
+        shared_degree = set()
+        if degree and degree[0] != NO_DEGREE:
+            cur.execute(
+                "SELECT username FROM UserProfile WHERE degree=?;", (degree[0],)
+            )
+            shared_degree = {x[0] for x in cur.fetchall()} - invalid
+
+    scores = score_candidates(
+        mutuals, close_friends, graph, hobbies, interests, shared_degree
+    )
+    best = heapq.nsmallest(count, scores, key=lambda x: (-sum(scores[x]), x))
+
+    recommendations = []
+    for student in best:
+        simlist = []
+        index = scores[student].index(max(scores[student]))
+        if index == 0:
+            connections = mutuals[student]
+            simlist = [x for x in connections if x in close_friends] + [
+                x for x in connections if x not in close_friends
+            ]
+            main = str(len(connections)) + " mutual connections including "
+        elif index == 1:
+            simlist = [x for x, users in hobbies.items() if student in users]
+            main = "You both enjoy hobbies including "
+        elif index == 2:
+            simlist = [x for x, users in interests.items() if student in users]
+            main = "You are both interested in "
+        else:
+            simlist = [degree[1]]
+            main = "You both study "
+
+        main += helper_connections.list_to_string(simlist[:3])
+        recommendations.append([student, main, sum(scores[student])])
+
+    return recommendations
+
+
+def get_recommendations(username: str) -> list:
+    """
+    Gets the recommended connections for a user, working them out only if
+    they aren't cached.
+
+    Args:
+        username: The user to recommend connections to.
+
+    Returns:
+        List of recommended connections for a user, the reason for each, and
+        their score.
+    """
+    key = (current_app.config["DATABASE"], username)
+    recommendations = _recommendation_cache.get(key)
+    if recommendations is None:
+        recommendations = recommend(username)
+        _recommendation_cache.set(key, recommendations)
+    return recommendations
+
+
+def invalidate(*usernames: str):
+    """
+    Forgets the cached recommendations of users and of everyone connected to
+    them, after their connections or close friends change.
+
+    Args:
+        usernames: The users whose connections changed.
+    """
+    database = current_app.config["DATABASE"]
+    graph = helper_graph.get_graph()
+    affected = set(usernames)
+    for username in usernames:
+        affected |= graph.get_connections(username)
+    for username in affected:
+        _recommendation_cache.delete((database, username))
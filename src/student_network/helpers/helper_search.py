@@ -0,0 +1,251 @@
+"""
+Searches members, posts and comments through full text indexes which
+triggers keep in step with the tables they cover.
+"""
+import re
+import sys
+from heapq import merge
+
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_general as helper_general
+import student_network.helpers.helper_paging as helper_paging
+from markupsafe import escape
+
+SEARCH_PAGE_SIZE = 10
+MAX_SEARCH_PAGE_SIZE = 50
+# Relevance weights of the indexed columns, in the order they were created:
+# username, name, hobbies, interests and degree.
+MEMBER_WEIGHTS = (10.0, 5.0, 2.0, 2.0, 1.0)
+SNIPPET_TOKENS = 16
+# Quoted phrases, optionally ending in * to match as a prefix, or single
+# words.
+QUERY_TERM = re.compile(r'"([^"]*)"(\*?)|(\S+)')
+# The posts a user can see, as on their feed: their own, and their
+# connections' unless private or only for close friends they aren't. Each
+# check is an index lookup, so matches can be filtered one at a time.
+VISIBLE_POST = (
+    "POSTS.privacy IS NOT 'deleted' AND (POSTS.username=:username OR ("
+    "POSTS.privacy!='private' AND EXISTS (SELECT 1 FROM Connection "
+    "WHERE connection_type='connected' AND ("
+    "(user1=:username AND user2=POSTS.username) OR "
+    "(user1=POSTS.username AND user2=:username))) AND ("
+    "POSTS.privacy!='close' OR EXISTS (SELECT 1 FROM CloseFriend "
+    "WHERE user1=POSTS.username AND user2=:username)))) "
+)
+
+
+def build_match(columns: str, text: str):
+    """
+    Builds a full text query matching every word of the text as a prefix.
+
+    Args:
+        columns: The index columns to match in, such as "{username name}".
+        text: What the user typed.
+
+    Returns:
+        The query, or None if the text has no words.
+    """
+    words = ['"{}"*'.format(x.replace('"', '""')) for x in text.split()]
+    if not words:
+        return None
+    return "{} : ({})".format(columns, " ".join(words))
+
+
+def find_prefixed(values: str, text: str):
+    """
+    Finds the first of a member's hobbies or interests which a search
+    matched.
+
+    Args:
+        values: The hobbies or interests from the index, separated by commas.
+        text: What the user searched for.
+
+    Returns:
+        The matching hobby or interest, or None if there isn't one.
+    """
+    words = text.lower().split()
+    for value in (values or "").split(", "):
+        if words and all(
+            any(x.startswith(word) for x in value.lower().split()) for word in words
+        ):
+            return value
+    return None
+
+
+def search_members(
+    chars: str = "",
+    hobby: str = "",
+    interest: str = "",
+    offset: int = 0,
+    limit: int = SEARCH_PAGE_SIZE,
+) -> tuple:
+    """
+    Searches for members by username or name, hobbies and interests,
+    matching the start of each word. Members found by username or name are
+    ranked most relevant first, and the rest are in the order they joined.
+
+    Args:
+        chars: Text to find in usernames and names.
+        hobby: Text to find in hobbies.
+        interest: Text to find in interests.
+        offset: The number of better matches to skip.
+        limit: The maximum number of members to get.
+
+    Returns:
+        The username, matching hobby, matching interest, profile picture and
+        degree of each member, and the offset of the next page or None if
+        there are no more.
+    """
+    queries = [
+        build_match("{username name}", chars),
+        build_match("hobbies", hobby),
+        build_match("interests", interest),
+    ]
+    match = " AND ".join(x for x in queries if x)
+    conn = helper_database.get_db()
+    if queries[0]:
+        rows = conn.execute(
+            "SELECT username, hobbies, interests, picture, degree FROM MemberSearch "
+            "WHERE MemberSearch MATCH ? "
+            "ORDER BY bm25(MemberSearch, ?, ?, ?, ?, ?), username "
+            "LIMIT ? OFFSET ?;",
+            (match, *MEMBER_WEIGHTS, limit + 1, offset),
+        ).fetchall()
+    elif match:
+        # Filtering by hobby or interest alone has nothing to rank by, so the
+        # index is read in its own order and stops once the page is full.
+        rows = conn.execute(
+            "SELECT username, hobbies, interests, picture, degree FROM MemberSearch "
+            "WHERE MemberSearch MATCH ? ORDER BY rowid LIMIT ? OFFSET ?;",
+            (match, limit + 1, offset),
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT username, hobbies, interests, picture, degree FROM MemberSearch "
+            "ORDER BY rowid LIMIT ? OFFSET ?;",
+            (limit + 1, offset),
+        ).fetchall()
+
+    next_offset = offset + limit if len(rows) > limit else None
+    members = [
+        (
+            username,
+            find_prefixed(hobbies, hobby),
+            find_prefixed(interests, interest),
+            picture,
+            degree,
+        )
+        for username, hobbies, interests, picture, degree in rows[:limit]
+    ]
+    return members, next_offset
+
+
+def parse_query(text: str):
+    """
+    Builds a full text query from what a user typed, keeping "quoted
+    phrases" together and matching words ending in * as prefixes. Any other
+    query syntax is searched for as plain text.
+
+    Args:
+        text: What the user typed.
+
+    Returns:
+        The query, or None if the text has nothing to search for.
+    """
+    terms = []
+    for phrase, phrase_prefix, word in QUERY_TERM.findall(text):
+        if word:
+            prefix = word.endswith("*")
+            phrase, phrase_prefix = word.rstrip("*"), "*" if prefix else ""
+        if phrase.strip():
+            terms.append('"{}"{}'.format(phrase.replace('"', '""'), phrase_prefix))
+    return " ".join(terms) or None
+
+
+def format_snippet(snippet: str) -> str:
+    """
+    Escapes a snippet for showing as HTML, marking the matched words.
+
+    Args:
+        snippet: A snippet with matches between STX and ETX characters.
+
+    Returns:
+        The snippet as HTML with matches in <mark> tags.
+    """
+    return str(escape(snippet)).replace("\x02", "<mark>").replace("\x03", "</mark>")
+
+
+def search_posts(
+    username: str, text: str, limit: int = SEARCH_PAGE_SIZE, cursor: str = None
+) -> tuple:
+    """
+    Searches the posts and comments a user is allowed to see, newest first.
+
+    Each index is read newest first from the cursor and stops once it has
+    found a page of visible matches, so the cost depends on the page size
+    rather than how many posts match. The two are then merged by time.
+
+    Args:
+        username: The user searching.
+        text: What the user typed.
+        limit: The maximum number of matches to get.
+        cursor: The next cursor from the previous page, or None for the
+            newest matches.
+
+    Returns:
+        The post ID, comment ID (None for a post), author, age and
+        highlighted snippet of each match, and the cursor for older matches
+        or None if there are none.
+    """
+    post_before, comment_before = sys.maxsize, sys.maxsize
+    if cursor:
+        post_before, comment_before = helper_paging.decode_cursor(cursor, 2)
+    query = parse_query(text)
+    if query is None:
+        return [], None
+
+    parameters = {
+        "username": username,
+        "query": query,
+        "post_before": post_before,
+        "comment_before": comment_before,
+        "tokens": SNIPPET_TOKENS,
+        "limit": limit + 1,
+    }
+    conn = helper_database.get_db()
+    posts = conn.execute(
+        "SELECT POSTS.timestamp, POSTS.postId, NULL, POSTS.username, "
+        "snippet(PostSearch, 0, char(2), char(3), '...', :tokens) "
+        "FROM PostSearch CROSS JOIN POSTS ON POSTS.postId=PostSearch.rowid "
+        "WHERE PostSearch MATCH :query AND PostSearch.rowid<:post_before AND "
+        + VISIBLE_POST
+        + "ORDER BY PostSearch.rowid DESC LIMIT :limit;",
+        parameters,
+    ).fetchall()
+    comments = conn.execute(
+        "SELECT Comments.timestamp, Comments.postId, Comments.commentId, "
+        "Comments.username, "
+        "snippet(CommentSearch, 0, char(2), char(3), '...', :tokens) "
+        "FROM CommentSearch "
+        "CROSS JOIN Comments ON Comments.commentId=CommentSearch.rowid "
+        "CROSS JOIN POSTS ON POSTS.postId=Comments.postId "
+        "WHERE CommentSearch MATCH :query "
+        "AND CommentSearch.rowid<:comment_before AND "
+        + VISIBLE_POST
+        + "ORDER BY CommentSearch.rowid DESC LIMIT :limit;",
+        parameters,
+    ).fetchall()
+
+    rows = list(merge(posts, comments, key=lambda x: x[0] or 0, reverse=True))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = helper_paging.encode_cursor(
+            min((x[1] for x in rows if x[2] is None), default=post_before),
+            min((x[2] for x in rows if x[2] is not None), default=comment_before),
+        )
+    ages = helper_general.format_ages(x[0] or 0 for x in rows)
+    return [
+        (post_id, comment_id, author, age, format_snippet(snippet))
+        for (_, post_id, comment_id, author, snippet), age in zip(rows, ages)
+    ], next_cursor
@@ -0,0 +1,243 @@
+"""
+Maintains the precomputed home timeline used when feeds are built by fanning
+posts out to readers as they are written.
+"""
+import student_network.helpers.helper_database as helper_database
+from flask import current_app
+
+DEFAULT_FANOUT_LIMIT = 1000
+
+# The readers of each author, with the visibility level of the author's posts
+# to that reader: 2 for their own posts, 1 if the author has marked the reader
+# as a close friend, and 0 for any other connection.
+READERS = (
+    "SELECT username AS reader, username AS author, 2 AS level FROM ACCOUNTS "
+    "UNION ALL "
+    "SELECT user2, user1, EXISTS (SELECT 1 FROM CloseFriend "
+    "WHERE CloseFriend.user1=Connection.user1 "
+    "AND CloseFriend.user2=Connection.user2) "
+    "FROM Connection WHERE connection_type='connected' AND user1!=user2 "
+    "UNION ALL "
+    "SELECT user1, user2, EXISTS (SELECT 1 FROM CloseFriend "
+    "WHERE CloseFriend.user1=Connection.user2 "
+    "AND CloseFriend.user2=Connection.user1) "
+    "FROM Connection WHERE connection_type='connected' AND user1!=user2"
+)
+
+
+def is_enabled() -> bool:
+    """
+    Checks whether feeds are read from the precomputed timeline.
+
+    Returns:
+        Whether fan-out on write is switched on (True/False).
+    """
+    return bool(current_app.config.get("FEED_FANOUT", False))
+
+
+def get_fanout_limit() -> int:
+    """
+    Gets the number of connections above which an author's posts are read on
+    demand instead of being copied to every reader's timeline.
+
+    Returns:
+        The connection limit for fan-out on write.
+    """
+    return current_app.config.get("FEED_FANOUT_LIMIT", DEFAULT_FANOUT_LIMIT)
+
+
+def is_exempt(cur, username: str) -> bool:
+    """
+    Checks whether a user's posts are left out of the timeline.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        username: The author to check.
+
+    Returns:
+        Whether the author's posts are read on demand (True/False).
+    """
+    cur.execute("SELECT 1 FROM TimelineExempt WHERE username=?;", (username,))
+    return cur.fetchone() is not None
+
+
+def get_post_ids(cur, username: str, before_id: int, number: int) -> list:
+    """
+    Gets a page of post IDs from the user's timeline.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        username: The user viewing the feed.
+        before_id: Only posts older than this ID are returned.
+        number: The maximum number of posts.
+
+    Returns:
+        The IDs of the posts, newest first.
+    """
+    cur.execute(
+        "SELECT postId FROM Timeline WHERE username=? AND postId < ? "
+        "ORDER BY postId DESC LIMIT ?;",
+        (username, before_id, number),
+    )
+    return [x[0] for x in cur.fetchall()]
+
+
+def add_post(cur, post_id: int, author: str, privacy: str):
+    """
+    Copies a new post into the timeline of everyone who can see it.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        post_id: The ID of the post.
+        author: The user who wrote the post.
+        privacy: The privacy setting of the post.
+    """
+    if not is_enabled() or is_exempt(cur, author):
+        return
+    cur.execute(
+        "INSERT OR IGNORE INTO Timeline (username, postId) "
+        "SELECT reader, :post_id FROM (" + READERS + ") "
+        "WHERE author=:author AND :privacy!='deleted' "
+        "AND (level=2 OR :privacy!='private') "
+        "AND (level>=1 OR :privacy!='close');",
+        {"post_id": post_id, "author": author, "privacy": privacy},
+    )
+
+
+def remove_post(cur, post_id: int):
+    """
+    Removes a post from every timeline.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        post_id: The ID of the post.
+    """
+    if is_enabled():
+        cur.execute("DELETE FROM Timeline WHERE postId=?;", (post_id,))
+
+
+def refresh_reader(cur, author: str, reader: str):
+    """
+    Rebuilds the author's posts in one reader's timeline after the
+    connection or close friendship between them changes.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        author: The user who wrote the posts.
+        reader: The user whose timeline is rebuilt.
+    """
+    if not is_enabled():
+        return
+    cur.execute(
+        "DELETE FROM Timeline WHERE username=? "
+        "AND postId IN (SELECT postId FROM POSTS WHERE username=?);",
+        (reader, author),
+    )
+    if is_exempt(cur, author):
+        return
+    cur.execute(
+        "INSERT OR IGNORE INTO Timeline (username, postId) "
+        "SELECT reader, postId FROM (" + READERS + ") AS Readers "
+        "INNER JOIN POSTS ON POSTS.username=Readers.author "
+        "WHERE reader=:reader AND author=:author AND privacy!='deleted' "
+        "AND (level=2 OR privacy!='private') "
+        "AND (level>=1 OR privacy!='close');",
+        {"reader": reader, "author": author},
+    )
+
+
+def update_exemption(cur, username: str):
+    """
+    Stops fanning out a user's posts once their connection count passes the
+    limit, removing their posts from every timeline.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        username: The user whose connections changed.
+    """
+    if not is_enabled() or is_exempt(cur, username):
+        return
+    cur.execute(
+        "SELECT COUNT(*) FROM Connection "
+        "WHERE (user1=? OR user2=?) AND connection_type='connected';",
+        (username, username),
+    )
+    if cur.fetchone()[0] > get_fanout_limit():
+        cur.execute("INSERT INTO TimelineExempt (username) VALUES (?);", (username,))
+        cur.execute(
+            "DELETE FROM Timeline "
+            "WHERE postId IN (SELECT postId FROM POSTS WHERE username=?);",
+            (username,),
+        )
+
+
+def update_connection(cur, user1: str, user2: str):
+    """
+    Brings both users' timelines up to date after a connection between them
+    is made or removed.
+
+    Args:
+        cur: Cursor for the SQLite database.
+        user1: One user in the connection.
+        user2: The other user in the connection.
+    """
+    update_exemption(cur, user1)
+    update_exemption(cur, user2)
+    refresh_reader(cur, user1, user2)
+    refresh_reader(cur, user2, user1)
+
+
+def backfill():
+    """
+    Rebuilds every timeline from the existing posts and connections.
+
+    Returns:
+        The number of timeline entries and the number of authors whose posts
+        are read on demand.
+    """
+    with helper_database.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM Timeline;")
+        cur.execute("DELETE FROM TimelineExempt;")
+        cur.execute(
+            "INSERT INTO TimelineExempt (username) "
+            "SELECT username FROM (SELECT user1 AS username FROM Connection "
+            "WHERE connection_type='connected' UNION ALL "
+            "SELECT user2 FROM Connection WHERE connection_type='connected') "
+            "GROUP BY username HAVING COUNT(*) > ?;",
+            (get_fanout_limit(),),
+        )
+        exempt = cur.rowcount
+        cur.execute(
+            "INSERT OR IGNORE INTO Timeline (username, postId) "
+            "SELECT reader, postId FROM (" + READERS + ") AS Readers "
+            "INNER JOIN POSTS ON POSTS.username=Readers.author "
+            "WHERE author NOT IN (SELECT username FROM TimelineExempt) "
+            "AND privacy!='deleted' AND (level=2 OR privacy!='private') "
+            "AND (level>=1 OR privacy!='close');"
+        )
+        return cur.rowcount, exempt
+
+
+def init_app(app):
+    """
+    Sets the fan-out defaults and registers the backfill command.
+
+    Args:
+        app: The Flask application.
+    """
+    app.config.setdefault("FEED_FANOUT", False)
+    app.config.setdefault("FEED_FANOUT_LIMIT", DEFAULT_FANOUT_LIMIT)
+
+    @app.cli.command("backfill-timeline")
+    def backfill_timeline():
+        """
+        Rebuilds every home timeline from the existing posts. Run this before
+        switching on FEED_FANOUT.
+        """
+        entries, exempt = backfill()
+        print(
+            "Added {} timeline entries; {} authors are read on demand.".format(
+                entries, exempt
+            )
+        )
@@ -2,13 +2,23 @@
 Handles the view for achievements and related functionality.
 """
 
-import sqlite3
 
 import student_network.helpers.helper_achievements as helper_achievements
-import student_network.helpers.helper_connections as helper_connections
-import student_network.helpers.helper_general as helper_general
+import student_network.helpers.helper_leaderboard as helper_leaderboard
+import student_network.helpers.helper_paging as helper_paging
 import student_network.helpers.helper_profile as helper_profile
-from flask import Blueprint, render_template, request, session
+from flask import Blueprint, jsonify, render_template, request, session
+
+LEADERBOARD_SIZE = 25
+LEADERBOARD_PAGE_LIMIT = 100
+LEADERBOARD_FIELDS = (
+    "rank",
+    "username",
+    "experience",
+    "profile_picture",
+    "level",
+    "degree",
+)
 
 achievements_blueprint = Blueprint(
     "achievements", __name__, static_folder="static", template_folder="templates"
@@ -49,14 +59,36 @@ def achievements() -> object:
         "achievements.html",
         unlocked_achievements=unlocked_achievements,
         locked_achievements=locked_achievements,
-        requestCount=helper_connections.get_connection_request_count(),
-        allUsernames=helper_general.get_all_usernames(),
         percentage=percentage,
         percentage_color=percentage_color,
-        notifications=helper_general.get_notifications(),
     )
 
 
+def describe_rankings(rankings: list) -> list:
+    """
+    Adds the profile details shown on the leaderboard to each ranked user.
+
+    Args:
+        rankings: The rank, username and experience of each user.
+
+    Returns:
+        The rank, username, experience, profile picture, level and degree
+        of each user.
+    """
+    helper_profile.get_users(x[1] for x in rankings)
+    return [
+        (
+            rank,
+            username,
+            experience,
+            helper_profile.get_profile_picture(username),
+            helper_profile.calculate_level(experience)[0],
+            helper_profile.get_degree(username)[1],
+        )
+        for rank, username, experience in rankings
+    ]
+
+
 @achievements_blueprint.route("/leaderboard", methods=["GET"])
 def leaderboard() -> object:
     """
@@ -65,32 +97,19 @@ def leaderboard() -> object:
     Returns:
         The web page for viewing rankings.
     """
-    with sqlite3.connect("db.sqlite3") as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM UserLevel ORDER BY experience DESC")
-        top_users = cur.fetchall()
-        if top_users:
-            total_user_count = len(top_users)
-
-            my_ranking = helper_achievements.binary_search(
-                top_users,
-                (session["username"], helper_general.get_exp(session["username"])),
-            )
-
-            top_users = top_users[0 : min(25, len(top_users))]
-            top_users = list(
-                map(
-                    lambda x: (
-                        x[0],
-                        x[1],
-                        helper_profile.get_profile_picture(x[0]),
-                        helper_profile.get_level(x[0]),
-                        helper_profile.get_degree(x[0])[1],
-                    ),
-                    top_users,
-                )
-            )
-            percent = int(100 * (my_ranking / total_user_count))
+    rankings = helper_leaderboard.get_leaderboard()
+    total_user_count = len(rankings)
+    my_ranking = rankings.get_rank(session["username"])
+    if my_ranking is None:
+        # Users who have never earned experience are ranked after everyone.
+        total_user_count += 1
+        my_ranking = total_user_count
+    top_users = [
+        (x[1], x[2], x[3], x[4], x[5])
+        for x in describe_rankings(rankings.get_page(0, LEADERBOARD_SIZE))
+    ]
+    percent = int(100 * (my_ranking / total_user_count))
+
     session["prev-page"] = request.url
     if "error" in session:
         errors = session["error"]
@@ -98,22 +117,42 @@ def leaderboard() -> object:
         return render_template(
             "leaderboard.html",
             leaderboard=top_users,
-            requestCount=helper_connections.get_connection_request_count(),
-            allUsernames=helper_general.get_all_usernames(),
             myRanking=my_ranking,
             totalUserCount=total_user_count,
             percent=percent,
             errors=errors,
-            notifications=helper_general.get_notifications(),
         )
     else:
         return render_template(
             "leaderboard.html",
             leaderboard=top_users,
-            requestCount=helper_connections.get_connection_request_count(),
-            allUsernames=helper_general.get_all_usernames(),
             myRanking=my_ranking,
             totalUserCount=total_user_count,
             percent=percent,
-            notifications=helper_general.get_notifications(),
         )
+
+
+@achievements_blueprint.route("/leaderboard/page", methods=["GET"])
+def leaderboard_page() -> object:
+    """
+    Gets a page of the leaderboard, either from an offset or centred on the
+    logged in user when "around_me" is given.
+
+    Returns:
+        JSON with the total number of ranked users, the users on the page
+        and the offset of the next page.
+    """
+    try:
+        offset = helper_paging.get_offset()
+        limit = helper_paging.get_limit(LEADERBOARD_SIZE, LEADERBOARD_PAGE_LIMIT)
+    except ValueError:
+        return jsonify({"error": "Invalid offset or limit."}), 400
+
+    rankings = helper_leaderboard.get_leaderboard()
+    if "around_me" in request.args:
+        page = rankings.get_neighbours(session["username"], limit // 2)
+    else:
+        page = rankings.get_page(offset, limit)
+    users = [dict(zip(LEADERBOARD_FIELDS, x)) for x in describe_rankings(page)]
+    next_offset = page[-1][0] if page and page[-1][0] < len(rankings) else None
+    return jsonify({"total": len(rankings), "users": users, "next": next_offset})
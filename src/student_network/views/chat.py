@@ -3,10 +3,11 @@ Handles the view for the chat system and related functionality.
 """
 import os
 
-import student_network.helpers.helper_connections as helper_connections
 import student_network.helpers.helper_general as helper_general
+import student_network.helpers.helper_messages as helper_messages
+import student_network.helpers.helper_paging as helper_paging
 import student_network.helpers.helper_profile as helper_profile
-from flask import Blueprint, render_template
+from flask import Blueprint, jsonify, render_template, request
 from flask import session
 
 chat_blueprint = Blueprint(
@@ -23,27 +24,55 @@ def chat():
 
     return render_template(
         "chat.html",
-        requestCount=helper_connections.get_connection_request_count(),
         username=session["username"],
         rooms=chat_rooms,
         showChat=False,
-        notifications=helper_general.get_notifications(),
     )
 
 
 @chat_blueprint.route("/chat/<username>")
 def chat_username(username):
+    helper_messages.mark_read(session["username"], username)
     chat_rooms = helper_general.get_rooms()
 
-    messages = helper_general.get_messages(username)[0]
+    messages, next_cursor = helper_messages.get_history(session["username"], username)
 
     return render_template(
         "chat.html",
-        requestCount=helper_connections.get_connection_request_count(),
         username=session["username"],
         rooms=chat_rooms,
         showChat=True,
         room=username,
         messages=messages,
-        notifications=helper_general.get_notifications(),
+        message_ids=[x[3] for x in messages],
+        next_cursor=next_cursor,
+    )
+
+
+@chat_blueprint.route("/chat/<username>/history", methods=["GET"])
+def chat_history(username):
+    """
+    Gets a page of older messages with another user, for loading more of a
+    conversation than the chat page shows.
+
+    Returns:
+        JSON with the message, sender and date of each message, newest
+        first, and the cursor for the page after.
+    """
+    try:
+        limit = helper_paging.get_limit(
+            helper_messages.HISTORY_PAGE_SIZE, helper_messages.MAX_HISTORY_PAGE_SIZE
+        )
+        messages, next_cursor = helper_messages.get_history(
+            session["username"], username, limit, request.args.get("cursor")
+        )
+    except ValueError:
+        return jsonify({"error": "Invalid cursor or limit."}), 400
+    return jsonify(
+        {
+            "messages": [
+                {"message": x[0], "sender": x[1], "date": x[2]} for x in messages
+            ],
+            "next_cursor": next_cursor,
+        }
     )
@@ -2,13 +2,17 @@
 Handles the view for user connections and related functionality.
 """
 
-import sqlite3
 from datetime import date
 
 import student_network.helpers.helper_achievements as helper_achievements
 import student_network.helpers.helper_connections as helper_connections
-import student_network.helpers.helper_general as helper_general
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_events as helper_events
+import student_network.helpers.helper_graph as helper_graph
+import student_network.helpers.helper_navbar as helper_navbar
 import student_network.helpers.helper_profile as helper_profile
+import student_network.helpers.helper_recommendations as helper_recommendations
+import student_network.helpers.helper_timeline as helper_timeline
 from flask import Blueprint, redirect, render_template, request, session
 
 connections_blueprint = Blueprint(
@@ -28,17 +32,15 @@ def close_connection(username: str) -> object:
         Redirection to the profile of the user they want to connect with.
     """
     if session["username"] != username:
-        with sqlite3.connect("db.sqlite3") as conn:
+        with helper_database.get_db() as conn:
             cur = conn.cursor()
             cur.execute("SELECT * FROM Accounts WHERE username=?;", (username,))
             if cur.fetchone():
                 conn_type = helper_connections.get_connection_type(username)
                 if conn_type == "connected":
-                    cur.execute(
-                        "SELECT * FROM CloseFriend WHERE (user1=? AND user2=?);",
-                        (session["username"], username),
-                    )
-                    if cur.fetchone() is None:
+                    if not helper_connections.is_close_friend(
+                        session["username"], username
+                    ):
                         # Gets user from database using username.
                         cur.execute(
                             "INSERT INTO CloseFriend (user1, user2) VALUES (?,?);",
@@ -47,7 +49,14 @@ def close_connection(username: str) -> object:
                                 username,
                             ),
                         )
+                        helper_timeline.refresh_reader(
+                            cur, session["username"], username
+                        )
                         conn.commit()
+                        helper_graph.get_graph().add_close_friend(
+                            session["username"], username
+                        )
+                        helper_recommendations.invalidate(session["username"], username)
                         session["add"] = True
 
                         helper_achievements.update_close_connection_achievements(cur)
@@ -68,16 +77,11 @@ def connect_request(username: str) -> object:
         Redirection to the profile of the user they want to connect with.
     """
     if session["username"] != username:
-        with sqlite3.connect("db.sqlite3") as conn:
+        with helper_database.get_db() as conn:
             cur = conn.cursor()
             cur.execute("SELECT * FROM Accounts WHERE username=?;", (username,))
             if cur.fetchone():
-                cur.execute(
-                    "SELECT * FROM Connection WHERE (user1=? AND user2=?) OR "
-                    "(user1=? AND user2=?);",
-                    (username, session["username"], session["username"], username),
-                )
-                if cur.fetchone() is None:
+                if helper_connections.get_connection_type(username) is None:
                     # Gets user from database using username.
                     cur.execute(
                         "INSERT INTO Connection (user1, user2, "
@@ -89,6 +93,11 @@ def connect_request(username: str) -> object:
                         ),
                     )
                     conn.commit()
+                    helper_graph.get_graph().add_connection(
+                        session["username"], username, "request"
+                    )
+                    helper_navbar.invalidate_badges(username)
+                    helper_recommendations.invalidate(session["username"], username)
                     session["add"] = True
 
                     # Award achievement ID 17 - Getting social if necessary
@@ -122,7 +131,7 @@ def unblock_user(username: str) -> object:
     Returns:
         Redirection to the unblocked user's profile page.
     """
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         cur.execute("SELECT * FROM Accounts WHERE username=?;", (username,))
         if cur.fetchone():
@@ -133,6 +142,10 @@ def unblock_user(username: str) -> object:
                         (session["username"], username),
                     )
                     conn.commit()
+                    helper_graph.get_graph().remove_connection(
+                        session["username"], username
+                    )
+                    helper_recommendations.invalidate(session["username"], username)
     return redirect(session["prev-page"])
 
 
@@ -145,11 +158,7 @@ def members() -> object:
         The web page for displaying members.
     """
     session["prev-page"] = request.url
-    return render_template(
-        "members.html",
-        requestCount=helper_connections.get_connection_request_count(),
-        notifications=helper_general.get_notifications(),
-    )
+    return render_template("members.html")
 
 
 @connections_blueprint.route(
@@ -166,7 +175,7 @@ def accept_connection_request(username: str) -> object:
         Redirection to the profile of the user they want to connect with.
     """
     if session["username"] != username:
-        with sqlite3.connect("db.sqlite3") as conn:
+        with helper_database.get_db() as conn:
             cur = conn.cursor()
             cur.execute("SELECT * FROM Accounts WHERE username=?;", (username,))
             if cur.fetchone():
@@ -189,10 +198,25 @@ def accept_connection_request(username: str) -> object:
                             username,
                         ),
                     )
+                    updated = cur.rowcount
+                    helper_timeline.update_connection(
+                        cur, username, session["username"]
+                    )
+                    # The connection and its event are committed together.
+                    helper_events.publish(
+                        cur,
+                        "connected",
+                        username=session["username"],
+                        requester=username,
+                    )
                     conn.commit()
+                    if updated:
+                        helper_graph.get_graph().accept_request(
+                            username, session["username"]
+                        )
+                    helper_navbar.invalidate_badges(session["username"])
+                    helper_recommendations.invalidate(session["username"], username)
                     session["add"] = True
-
-                    helper_achievements.update_connection_achievements(cur, username)
     else:
         session["add"] = "You can't connect with yourself!"
 
@@ -213,7 +237,7 @@ def block_user(username: str) -> object:
     deleted = helper_connections.delete_connection(username)
     if deleted:
         if username != session["username"]:
-            with sqlite3.connect("db.sqlite3") as conn:
+            with helper_database.get_db() as conn:
                 cur = conn.cursor()
                 # Gets user from database using username.
                 cur.execute(
@@ -226,6 +250,10 @@ def block_user(username: str) -> object:
                     ),
                 )
                 conn.commit()
+                helper_graph.get_graph().add_connection(
+                    session["username"], username, "block"
+                )
+                helper_recommendations.invalidate(session["username"], username)
     return redirect("/profile/" + username)
 
 
@@ -243,21 +271,22 @@ def remove_close_friend(username: str) -> object:
     # Checks that the user isn't trying to remove a connection with
     # themselves.
     if username != session["username"]:
-        with sqlite3.connect("db.sqlite3") as conn:
+        with helper_database.get_db() as conn:
             cur = conn.cursor()
             cur.execute("SELECT * FROM Accounts WHERE username=?;", (username,))
             # Searches for the connection in the database.
         if helper_connections.get_connection_type(username) == "connected":
-            cur.execute(
-                "SELECT * FROM CloseFriend WHERE (user1=? AND user2=?);",
-                (session["username"], username),
-            )
-            if cur.fetchone():
+            if helper_connections.is_close_friend(session["username"], username):
                 cur.execute(
                     "DELETE FROM CloseFriend WHERE (user1=? AND user2=?);",
                     (session["username"], username),
                 )
+                helper_timeline.refresh_reader(cur, session["username"], username)
                 conn.commit()
+                helper_graph.get_graph().remove_close_friend(
+                    session["username"], username
+                )
+                helper_recommendations.invalidate(session["username"], username)
 
     return redirect(session["prev-page"])
 
@@ -285,94 +314,52 @@ def show_connect_requests() -> object:
     Returns:
         The web page for viewing connect requests.
     """
-    with sqlite3.connect("db.sqlite3") as conn:
-        # Loads the list of connection requests and their avatars.
-        requests = []
-        avatars = []
-        cur = conn.cursor()
-
-        # Extracts incoming requests.
-        cur.execute(
-            "SELECT Connection.user1, UserProfile.profilepicture FROM "
-            "Connection LEFT JOIN UserProfile ON Connection.user1 = "
-            "UserProfile.username WHERE user2=? AND connection_type=?;",
-            (session["username"], "request"),
-        )
-        conn.commit()
-        row = cur.fetchall()
-        if len(row) > 0:
-            for elem in row:
-                requests.append(elem[0])
-                avatars.append(elem[1])
-
-        # Extracts connections.
-        cur.execute(
-            "SELECT Connection.user1, UserProfile.profilepicture FROM "
-            "Connection LEFT JOIN UserProfile ON Connection.user1 = "
-            "UserProfile.username WHERE user2=? AND connection_type=?;",
-            (session["username"], "connected"),
-        )
-        connections1 = cur.fetchall()
-        cur.execute(
-            "SELECT Connection.user2, UserProfile.profilepicture FROM "
-            "Connection LEFT JOIN UserProfile ON Connection.user2 = "
-            "UserProfile.username WHERE user1=? AND connection_type=?;",
-            (session["username"], "connected"),
-        )
-        connections2 = cur.fetchall()
-
-        # Extracts pending requests.
-        cur.execute(
-            "SELECT Connection.user2, UserProfile.profilepicture FROM "
-            "Connection LEFT JOIN UserProfile ON Connection.user2 = "
-            "UserProfile.username WHERE user1=? AND connection_type=?;",
-            (session["username"], "request"),
-        )
-        pending_connections = cur.fetchall()
-
-        # Extracts blocked users.
-        cur.execute(
-            "SELECT Connection.user2, UserProfile.profilepicture FROM "
-            "Connection LEFT JOIN UserProfile ON Connection.user2 = "
-            "UserProfile.username WHERE user1=? AND connection_type=?;",
-            (session["username"], "block"),
-        )
-        blocked_connections = cur.fetchall()
+    graph = helper_graph.get_graph()
+    incoming = sorted(graph.get_incoming_requests(session["username"]))
+    connected = sorted(graph.get_connections(session["username"]))
+    pending = sorted(graph.get_requests(session["username"]))
+    blocked = sorted(graph.get_blocked(session["username"]))
+
+    # Extracts recommended connections.
+    recommended_connections = helper_connections.get_recommended_connections(
+        session["username"]
+    )
 
-        # Extracts recommended connections.
-        recommended_connections = helper_connections.get_recommended_connections(
-            session["username"]
-        )
-        mutual_avatars = []
-        for mutual in recommended_connections:
-            mutual_avatars.append(helper_profile.get_profile_picture(mutual[0]))
-
-        # Lists usernames of all connected people.
-        connections = connections1 + connections2
-        # Adds a close friend to the list, and sorts by close friends first.
-        connections = list(
-            map(
-                lambda x: (
-                    x[0],
-                    x[1],
-                    helper_connections.is_close_friend(session["username"], x[0]),
-                ),
-                connections,
-            )
+    # Loads the avatars of everyone listed in one go.
+    helper_profile.get_users(
+        incoming
+        + connected
+        + pending
+        + blocked
+        + [x[0] for x in recommended_connections]
+    )
+    requests = incoming
+    avatars = [helper_profile.get_profile_picture(x) for x in incoming]
+    pending_connections = [(x, helper_profile.get_profile_picture(x)) for x in pending]
+    blocked_connections = [(x, helper_profile.get_profile_picture(x)) for x in blocked]
+    mutual_avatars = []
+    for mutual in recommended_connections:
+        mutual_avatars.append(helper_profile.get_profile_picture(mutual[0]))
+
+    # Adds a close friend to the list, and sorts by close friends first.
+    connections = [
+        (
+            x,
+            helper_profile.get_profile_picture(x),
+            graph.is_close_friend(session["username"], x),
         )
-        connections.sort(key=lambda x: x[2], reverse=True)
+        for x in connected
+    ]
+    connections.sort(key=lambda x: x[2], reverse=True)
 
     session["prev-page"] = request.url
     return render_template(
         "request.html",
         requests=requests,
         avatars=avatars,
-        allUsernames=helper_general.get_all_usernames(),
-        requestCount=helper_connections.get_connection_request_count(),
         connections=connections,
         pending=pending_connections,
         blocked=blocked_connections,
         mutuals=recommended_connections,
         mutual_avatars=mutual_avatars,
-        notifications=helper_general.get_notifications(),
     )
@@ -1,11 +1,9 @@
 """
 Handles the view for flashcards and related functionality.
 """
-import sqlite3
 
-import student_network.helpers.helper_achievements as helper_achievements
-import student_network.helpers.helper_connections as helper_connections
-import student_network.helpers.helper_general as helper_general
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_events as helper_events
 import student_network.helpers.helper_flashcards as helper_flashcards
 from flask import Blueprint, json, redirect, render_template, request, session, jsonify
 
@@ -23,7 +21,7 @@ def flashcards() -> object:
     Returns:
         The web page of flashcards.
     """
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         cur.execute(
             "SELECT set_id, date_created, author, set_name, cards_played FROM QuestionSets"
@@ -41,21 +39,17 @@ def flashcards() -> object:
         session.pop("error", None)
         return render_template(
             "flashcards_view.html",
-            requestCount=helper_connections.get_connection_request_count(),
             sets=set_posts,
             errors=errors,
             personal=False,
             username=session["username"],
-            notifications=helper_general.get_notifications(),
         )
     else:
         return render_template(
             "flashcards_view.html",
-            requestCount=helper_connections.get_connection_request_count(),
             sets=set_posts,
             personal=False,
             username=session["username"],
-            notifications=helper_general.get_notifications(),
         )
 
 
@@ -78,21 +72,17 @@ def flashcards_user(username: str) -> object:
         session.pop("error", None)
         return render_template(
             "flashcards_view.html",
-            requestCount=helper_connections.get_connection_request_count(),
             sets=set_posts,
             errors=errors,
             personal=True,
             username=session["username"],
-            notifications=helper_general.get_notifications(),
         )
     else:
         return render_template(
             "flashcards_view.html",
-            requestCount=helper_connections.get_connection_request_count(),
             sets=set_posts,
             personal=True,
             username=session["username"],
-            notifications=helper_general.get_notifications(),
         )
 
 
@@ -108,7 +98,7 @@ def flashcards_edit(set_id: int) -> object:
         The web page of flashcards created.
     """
 
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
 
         cur.execute("SELECT author FROM QuestionSets WHERE set_id=?;", (set_id,))
@@ -124,25 +114,21 @@ def flashcards_edit(set_id: int) -> object:
         session.pop("error", None)
         return render_template(
             "flashcards_edit.html",
-            requestCount=helper_connections.get_connection_request_count(),
             questions=card_set[3],
             set_name=card_set[0],
             set_id=set_id,
             errors=errors,
             set_author=card_set[2],
             username=session["username"],
-            notifications=helper_general.get_notifications(),
         )
     else:
         return render_template(
             "flashcards_edit.html",
-            requestCount=helper_connections.get_connection_request_count(),
             questions=card_set[3],
             set_name=card_set[0],
             set_id=set_id,
             set_author=card_set[2],
             username=session["username"],
-            notifications=helper_general.get_notifications(),
         )
 
 
@@ -158,7 +144,7 @@ def flashcard_set(set_id: int) -> object:
         The web page for answering the questions, or feedback for your answers.
     """
 
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         card_set = helper_flashcards.get_set_details(cur, set_id)
 
@@ -168,25 +154,21 @@ def flashcard_set(set_id: int) -> object:
         session.pop("error", None)
         return render_template(
             "flashcards_set.html",
-            requestCount=helper_connections.get_connection_request_count(),
             questions=card_set[3],
             set_name=card_set[0],
             set_id=set_id,
             errors=errors,
             set_author=card_set[2],
             username=session["username"],
-            notifications=helper_general.get_notifications(),
         )
     else:
         return render_template(
             "flashcards_set.html",
-            requestCount=helper_connections.get_connection_request_count(),
             questions=card_set[3],
             set_name=card_set[0],
             set_id=set_id,
             set_author=card_set[2],
             username=session["username"],
-            notifications=helper_general.get_notifications(),
         )
 
 
@@ -291,7 +273,7 @@ def flashcards_start_set(set_id: int) -> object:
     Returns:
         The web page for playing the flashcard set
     """
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         helper_flashcards.add_play(cur, set_id)
         conn.commit()
@@ -311,7 +293,7 @@ def flashcards_play(set_id: int) -> object:
         The web page for playing the flashcard set
     """
     # Gets the flashcards details from the database.
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         (
             set_name,
@@ -323,17 +305,22 @@ def flashcards_play(set_id: int) -> object:
 
         question_list = questions.items()
 
-    helper_achievements.update_flashcard_achievements(set_author, plays)
+        helper_events.publish(
+            cur,
+            "set_played",
+            username=session["username"],
+            author=set_author,
+            plays=plays,
+        )
+        conn.commit()
 
     if request.method == "GET":
         return render_template(
             "flashcards_play.html",
-            requestCount=helper_connections.get_connection_request_count(),
             set_name=set_name,
             set_id=set_id,
             question_list=dict(question_list),
             question_count=len(question_list),
             set_author=set_author,
             username=session["username"],
-            notifications=helper_general.get_notifications(),
         )
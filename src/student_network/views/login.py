@@ -2,12 +2,12 @@
 Handles the view for the login system and related functionality.
 """
 
-import sqlite3
 from datetime import date
 from string import capwords
 
 import bcrypt
-import student_network.helpers.helper_connections as helper_connections
+import student_network.helpers.helper_autocomplete as helper_autocomplete
+import student_network.helpers.helper_database as helper_database
 import student_network.helpers.helper_general as helper_general
 import student_network.helpers.helper_login as helper_login
 from flask import Blueprint, redirect, render_template, request, session
@@ -62,9 +62,7 @@ def terms_page() -> object:
     """
     if request.method == "GET":
         session["prev-page"] = request.url
-        return render_template(
-            "terms.html", requestCount=helper_connections.get_connection_request_count()
-        )
+        return render_template("terms.html")
     else:
         return redirect("/register")
 
@@ -79,10 +77,7 @@ def privacy_policy_page() -> object:
     """
     if request.method == "GET":
         session["prev-page"] = request.url
-        return render_template(
-            "privacy_policy.html",
-            requestCount=helper_connections.get_connection_request_count(),
-        )
+        return render_template("privacy_policy.html")
     else:
         return redirect("/terms")
 
@@ -98,7 +93,7 @@ def login_submit() -> object:
     username = request.form["username_input"].lower()
     password = request.form["psw_input"].encode("utf-8")
 
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         # Gets user from database using username.
         cur.execute(
@@ -160,7 +155,6 @@ def register_page() -> object:
             notifications=notifications,
             errors=errors,
             details=details,
-            requestCount=helper_connections.get_connection_request_count(),
         )
 
 
@@ -182,7 +176,7 @@ def register_submit() -> object:
     account = request.form.get("optradio")
 
     # Connects to the database to perform validation.
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         valid, message = helper_login.validate_registration(
             cur, username, full_name, password, password_confirm, email, terms
@@ -215,6 +209,7 @@ def register_submit() -> object:
             )
             helper_general.check_level_exists(username, conn)
             conn.commit()
+            helper_autocomplete.refresh(cur, username)
 
             session["notifications"] = ["register"]
             session["username"] = username
@@ -0,0 +1,67 @@
+"""
+Handles the view for notifications and related functionality.
+"""
+import student_network.helpers.helper_notifications as helper_notifications
+import student_network.helpers.helper_paging as helper_paging
+from flask import Blueprint, jsonify, redirect, request, session
+
+notifications_blueprint = Blueprint(
+    "notifications", __name__, static_folder="static", template_folder="templates"
+)
+
+
+@notifications_blueprint.route("/notifications", methods=["GET"])
+def notifications() -> object:
+    """
+    Gets a page of the user's notifications, for browsing past the ones
+    shown on the navigation bar.
+
+    Returns:
+        JSON with the body, age, link, ID and read flag of each notification,
+        newest first, and the cursor for the page after.
+    """
+    try:
+        limit = helper_paging.get_limit(
+            helper_notifications.PAGE_SIZE, helper_notifications.MAX_PAGE_SIZE
+        )
+        page, next_cursor = helper_notifications.get_notifications(
+            session["username"], limit, request.args.get("cursor")
+        )
+    except ValueError:
+        return jsonify({"error": "Invalid cursor or limit."}), 400
+    return jsonify(
+        {
+            "notifications": [
+                {"body": x[0], "age": x[1], "url": x[2], "id": x[3], "read": x[4]}
+                for x in page
+            ],
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+@notifications_blueprint.route("/notifications/<int:notification_id>")
+def open_notification(notification_id: int) -> object:
+    """
+    Marks a notification as read and follows its link.
+
+    Returns:
+        Redirection to the page the notification is about.
+    """
+    url = helper_notifications.get_url(session["username"], notification_id)
+    if url is None:
+        return redirect("/feed")
+    helper_notifications.mark_read(session["username"], [notification_id])
+    return redirect(url)
+
+
+@notifications_blueprint.route("/notifications/read", methods=["POST"])
+def read_notifications() -> object:
+    """
+    Marks all of the user's notifications as read.
+
+    Returns:
+        Redirection to the previous page.
+    """
+    helper_notifications.mark_read(session["username"])
+    return redirect(session.get("prev-page", "/feed"))
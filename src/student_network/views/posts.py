@@ -2,17 +2,43 @@
 Handles the view for posts on the feed and related functionality.
 """
 
+import os
 import re
-import sqlite3
-from datetime import datetime
+import uuid
 
-import student_network.helpers.helper_achievements as helper_achievements
+import student_network.helpers.helper_autocomplete as helper_autocomplete
 import student_network.helpers.helper_connections as helper_connections
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_events as helper_events
 import student_network.helpers.helper_general as helper_general
+import student_network.helpers.helper_images as helper_images
+import student_network.helpers.helper_leaderboard as helper_leaderboard
 import student_network.helpers.helper_login as helper_login
+import student_network.helpers.helper_paging as helper_paging
 import student_network.helpers.helper_posts as helper_posts
 import student_network.helpers.helper_profile as helper_profile
-from flask import Blueprint, jsonify, redirect, render_template, request, session
+import student_network.helpers.helper_search as helper_search
+import student_network.helpers.helper_timeline as helper_timeline
+from flask import (
+    Blueprint,
+    abort,
+    current_app,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    send_file,
+    session,
+)
+
+AUTOCOMPLETE_LIMIT = 10
+MAX_UPLOAD_STATUS_IDS = 50
+UPLOAD_RETRY_AFTER = 2
+# The number of uploads remembered in the session, which the user may delete
+# before they are posted.
+MAX_SESSION_UPLOADS = 20
+IMAGE_ID = re.compile(r"[\w-]+")
+IMAGE_MAX_AGE = 365 * 24 * 60 * 60
 
 posts_blueprint = Blueprint(
     "posts", __name__, static_folder="static", template_folder="templates"
@@ -33,7 +59,7 @@ def post(post_id: int) -> object:
     session["prev-page"] = request.url
     content = None
     # check post restrictions
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         cur.execute("SELECT privacy, username FROM POSTS WHERE postId=?;", (post_id,))
         row = cur.fetchone()
@@ -41,7 +67,6 @@ def post(post_id: int) -> object:
             return render_template(
                 "error.html",
                 message=["This post does not exist."],
-                requestCount=helper_connections.get_connection_request_count(),
             )
         privacy = row[0]
         username = row[1]
@@ -56,7 +81,6 @@ def post(post_id: int) -> object:
                     return render_template(
                         "error.html",
                         message=["This post is private. You cannot access it."],
-                        requestCount=helper_connections.get_connection_request_count(),
                     )
                 else:
                     # Checks if user trying to view the post has a connection
@@ -67,7 +91,6 @@ def post(post_id: int) -> object:
                             return render_template(
                                 "error.html",
                                 message=["This post is only available to connections."],
-                                requestCount=helper_connections.get_connection_request_count(),
                             )
                     else:
                         # If the user and author are connected, check that they
@@ -83,14 +106,12 @@ def post(post_id: int) -> object:
                                         "This post is only available to close "
                                         "friends."
                                     ],
-                                    requestCount=helper_connections.get_connection_request_count(),
                                 )
         else:
             if privacy != "public":
                 return render_template(
                     "error.html",
                     message=["This post is private. You cannot access it."],
-                    requestCount=helper_connections.get_connection_request_count(),
                 )
 
         # Gets user from database using username.
@@ -106,9 +127,6 @@ def post(post_id: int) -> object:
             return render_template(
                 "error.html",
                 message=message,
-                requestCount=helper_connections.get_connection_request_count(),
-                allUsernames=helper_general.get_all_usernames(),
-                notifications=helper_general.get_notifications(),
             )
         else:
             data = row[0]
@@ -133,8 +151,13 @@ def post(post_id: int) -> object:
             )
             images = cur.fetchall()
 
-            cur.execute("SELECT * FROM Comments WHERE postId=?;", (post_id,))
+            cur.execute(
+                "SELECT commentId, username, body, timestamp FROM Comments "
+                "WHERE postId=? ORDER BY commentId;",
+                (post_id,),
+            )
             row = cur.fetchall()
+            helper_profile.get_users([username] + [x[1] for x in row])
             if len(row) == 0:
                 session["prev-page"] = request.url
                 return render_template(
@@ -150,22 +173,17 @@ def post(post_id: int) -> object:
                     account_type=account_type,
                     user_account_type=user_account_type,
                     comments=None,
-                    requestCount=helper_connections.get_connection_request_count(),
-                    allUsernames=helper_general.get_all_usernames(),
                     avatar=helper_profile.get_profile_picture(username),
                     content=content,
-                    notifications=helper_general.get_notifications(),
                 )
-            for comment in row:
-                time = datetime.strptime(comment[3], "%Y-%m-%d %H:%M:%S")
+            ages = helper_general.format_ages(x[3] for x in row)
+            for comment, age in zip(row, ages):
                 comments["comments"].append(
                     {
                         "commentId": comment[0],
                         "username": comment[1],
                         "body": comment[2],
-                        "date": helper_general.display_short_notification_age(
-                            (datetime.now() - time).total_seconds()
-                        ),
+                        "date": age,
                         "profilePic": helper_profile.get_profile_picture(comment[1]),
                     }
                 )
@@ -183,11 +201,8 @@ def post(post_id: int) -> object:
                 account_type=account_type,
                 user_account_type=user_account_type,
                 comments=comments,
-                requestCount=helper_connections.get_connection_request_count(),
-                allUsernames=helper_general.get_all_usernames(),
                 avatar=helper_profile.get_profile_picture(username),
                 content=content,
-                notifications=helper_general.get_notifications(),
             )
 
 
@@ -200,8 +215,11 @@ def json_posts() -> dict:
         JSON dictionary file for posts.
     """
     number = request.args.get("number")
-    starting_id = request.args.get("starting_id")
-    all_posts, _, _ = helper_posts.fetch_posts(number, starting_id)
+    cursor = request.args.get("cursor")
+    try:
+        all_posts, _, _ = helper_posts.fetch_posts(number, cursor)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor."}), 400
     return jsonify(all_posts)
 
 
@@ -214,15 +232,8 @@ def feed() -> object:
         Redirection to their feed if they're logged in.
     """
     session["prev-page"] = request.url
-    with sqlite3.connect("db.sqlite3") as conn:
-        cur = conn.cursor()
-
-        connections = helper_general.get_all_connections(session["username"])
-        connections.append((session["username"],))
-        cur.execute("SELECT MAX(postId) FROM POSTS")
-        row = cur.fetchone()
-
-    _, content, valid = helper_posts.fetch_posts(2, row[0])
+    valid = "username" in session
+    content = ""
     # Displays any error messages.
     if valid:
         if "error" in session:
@@ -231,22 +242,14 @@ def feed() -> object:
             session["prev-page"] = request.url
             return render_template(
                 "feed.html",
-                requestCount=helper_connections.get_connection_request_count(),
-                allUsernames=helper_general.get_all_usernames(),
                 errors=errors,
                 content=content,
-                max_id=row[0],
-                notifications=helper_general.get_notifications(),
             )
         else:
             session["prev-page"] = request.url
             return render_template(
                 "feed.html",
-                requestCount=helper_connections.get_connection_request_count(),
-                allUsernames=helper_general.get_all_usernames(),
                 content=content,
-                max_id=row[0],
-                notifications=helper_general.get_notifications(),
             )
     else:
         return redirect("/login")
@@ -258,52 +261,72 @@ def search_query() -> dict:
     Searches for members registered in the student network.
 
     Returns:
-        JSON dictionary of search results of users, and their hobbies
-        and interests.
+        JSON with a page of matching users, each with the hobby and interest
+        matched, profile picture and degree, and the offset of the next
+        page.
     """
-    with sqlite3.connect("db.sqlite3") as conn:
-        cur = conn.cursor()
-        chars = request.args.get("chars")
-        hobby = request.args.get("hobby")
-        interest = request.args.get("interest")
-        name_pattern = "%" + chars + "%"
-        hobby_pattern = "%" + hobby + "%"
-        interest_pattern = "%" + interest + "%"
-
-        # Filters by username, common hobbies, and interests.
-        cur.execute(
-            "SELECT UserProfile.username, UserHobby.hobby, "
-            "UserInterests.interest FROM UserProfile "
-            "LEFT JOIN UserHobby ON UserHobby.username=UserProfile.username "
-            "LEFT JOIN UserInterests ON "
-            "UserInterests.username=UserProfile.username "
-            "WHERE (UserProfile.username LIKE ?) "
-            "AND (IFNULL(hobby, '') LIKE ?) AND (IFNULL(interest, '') LIKE ?) "
-            "GROUP BY UserProfile.username LIMIT 10;",
-            (
-                name_pattern,
-                hobby_pattern,
-                interest_pattern,
-            ),
-        )
-        usernames = cur.fetchall()
-        # Sorts results alphabetically.
-        usernames.sort(key=lambda x: x[0])  # [(username, degree)]
-        # Adds a profile picture to each user.
-        usernames = list(
-            map(
-                lambda x: (
-                    x[0],
-                    x[1],
-                    x[2],
-                    helper_profile.get_profile_picture(x[0]),
-                    helper_profile.get_degree(x[0])[1],
-                ),
-                usernames,
-            )
+    try:
+        offset = helper_paging.get_offset()
+        limit = helper_paging.get_limit(
+            helper_search.SEARCH_PAGE_SIZE, helper_search.MAX_SEARCH_PAGE_SIZE
         )
+    except ValueError:
+        return jsonify({"error": "Invalid offset or limit."}), 400
+
+    users, next_offset = helper_search.search_members(
+        request.args.get("chars", ""),
+        request.args.get("hobby", ""),
+        request.args.get("interest", ""),
+        offset,
+        limit,
+    )
+    users = [
+        (*x[:3], helper_images.image_url(x[3], helper_images.AVATAR_WIDTH), x[4])
+        for x in users
+    ]
+    return jsonify({"users": users, "next": next_offset})
+
 
-    return jsonify(usernames)
+@posts_blueprint.route("/search_posts", methods=["GET"])
+def search_posts() -> object:
+    """
+    Searches the posts and comments the user can see. Quoted phrases are
+    matched whole and words ending in * as prefixes.
+
+    Returns:
+        JSON with the post, comment, author, age and highlighted snippet of
+        each match, newest first, and the cursor for the page after. Users
+        who aren't logged in can't see any posts, so get no matches.
+    """
+    if "username" not in session:
+        return jsonify({"results": [], "next_cursor": None})
+    try:
+        limit = helper_paging.get_limit(
+            helper_search.SEARCH_PAGE_SIZE, helper_search.MAX_SEARCH_PAGE_SIZE
+        )
+        results, next_cursor = helper_search.search_posts(
+            session["username"],
+            request.args.get("q", ""),
+            limit,
+            request.args.get("cursor"),
+        )
+    except ValueError:
+        return jsonify({"error": "Invalid cursor or limit."}), 400
+    return jsonify(
+        {
+            "results": [
+                {
+                    "postId": x[0],
+                    "commentId": x[1],
+                    "author": x[2],
+                    "age": x[3],
+                    "snippet": x[4],
+                }
+                for x in results
+            ],
+            "next_cursor": next_cursor,
+        }
+    )
 
 
 @posts_blueprint.route("/submit_post", methods=["POST"])
@@ -322,7 +345,7 @@ def submit_post() -> object:
 
     # Only adds the post if a title has been input.
     if len(all_file_names) > 0 or len(post_body) > 0:
-        with sqlite3.connect("db.sqlite3") as conn:
+        with helper_database.get_db() as conn:
             cur = conn.cursor()
             # Get account type
             cur.execute(
@@ -333,8 +356,8 @@ def submit_post() -> object:
             row_count = int(cur.fetchone()[0])
             row_id = row_count + 1
             cur.execute(
-                "INSERT INTO POSTS (postId, body, username,"
-                "privacy) VALUES (?, ?, ?, ?);",
+                "INSERT INTO POSTS (postId, body, username, privacy, timestamp) "
+                "VALUES (?, ?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER));",
                 (
                     row_id,
                     post_body,
@@ -342,6 +365,7 @@ def submit_post() -> object:
                     post_privacy,
                 ),
             )
+            helper_timeline.add_post(cur, row_id, session["username"], post_privacy)
 
             if len(all_file_names) > 0:
                 for fileName in all_file_names_split:
@@ -380,7 +404,7 @@ def like_post() -> object:
     """
     post_id = request.form["postId"]
 
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         liked = helper_posts.check_if_liked(cur, post_id, session["username"])
         if not liked:
@@ -402,22 +426,26 @@ def like_post() -> object:
                     post_id,
                 ),
             )
-            conn.commit()
 
             cur.execute("SELECT username FROM AllUserLikes WHERE postId=?;", (post_id,))
             row = cur.fetchall()
             names = [x[0] for x in row]
-            if session["username"] not in names:
+            first_like = session["username"] not in names
+            if first_like:
                 # 1 exp earned for the author of the post
-                helper_general.check_level_exists(username, conn)
                 helper_general.one_exp(cur, username)
                 cur.execute(
                     "INSERT INTO AllUserLikes (postId,username) VALUES (?, ?);",
                     (post_id, session["username"]),
                 )
-                conn.commit()
 
-            helper_achievements.update_post_achievements(cur, likes, username)
+            # The like and its event are committed together.
+            helper_events.publish(
+                cur, "liked", username=session["username"], author=username, likes=likes
+            )
+            conn.commit()
+            if first_like:
+                helper_leaderboard.refresh(cur, username)
         else:
             # Gets number of current likes.
             cur.execute("SELECT likes FROM POSTS WHERE postId=?;", (post_id,))
@@ -455,13 +483,13 @@ def submit_comment() -> object:
 
     # Only submits the comment if it is not empty.
     if comment_body.replace(" ", "") != "":
-        with sqlite3.connect("db.sqlite3") as conn:
+        with helper_database.get_db() as conn:
             cur = conn.cursor()
             cur.execute(
-                "INSERT INTO Comments (postId, body, username) VALUES (?, ?, ?);",
+                "INSERT INTO Comments (postId, body, username, timestamp) "
+                "VALUES (?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER));",
                 (post_id, comment_body, session["username"]),
             )
-            conn.commit()
 
             # Get username on post
             cur.execute("SELECT username FROM POSTS WHERE postId=?;", (post_id,))
@@ -473,7 +501,15 @@ def submit_comment() -> object:
             )
             row = cur.fetchone()[0]
 
-            helper_posts.update_comment_achievements(row, username)
+            # The comment and its event are committed together.
+            helper_events.publish(
+                cur,
+                "commented",
+                username=session["username"],
+                author=username,
+                comments=row,
+            )
+            conn.commit()
 
             # we haven't commented on our own post
             if username != session["username"]:
@@ -498,7 +534,7 @@ def delete_post() -> object:
     post_id = request.form["postId"]
     message = []
 
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         cur.execute("SELECT postId FROM POSTS WHERE postId=?;", (post_id,))
         row = cur.fetchone()
@@ -509,6 +545,7 @@ def delete_post() -> object:
             cur.execute(
                 "UPDATE POSTS SET privacy=? WHERE postId=?;", ("deleted", post_id)
             )
+            helper_timeline.remove_post(cur, post_id)
             conn.commit()
 
     message.append("Post has been deleted successfully.")
@@ -516,9 +553,6 @@ def delete_post() -> object:
     return render_template(
         "error.html",
         message=message,
-        requestCount=helper_connections.get_connection_request_count(),
-        allUsernames=helper_general.get_all_usernames(),
-        notifications=helper_general.get_notifications(),
     )
 
 
@@ -534,7 +568,7 @@ def delete_comment() -> object:
     post_id = request.form["postId"]
     comment_id = request.form["commentId"]
 
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         cur.execute("SELECT * FROM Comments WHERE commentId=? ", (comment_id,))
         row = cur.fetchone()
@@ -545,9 +579,6 @@ def delete_comment() -> object:
             return render_template(
                 "error.html",
                 message=message,
-                requestCount=helper_connections.get_connection_request_count(),
-                allUsernames=helper_general.get_all_usernames(),
-                notifications=helper_general.get_notifications(),
             )
         else:
             cur.execute("DELETE FROM Comments WHERE commentId =? ", (comment_id,))
@@ -568,26 +599,96 @@ def upload_file():
         for file_name in request.files:
             file = request.files[file_name]
 
-            file_name = helper_posts.upload_image(file)
+            try:
+                file_name = helper_posts.upload_image(file)
+            except helper_images.QueueFull:
+                # Asks the browser to retry once the workers have caught up.
+                return (
+                    jsonify({"error": "Too many images are being uploaded."}),
+                    503,
+                    {"Retry-After": str(UPLOAD_RETRY_AFTER)},
+                )
             file_names.append(file_name)
 
             max_file_upload -= 1
             if max_file_upload <= 0:
                 break
 
+    uploads = session.get("uploads", []) + [x for x in file_names if x]
+    session["uploads"] = uploads[-MAX_SESSION_UPLOADS:]
     return jsonify(file_names)
 
 
+@posts_blueprint.route("/upload_status", methods=["GET"])
+def upload_status():
+    """
+    An API which gets whether uploaded images have finished being resized.
+
+    Returns:
+        The status of each image ID in the comma separated ids parameter,
+        "pending", "done", "failed" or null if there is no such upload.
+    """
+    image_ids = [x for x in request.args.get("ids", "").split(",") if x]
+    if len(image_ids) > MAX_UPLOAD_STATUS_IDS:
+        return jsonify({"error": "Too many image IDs."}), 400
+    try:
+        # Only IDs the pipeline could have made are looked up on disk.
+        image_ids = [str(uuid.UUID(x)) for x in image_ids]
+    except ValueError:
+        return jsonify({"error": "Invalid image ID."}), 400
+    return jsonify({x: helper_images.get_status(x) for x in image_ids})
+
+
+@posts_blueprint.route("/images/<kind>/<image_id>/<int:width>", methods=["GET"])
+def serve_image(kind: str, image_id: str, width: int) -> object:
+    """
+    Serves a copy of an uploaded image at one of the derivative widths,
+    making it the first time it is asked for.
+
+    Returns:
+        The image, in WebP if the browser accepts it and JPEG otherwise.
+    """
+    if (
+        kind not in helper_images.KINDS
+        or width not in helper_images.DERIVATIVE_WIDTHS
+        or not IMAGE_ID.fullmatch(image_id)
+    ):
+        abort(404)
+    # Wildcards aren't counted, as browsers which don't support WebP send
+    # them too.
+    extension = "webp" if "image/webp" in request.accept_mimetypes.values() else "jpg"
+    path = helper_images.get_derivative(
+        current_app.config["IMAGE_DIRECTORY"], kind, image_id, width, extension
+    )
+    if path is None:
+        abort(404)
+    # Images never change once uploaded, so browsers can keep them.
+    response = send_file(os.path.abspath(path), max_age=IMAGE_MAX_AGE)
+    response.vary.add("Accept")
+    return response
+
+
 @posts_blueprint.route("/delete_file", methods=["POST"])
 def delete_file():
     """
-    An API call to delete a file with a given name from the server
+    An API call to delete an image the user uploaded, either before it is
+    posted or from one of their own posts.
     """
-    file_name = request.args.get("filename")
-    # try and prevent escaping this path
-    file_name.replace(".", "")
-    file_name.replace("/", "")
-    helper_posts.delete_file(file_name + ".jpg")
+    if "username" not in session:
+        abort(401)
+    image_id = request.args.get("filename", "")
+    try:
+        # Only IDs the pipeline could have made name files to delete.
+        valid = str(uuid.UUID(image_id)) == image_id
+    except ValueError:
+        valid = False
+    if not valid:
+        abort(400)
+    if not helper_posts.can_delete_image(
+        session["username"], image_id, session.get("uploads", [])
+    ):
+        abort(403)
+    helper_posts.delete_file(image_id + ".jpg")
     return "200"
 
 
@@ -595,7 +696,7 @@ def delete_file():
 def user_exists():
     username = request.args.get("username")
 
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
 
         cur.execute("SELECT username FROM ACCOUNTS WHERE username=?;", (username,))
@@ -608,3 +709,30 @@ def user_exists():
         return "True"
 
     return "False"
+
+
+@posts_blueprint.route("/autocomplete_usernames", methods=["GET"])
+def autocomplete_usernames() -> dict:
+    """
+    Suggests usernames for tagging as the user types.
+
+    Returns:
+        The JSON list of usernames starting with the characters entered, with
+        each user's profile picture.
+    """
+    prefix = request.args.get("prefix", "")
+    if "username" not in session or not prefix:
+        return jsonify([])
+    return jsonify(
+        [
+            {
+                "username": username,
+                "profile_picture": helper_images.image_url(
+                    picture, helper_images.AVATAR_WIDTH
+                ),
+            }
+            for username, picture in helper_autocomplete.get_index().complete(
+                prefix, AUTOCOMPLETE_LIMIT
+            )
+        ]
+    )
@@ -2,17 +2,19 @@
 Handles the view for user profiles and related functionality.
 """
 
-import sqlite3
 from datetime import datetime
 
 import student_network.helpers.helper_achievements as helper_achievements
+import student_network.helpers.helper_autocomplete as helper_autocomplete
 import student_network.helpers.helper_connections as helper_connections
+import student_network.helpers.helper_database as helper_database
 import student_network.helpers.helper_general as helper_general
 import student_network.helpers.helper_login as helper_login
 import student_network.helpers.helper_profile as helper_profile
 import student_network.helpers.helper_posts as helper_posts
 import student_network.helpers.helper_flashcards as helper_flashcards
 import student_network.helpers.helper_quizzes as helper_quizzes
+import student_network.helpers.helper_recommendations as helper_recommendations
 from flask import Blueprint, redirect, render_template, request, session
 
 profile_blueprint = Blueprint(
@@ -57,7 +59,7 @@ def profile(username: str) -> object:
     if "register_details" in session:
         session.pop("register_details", None)
 
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         # Gets user from database using username.
         cur.execute(
@@ -74,8 +76,6 @@ def profile(username: str) -> object:
             return render_template(
                 "error.html",
                 message=message,
-                requestCount=helper_connections.get_connection_request_count(),
-                notifications=helper_general.get_notifications(),
             )
         else:
             data = row[0]
@@ -118,8 +118,6 @@ def profile(username: str) -> object:
                     return render_template(
                         "error.html",
                         message=message,
-                        requestCount=helper_connections.get_connection_request_count(),
-                        notifications=helper_general.get_notifications(),
                     )
                 elif privacy in ("close_friends", "private"):
                     message.append("This profile is private")
@@ -127,8 +125,6 @@ def profile(username: str) -> object:
                     return render_template(
                         "error.html",
                         message=message,
-                        requestCount=helper_connections.get_connection_request_count(),
-                        notifications=helper_general.get_notifications(),
                     )
             else:
                 conn_type = "close_friend"
@@ -138,8 +134,6 @@ def profile(username: str) -> object:
                     return render_template(
                         "error.html",
                         message=message,
-                        requestCount=helper_connections.get_connection_request_count(),
-                        notifications=helper_general.get_notifications(),
                     )
 
             session["prev-page"] = request.url
@@ -152,7 +146,7 @@ def profile(username: str) -> object:
                 # check if user trying to view profile is a close friend
                 if their_close_friend:
                     cur.execute(
-                        "SELECT * "
+                        "SELECT postId, body, likes, username, timestamp, privacy "
                         "FROM POSTS WHERE username=? "
                         "AND privacy not in "
                         "('private', 'deleted');",
@@ -161,7 +155,7 @@ def profile(username: str) -> object:
                     sort_posts = cur.fetchall()
                 else:
                     cur.execute(
-                        "SELECT * "
+                        "SELECT postId, body, likes, username, timestamp, privacy "
                         "FROM POSTS WHERE username=? "
                         "AND privacy not in "
                         "('private', 'deleted', 'close');",
@@ -170,7 +164,8 @@ def profile(username: str) -> object:
                     sort_posts = cur.fetchall()
             else:
                 cur.execute(
-                    "SELECT * FROM POSTS WHERE username=? AND privacy=='public' ",
+                    "SELECT postId, body, likes, username, timestamp, privacy "
+                    "FROM POSTS WHERE username=? AND privacy=='public' ",
                     (username,),
                 )
                 sort_posts = cur.fetchall()
@@ -179,7 +174,9 @@ def profile(username: str) -> object:
     else:
         # Only public posts can be viewed when not logged in
         cur.execute(
-            "SELECT * FROM POSTS WHERE username=? AND privacy='public'", (username,)
+            "SELECT postId, body, likes, username, timestamp, privacy "
+            "FROM POSTS WHERE username=? AND privacy='public'",
+            (username,),
         )
         sort_posts = cur.fetchall()
 
@@ -188,7 +185,8 @@ def profile(username: str) -> object:
 
     user_posts = {"UserPosts": []}
 
-    for user_post in sort_posts:
+    dates = helper_general.format_dates(x[4] for x in sort_posts)
+    for user_post, time in zip(sort_posts, dates):
         add = ""
         if len(user_post[1]) > 250:
             add = "..."
@@ -215,7 +213,6 @@ def profile(username: str) -> object:
 
         liked = helper_posts.check_if_liked(cur, user_post[0], session["username"])
 
-        time = datetime.strptime(user_post[4], "%Y-%m-%d").strftime("%d-%m-%y")
         user_posts["UserPosts"].append(
             {
                 "postId": user_post[0],
@@ -286,8 +283,6 @@ def profile(username: str) -> object:
     age = helper_profile.calculate_age(datetime_object)
 
     # get user level
-    helper_general.check_level_exists(username, conn)
-
     level_data = helper_profile.get_level(username)
     level = level_data[0]
     current_xp = level_data[1]
@@ -325,13 +320,10 @@ def profile(username: str) -> object:
             total_posts=total_posts,
             type=conn_type,
             unlocked_achievements=first_six,
-            allUsernames=helper_general.get_all_usernames(),
-            requestCount=helper_connections.get_connection_request_count(),
             level=level,
             current_xp=int(current_xp),
             xp_next_level=int(xp_next_level),
             progress_color=progress_color,
-            notifications=helper_general.get_notifications(),
         )
     else:
         session["prev-page"] = request.url
@@ -360,7 +352,6 @@ def profile(username: str) -> object:
             current_xp=int(current_xp),
             xp_next_level=int(xp_next_level),
             progress_color=progress_color,
-            notifications=helper_general.get_notifications(),
         )
 
 
@@ -373,7 +364,7 @@ def edit_profile() -> object:
         The updated profile page if the details provided were valid.
     """
     degrees = {"degrees": []}
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         cur.execute(
             "SELECT birthday, bio, degree, privacy, gender FROM UserProfile "
@@ -412,7 +403,6 @@ def edit_profile() -> object:
     if request.method == "GET":
         return render_template(
             "settings.html",
-            requestCount=helper_connections.get_connection_request_count(),
             date=dob,
             bio=bio,
             degrees=degrees,
@@ -423,7 +413,6 @@ def edit_profile() -> object:
             hobbies=hobbies,
             interests=interests,
             errors=[],
-            notifications=helper_general.get_notifications(),
         )
 
     # Processes the form if they updated their profile using the form.
@@ -449,7 +438,7 @@ def edit_profile() -> object:
         interests_unformatted = interests_input.split(",")
         interests = [interest.lower() for interest in interests_unformatted]
         # Connects to the database to perform validation.
-        with sqlite3.connect("db.sqlite3") as conn:
+        with helper_database.get_db() as conn:
             cur = conn.cursor()
 
             # Validates user profile details and uploaded image.
@@ -545,6 +534,9 @@ def edit_profile() -> object:
                             )
 
                 conn.commit()
+                helper_profile.invalidate_user(username)
+                helper_recommendations.invalidate(username)
+                helper_autocomplete.refresh(cur, username)
                 return redirect("/profile")
             # Displays error message(s) stating why their details are invalid.
             else:
@@ -552,14 +544,11 @@ def edit_profile() -> object:
                 return render_template(
                     "settings.html",
                     errors=message,
-                    requestCount=helper_connections.get_connection_request_count(),
-                    allUsernames=helper_general.get_all_usernames(),
                     degrees=degrees,
                     degree=degree,
                     date=dob,
                     bio=bio,
                     privacy=privacy,
-                    notifications=helper_general.get_notifications(),
                 )
 
 
@@ -572,7 +561,7 @@ def profile_privacy() -> object:
         The web page to edit the user's profile details.
     """
     privacy = request.form.get("privacy")
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         cur.execute(
             "UPDATE UserProfile SET privacy=? WHERE username=?;",
@@ -600,7 +589,7 @@ def edit_socials() -> object:
         "instagram": request.form.get("instagram"),
         "linkedin": request.form.get("linkedin"),
     }
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         cur.execute("DELETE FROM UserSocial WHERE username=?;", (session["username"],))
         for key, value in socials.items():
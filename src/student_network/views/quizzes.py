@@ -1,11 +1,11 @@
 """
 Handles the view for quizzes and related functionality.
 """
-import sqlite3
 
-import student_network.helpers.helper_achievements as helper_achievements
-import student_network.helpers.helper_connections as helper_connections
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_events as helper_events
 import student_network.helpers.helper_general as helper_general
+import student_network.helpers.helper_leaderboard as helper_leaderboard
 import student_network.helpers.helper_login as helper_login
 import student_network.helpers.helper_quizzes as helper_quizzes
 from flask import Blueprint, redirect, render_template, request, session
@@ -76,7 +76,7 @@ def quiz(quiz_id: int) -> object:
     """
 
     # Gets the quiz details from the database.
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         (
             answers,
@@ -89,13 +89,11 @@ def quiz(quiz_id: int) -> object:
     if request.method == "GET":
         return render_template(
             "quiz.html",
-            requestCount=helper_connections.get_connection_request_count(),
             quiz_name=quiz_name,
             quiz_id=quiz_id,
             questions=questions,
             answers=answers,
             quiz_author=quiz_author,
-            notifications=helper_general.get_notifications(),
         )
     elif request.method == "POST":
         score = 0
@@ -111,10 +109,9 @@ def quiz(quiz_id: int) -> object:
         else:
             # 1 exp earned for the author of the quiz
             if quiz_author != session["username"]:
-                helper_general.check_level_exists(quiz_author, conn)
                 helper_general.one_exp(cur, quiz_author)
-                helper_achievements.update_quiz_achievements(score, True)
                 conn.commit()
+                helper_leaderboard.refresh(cur, quiz_author)
             # Provides feedback to the user on how they performed on each question.
             question_feedback = []
             cur.execute("SELECT * FROM Question WHERE quiz_id=?;", (quiz_id,))
@@ -127,7 +124,13 @@ def quiz(quiz_id: int) -> object:
                 )
                 if correct:
                     score += 1
-            helper_achievements.update_quiz_achievements(score)
+            helper_events.publish(
+                cur,
+                "quiz_completed",
+                username=session["username"],
+                score=score,
+                other_author=quiz_author != session["username"],
+            )
             # Updates the number of times a quiz has been played.
             cur.execute(
                 "UPDATE Quiz SET plays = plays + 1 WHERE quiz_id=?;", (quiz_id,)
@@ -139,10 +142,8 @@ def quiz(quiz_id: int) -> object:
             return render_template(
                 "quiz_results.html",
                 question_feedback=question_feedback,
-                requestCount=helper_connections.get_connection_request_count(),
                 score=score,
                 percentage=percentage,
-                notifications=helper_general.get_notifications(),
             )
 
 
@@ -154,7 +155,7 @@ def quizzes() -> object:
     Returns:
         The web page of quizzes created.
     """
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         cur.execute("SELECT quiz_id, date_created, author, quiz_name, plays FROM Quiz")
         row = cur.fetchall()
@@ -170,21 +171,17 @@ def quizzes() -> object:
         session.pop("error", None)
         return render_template(
             "quizzes.html",
-            requestCount=helper_connections.get_connection_request_count(),
             quizzes=quiz_posts,
             errors=errors,
             personal=False,
             username=session["username"],
-            notifications=helper_general.get_notifications(),
         )
     else:
         return render_template(
             "quizzes.html",
-            requestCount=helper_connections.get_connection_request_count(),
             quizzes=quiz_posts,
             personal=False,
             username=session["username"],
-            notifications=helper_general.get_notifications(),
         )
 
 
@@ -204,21 +201,17 @@ def quizzes_user(username: str) -> object:
         session.pop("error", None)
         return render_template(
             "quizzes.html",
-            requestCount=helper_connections.get_connection_request_count(),
             quizzes=quiz_posts,
             errors=errors,
             personal=True,
             username=username,
-            notifications=helper_general.get_notifications(),
         )
     else:
         return render_template(
             "quizzes.html",
-            requestCount=helper_connections.get_connection_request_count(),
             quizzes=quiz_posts,
             personal=True,
             username=username,
-            notifications=helper_general.get_notifications(),
         )
 
 
@@ -2,9 +2,9 @@
 Handles the view for staff administration tools and related functionality.
 """
 
-import sqlite3
 
-import student_network.helpers.helper_connections as helper_connections
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_profile as helper_profile
 from flask import Blueprint, redirect, render_template, session
 
 staff_blueprint = Blueprint(
@@ -25,9 +25,8 @@ def show_staff_requests() -> object:
             return render_template(
                 "error.html",
                 message=["You are not logged in to an admin account"],
-                requestCount=helper_connections.get_connection_request_count(),
             )
-        with sqlite3.connect("db.sqlite3") as conn:
+        with helper_database.get_db() as conn:
             # Loads the list of connection requests and their avatars.
             requests = []
             cur = conn.cursor()
@@ -42,13 +41,11 @@ def show_staff_requests() -> object:
             return render_template(
                 "admin.html",
                 requests=requests,
-                requestCount=helper_connections.get_connection_request_count(),
             )
     else:
         return render_template(
             "error.html",
             message=["You are not logged in to an admin account"],
-            requestCount=helper_connections.get_connection_request_count(),
         )
 
 
@@ -63,11 +60,13 @@ def accept_staff(username: str):
     Returns:
         Redirection to the administration page.
     """
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         cur.execute(
             "UPDATE ACCOUNTS SET type=? WHERE username=? ;", ("staff", username)
         )
+        conn.commit()
+    helper_profile.invalidate_user(username)
     return redirect("/admin")
 
 
@@ -82,9 +81,11 @@ def reject_staff(username: str):
     Returns:
         Redirection to the administration page.
     """
-    with sqlite3.connect("db.sqlite3") as conn:
+    with helper_database.get_db() as conn:
         cur = conn.cursor()
         cur.execute(
             "UPDATE ACCOUNTS SET type=? WHERE username=? ;", ("student", username)
         )
+        conn.commit()
+    helper_profile.invalidate_user(username)
     return redirect("/admin")
@@ -0,0 +1,34 @@
+import shutil
+
+import pytest
+from student_network.app import app as flask_app
+
+
+@pytest.fixture
+def app(tmp_path):
+    """
+    Provides the application backed by a throwaway copy of the database.
+    """
+    database = tmp_path / "db.sqlite3"
+    shutil.copyfile("db.sqlite3", database)
+    flask_app.config.update(
+        TESTING=True,
+        DATABASE=str(database),
+        EVENT_WORKER=False,
+        IMAGE_PIPELINE="inline",
+        IMAGE_DIRECTORY=str(tmp_path / "images"),
+    )
+    yield flask_app
+    flask_app.config["DATABASE"] = "db.sqlite3"
+
+
+@pytest.fixture
+def client(app):
+    """
+    Provides a test client logged in as a demo student account.
+    """
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["username"] = "student1"
+        session["admin"] = False
+    return client
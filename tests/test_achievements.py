@@ -0,0 +1,122 @@
+import sqlite3
+
+import student_network.helpers.helper_achievements as helper_achievements
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_leaderboard as helper_leaderboard
+from flask import session
+
+
+def get_experience_and_notifications(username: str) -> tuple:
+    """
+    Gets a user's experience and number of notifications.
+    """
+    with helper_database.get_db() as conn:
+        return conn.execute(
+            "SELECT (SELECT experience FROM UserLevel WHERE username=:username), "
+            "(SELECT COUNT(*) FROM notification WHERE username=:username);",
+            {"username": username},
+        ).fetchone()
+
+
+def test_award_achievements(app):
+    """
+    Tests that achievements are unlocked at most once, with the experience
+    and notifications for every unlock written in one transaction.
+    """
+    unlocks = [("student1", 16), ("student1", 4), ("student6", 16), ("student6", 16)]
+    with app.test_request_context():
+        session["username"] = "student1"
+        conn = helper_database.get_db()
+        statements = []
+        conn.set_trace_callback(statements.append)
+        unlocked = helper_achievements.award_achievements(unlocks)
+        conn.set_trace_callback(None)
+
+        assert sorted(unlocked) == [("student1", 16), ("student6", 16)]
+        assert statements.count("COMMIT") == 1
+        assert get_experience_and_notifications("student1") == (2411, 8)
+        assert get_experience_and_notifications("student6") == (450, 5)
+
+        assert helper_achievements.award_achievements(unlocks) == []
+        assert get_experience_and_notifications("student1") == (2411, 8)
+
+
+def test_get_achievements(app):
+    """
+    Tests that achievements are split into unlocked and locked ones from the
+    cached catalog.
+    """
+    with app.test_request_context():
+        unlocked, locked = helper_achievements.get_achievements("student1")
+    assert len(unlocked) == 21
+    assert len(locked) == 12
+    assert [x[3] for x in unlocked] == sorted((x[3] for x in unlocked), reverse=True)
+    assert [x[3] for x in locked] == sorted(x[3] for x in locked)
+
+
+def test_leaderboard(app):
+    """
+    Tests that ranks and pages come from the in-memory leaderboard, and that
+    it follows experience awarded for achievements.
+    """
+    with app.test_request_context():
+        leaderboard = helper_leaderboard.get_leaderboard()
+        assert len(leaderboard) == 14
+        assert leaderboard.get_rank("student4") == 5
+        assert leaderboard.get_rank("nobody") is None
+        assert leaderboard.get_page(0, 2) == [
+            (1, "student1", 2361),
+            (2, "student2", 826),
+        ]
+        assert leaderboard.get_neighbours("student8", 1) == [
+            (10, "adminuser", 50),
+            (11, "student8", 50),
+            (12, "student1000", 25),
+        ]
+
+        helper_achievements.award_achievements([("student8", 16)])
+        assert leaderboard.get_rank("student8") == 10
+        with helper_database.get_db() as conn:
+            reloaded = helper_leaderboard.Leaderboard.load(conn)
+        assert leaderboard.get_page(0, 14) == reloaded.get_page(0, 14)
+
+
+def test_leaderboard_sees_other_workers(app):
+    """
+    Tests that the leaderboard ranks experience changed by another process,
+    and drops users whose level another process deleted.
+    """
+    with app.test_request_context():
+        leaderboard = helper_leaderboard.get_leaderboard()
+    with sqlite3.connect(app.config["DATABASE"]) as conn:
+        conn.execute("UPDATE UserLevel SET experience=5000 WHERE username='student8';")
+        conn.execute("DELETE FROM UserLevel WHERE username='student2';")
+    with app.test_request_context():
+        assert helper_leaderboard.get_leaderboard() is leaderboard
+        assert leaderboard.get_page(0, 2) == [
+            (1, "student8", 5000),
+            (2, "student1", 2361),
+        ]
+        assert leaderboard.get_rank("student2") is None
+        assert len(leaderboard) == 13
+
+
+def test_leaderboard_page(client):
+    """
+    Tests that the leaderboard API returns one page of ranked users at a time.
+    """
+    response = client.get("/leaderboard/page?offset=12&limit=5").get_json()
+    assert response["total"] == 14
+    assert [x["rank"] for x in response["users"]] == [13, 14]
+    assert response["next"] is None
+
+    response = client.get("/leaderboard/page?limit=2").get_json()
+    assert [x["username"] for x in response["users"]] == ["student1", "student2"]
+    assert response["users"][0]["experience"] == 2361
+    assert response["next"] == 2
+
+    response = client.get("/leaderboard/page?around_me&limit=2").get_json()
+    assert [x["username"] for x in response["users"]] == ["student1", "student2"]
+
+    assert client.get("/leaderboard/page?offset=first").status_code == 400
+    assert client.get("/leaderboard").status_code == 200
@@ -0,0 +1,29 @@
+import time
+
+import student_network.helpers.helper_cache as helper_cache
+
+
+def test_cache_evicts_least_recently_used():
+    """
+    Tests that a full cache evicts the entry which was used longest ago.
+    """
+    cache = helper_cache.TTLCache(2, 60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_cache_entries_expire():
+    """
+    Tests that entries are no longer returned once their time to live ends.
+    """
+    cache = helper_cache.TTLCache(2, 0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a", "expired") == "expired"
+    assert cache.misses == 1
@@ -0,0 +1,297 @@
+import pytest
+import student_network.app as student_network_app
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_general as helper_general
+import student_network.helpers.helper_messages as helper_messages
+import student_network.helpers.helper_presence as helper_presence
+from flask import request, session
+
+
+def count_messages(text: str) -> int:
+    """
+    Counts the stored private messages with the given text.
+    """
+    with helper_database.get_pool().connection() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM PrivateMessages WHERE message=?;", (text,)
+        ).fetchone()[0]
+
+
+def send_message(app, monkeypatch, payload: dict) -> list:
+    """
+    Sends a private message from student1 to an online user, as the socket
+    handler would receive it.
+
+    Returns:
+        The events emitted to the recipient.
+    """
+    emitted = []
+    monkeypatch.setattr(
+        student_network_app.socketio,
+        "emit",
+        lambda *args, **kwargs: emitted.append((args, kwargs["room"])),
+    )
+    with app.test_request_context():
+        helper_presence.get_presence().register(payload["username"], "sid")
+        session["username"] = "student1"
+        student_network_app.private_message(payload)
+    return emitted
+
+
+def test_messages_written_behind(app, monkeypatch):
+    """
+    Tests that a message is delivered straight away while it waits in the
+    buffer, and is written before messages are next read.
+    """
+    monkeypatch.setattr(helper_messages, "FLUSH_INTERVAL", 60)
+    payload = {"username": "student2", "message": "Buffered hello"}
+    emitted = send_message(app, monkeypatch, payload)
+    assert emitted == [(("new_private_message", payload), "sid")]
+
+    with app.test_request_context():
+        assert count_messages("Buffered hello") == 0
+        messages, _ = helper_messages.get_history("student1", "student2")
+        assert messages[0][:2] == ("Buffered hello", "student1")
+        helper_messages.get_writer().close()
+
+
+def test_failed_messages_set_aside(app, monkeypatch):
+    """
+    Tests that a message which can't be written doesn't stop chat from being
+    read, and is set aside after repeated failures so the rest are written.
+    """
+    monkeypatch.setattr(helper_messages, "FLUSH_INTERVAL", 60)
+    write_messages = helper_messages.write_messages
+
+    def fail_on_bad(conn, rows):
+        if any(x[2] == "Bad" for x in rows):
+            raise ValueError("Bad message")
+        write_messages(conn, rows)
+
+    monkeypatch.setattr(helper_messages, "write_messages", fail_on_bad)
+    send_message(app, monkeypatch, {"username": "student2", "message": "Good"})
+    send_message(app, monkeypatch, {"username": "student2", "message": "Bad"})
+    with app.test_request_context():
+        for _ in range(helper_messages.MAX_FLUSH_ATTEMPTS - 1):
+            helper_messages.get_history("student1", "student2")
+            assert count_messages("Good") == 0
+        helper_messages.get_history("student1", "student2")
+        assert count_messages("Good") == 1
+        conn = helper_database.get_db()
+        assert conn.execute(
+            "SELECT message, error FROM FailedPrivateMessage;"
+        ).fetchall() == [("Bad", "ValueError('Bad message')")]
+        helper_messages.get_writer().close()
+
+
+def test_messages_flushed_on_request_connection(app, monkeypatch):
+    """
+    Tests that reading messages writes the buffered ones on the request's
+    own connection, without waiting for another from the pool, and leaves
+    them to the writer while the request has uncommitted changes.
+    """
+    monkeypatch.setattr(helper_messages, "FLUSH_INTERVAL", 60)
+    send_message(app, monkeypatch, {"username": "student2", "message": "Pooled"})
+    with app.test_request_context():
+        conn = helper_database.get_db()
+        pool = helper_database.get_pool()
+        held = [pool.acquire(timeout=1) for _ in range(pool.max_size - 1)]
+        try:
+            conn.execute("UPDATE Conversation SET unread1=unread1;")
+            messages, _ = helper_messages.get_history("student1", "student2")
+            assert messages[0][0] != "Pooled"
+            conn.commit()
+            messages, _ = helper_messages.get_history("student1", "student2")
+            assert messages[0][:2] == ("Pooled", "student1")
+            assert helper_database.get_connection_count() == 1
+        finally:
+            for held_conn in held:
+                pool.release(held_conn)
+        helper_messages.get_writer().close()
+
+
+def test_messages_written_immediately(app, monkeypatch):
+    """
+    Tests that the immediate durability mode commits each message before it
+    is delivered.
+    """
+    monkeypatch.setitem(app.config, "MESSAGE_DURABILITY", "immediate")
+    send_message(app, monkeypatch, {"username": "student2", "message": "Durable hello"})
+    with app.app_context():
+        assert count_messages("Durable hello") == 1
+
+
+def test_conversations(app, client, monkeypatch):
+    """
+    Tests that the chat room list shows each conversation's latest message
+    and unread count, which are cleared when the conversation is opened and
+    can be rebuilt from the stored messages.
+    """
+    with app.test_request_context():
+        session["username"] = "student2"
+        rooms = helper_general.get_rooms()
+        assert rooms[0][:3] == ("student1", rooms[0][1], "hey")
+        assert rooms[0][4] == 0
+        assert [x[2:] for x in rooms[1:]] == [("", "", 0)] * (len(rooms) - 1)
+
+    send_message(app, monkeypatch, {"username": "student2", "message": "First"})
+    send_message(app, monkeypatch, {"username": "student2", "message": "Second"})
+    with app.test_request_context():
+        session["username"] = "student2"
+        room = helper_general.get_rooms()[0]
+        assert (room[2], room[4]) == ("Second", 2)
+        session["username"] = "student1"
+        assert helper_general.get_rooms()[0][4] == 0
+
+        session["username"] = "student2"
+        helper_messages.mark_read("student2", "student1")
+        assert helper_general.get_rooms()[0][4] == 0
+
+        conn = helper_database.get_db()
+        before = helper_messages.get_conversations("student1")
+        helper_messages.backfill_conversations(conn)
+        assert helper_messages.get_conversations("student1") == before
+        helper_messages.get_writer().close()
+
+
+def test_chat_history_pages(client):
+    """
+    Tests that chat history is returned a page at a time, newest first, with
+    a cursor for loading older messages.
+    """
+    page = client.get("/chat/student2/history?limit=1").get_json()
+    assert page["messages"] == [
+        {"message": "hey", "sender": "student1", "date": "2021-05-20 17:14:47"}
+    ]
+    page = client.get(
+        "/chat/student2/history", query_string={"cursor": page["next_cursor"]}
+    ).get_json()
+    assert [x["message"] for x in page["messages"]] == ["hello"]
+    assert page["next_cursor"] is None
+
+    assert client.get("/chat/student2/history?cursor=bad").status_code == 400
+    assert client.get("/chat/student2").status_code == 200
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_presence(app, monkeypatch, backend):
+    """
+    Tests that each presence backend tracks every session of a user until
+    they disconnect, and that the SQLite backend is shared between workers.
+    """
+    monkeypatch.setitem(app.config, "PRESENCE_BACKEND", backend)
+    with app.app_context():
+        presence = helper_presence.get_presence()
+        presence.register("student1", "sid1")
+        presence.register("student1", "sid2")
+        presence.register("student2", "sid3")
+        assert presence.lookup("student1") == ["sid1", "sid2"]
+
+        presence.unregister("sid1")
+        presence.unregister("unknown")
+        assert presence.lookup("student1") == ["sid2"]
+        assert presence.lookup("student3") == []
+
+        other_worker = helper_presence.BACKENDS[backend](app.config["DATABASE"])
+        shared = backend == "sqlite"
+        assert other_worker.lookup("student2") == (["sid3"] if shared else [])
+
+
+def test_presence_of_stopped_workers(app):
+    """
+    Tests that sessions of a worker which stopped without disconnecting them
+    expire, and are cleared when the worker starts again.
+    """
+    with app.app_context():
+        crashed = helper_presence.SQLitePresence(app.config["DATABASE"], "worker1")
+        crashed.register("student1", "sid1")
+        crashed.register("student2", "sid2")
+        other = helper_presence.SQLitePresence(app.config["DATABASE"], "worker2")
+        assert other.lookup("student1") == ["sid1"]
+
+        conn = helper_database.get_db()
+        conn.execute("UPDATE Presence SET expires=0 WHERE sid='sid1';")
+        conn.commit()
+        assert other.lookup("student1") == []
+        other.renew()
+        assert conn.execute("SELECT sid FROM Presence;").fetchall() == [("sid2",)]
+
+        helper_presence.SQLitePresence(app.config["DATABASE"], "worker1")
+        assert other.lookup("student2") == []
+
+
+def test_offline_delivery(app, monkeypatch):
+    """
+    Tests that messages to an offline user are pushed to them in one emit
+    when they connect, until their client acknowledges them.
+    """
+    emitted = []
+    monkeypatch.setattr(
+        student_network_app.socketio,
+        "emit",
+        lambda event, data, **kwargs: emitted.append((event, data, kwargs["room"])),
+    )
+    with app.test_request_context():
+        session["username"] = "student1"
+        student_network_app.private_message({"username": "student3", "message": "Hi"})
+        student_network_app.private_message({"username": "student3", "message": "Yo"})
+        assert emitted == []
+
+    def connect(sid: str) -> list:
+        emitted.clear()
+        with app.test_request_context():
+            session["username"] = "student3"
+            request.sid = sid
+            student_network_app.receive_username("student3")
+        return emitted
+
+    ((event, messages, room),) = connect("sid1")
+    assert (event, room) == ("pending_private_messages", "sid1")
+    assert [(x["sender_username"], x["message"]) for x in messages] == [
+        ("student1", "Hi"),
+        ("student1", "Yo"),
+    ]
+    # Unacknowledged messages are pushed again on the next connection.
+    assert len(connect("sid2")[0][1]) == 2
+
+    with app.test_request_context():
+        session["username"] = "student3"
+        student_network_app.delivered([messages[0]["id"]])
+    assert [x["message"] for x in connect("sid3")[0][1]] == ["Yo"]
+
+
+def test_offline_messages_rendered_once(app, monkeypatch):
+    """
+    Tests that the chat page marks the offline messages it renders, so the
+    client acknowledges them instead of showing them again when they are
+    pushed.
+    """
+    monkeypatch.setitem(app.config, "MESSAGE_DURABILITY", "immediate")
+    with app.test_request_context():
+        session["username"] = "student1"
+        student_network_app.private_message({"username": "student3", "message": "Hi"})
+        ((message_id, *_),) = helper_messages.get_pending("student3")
+
+    client = app.test_client()
+    with client.session_transaction() as client_session:
+        client_session["username"] = "student3"
+    page = client.get("/chat/student1").get_data(as_text=True)
+    assert "const renderedIds = new Set([{}]);".format(message_id) in page
+
+
+def test_pending_messages_survive_vacuum(app, monkeypatch):
+    """
+    Tests that pending deliveries still point at their messages after the
+    database is vacuumed, which may renumber rows without an explicit ID.
+    """
+    monkeypatch.setitem(app.config, "MESSAGE_DURABILITY", "immediate")
+    with app.test_request_context():
+        session["username"] = "student1"
+        student_network_app.private_message({"username": "student3", "message": "Hi"})
+        conn = helper_database.get_db()
+        conn.execute("DELETE FROM PrivateMessages WHERE message!='Hi';")
+        # VACUUM renumbers the implicit rowids of tables without indexes.
+        conn.execute("DROP INDEX PrivateMessages_pair_timestamp_index;")
+        conn.commit()
+        conn.execute("VACUUM;")
+        assert [x[2] for x in helper_messages.get_pending("student3")] == ["Hi"]
@@ -0,0 +1,165 @@
+import sqlite3
+
+import student_network.helpers.helper_connections as helper_connections
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_graph as helper_graph
+import student_network.helpers.helper_recommendations as helper_recommendations
+from flask import session
+
+
+def test_recommendations(app):
+    """
+    Tests that recommendations are scored on mutual connections, hobbies,
+    interests and degree, and skip pending requests and existing connections.
+    """
+    with app.test_request_context():
+        session["username"] = "student1"
+        assert helper_recommendations.recommend("student1") == [
+            [
+                "student5",
+                "You are both interested in <b>book</b>, <b>reading</b> and "
+                "<b>swimming</b>",
+                25,
+            ],
+            [
+                "student6",
+                "You both enjoy hobbies including <b>coding</b> and "
+                "<b>programming</b>",
+                15,
+            ],
+            ["student7", "You both study <b>Computer Science BSc</b>", 5],
+        ]
+
+    # student2 is already connected, so sharing a hobby doesn't make them a
+    # recommendation.
+    with sqlite3.connect(app.config["DATABASE"]) as conn:
+        conn.execute(
+            "INSERT INTO UserHobby (username, hobby) VALUES ('student2', 'coding');"
+        )
+    with app.test_request_context():
+        session["username"] = "student1"
+        recommended = [x[0] for x in helper_recommendations.recommend("student1")]
+    assert "student2" not in recommended
+
+
+def test_recommendations_invalidated(client):
+    """
+    Tests that cached recommendations are worked out again when a mutual
+    connection is removed.
+    """
+    mutual = ["student4", "1 mutual connections including <b>student1</b>", 10]
+    with client.application.test_request_context():
+        session["username"] = "student2"
+        assert mutual in helper_connections.get_recommended_connections("student2")
+
+    with client.session_transaction() as client_session:
+        client_session["prev-page"] = "/feed"
+    client.get("/remove_connection/student2")
+
+    with client.application.test_request_context():
+        session["username"] = "student2"
+        assert mutual not in helper_connections.get_recommended_connections("student2")
+
+
+def test_social_graph(app):
+    """
+    Tests that the social graph index answers relationship checks the same
+    way as the Connection and CloseFriend tables.
+    """
+    with app.app_context():
+        graph = helper_graph.get_graph()
+    assert graph.get_connections("student1") == {"student2", "student4", "staffuser"}
+    assert graph.get_mutual_connections("student1", "student3") == {"student4"}
+    assert graph.get_connection_type("student1", "student3") == "request"
+    assert graph.get_connection_type("student3", "student1") == "incoming"
+    assert graph.get_connection_type("student1", "student5") is None
+    assert graph.is_close_friend("student1", "student2")
+    assert not graph.is_close_friend("student2", "student1")
+
+
+def test_social_graph_kept_coherent(app, client):
+    """
+    Tests that the index matches the database after connections are
+    requested, accepted, blocked and removed, and close friends changed.
+    """
+    with client.session_transaction() as client_session:
+        client_session["prev-page"] = "/requests"
+    client.get("/connect_request/student5")
+    client.get("/close_connection/student4")
+    client.get("/remove_close_friend/student2")
+    client.get("/block_user/student6")
+    client.get("/block_user/student7")
+    client.get("/unblock_user/student7")
+    client.get("/remove_connection/staffuser")
+    with client.session_transaction() as client_session:
+        client_session["username"] = "staffusertwo"
+    client.get("/accept_connection_request/student1")
+
+    with app.app_context():
+        graph = helper_graph.get_graph()
+    loaded = helper_graph.SocialGraph.load(sqlite3.connect(app.config["DATABASE"]))
+    users = ["staffuser", "staffusertwo"] + ["student{}".format(x) for x in range(1, 8)]
+    for user1 in users:
+        assert graph.get_connections(user1) == loaded.get_connections(user1)
+        for user2 in users:
+            assert graph.get_connection_type(
+                user1, user2
+            ) == loaded.get_connection_type(user1, user2)
+            assert graph.is_close_friend(user1, user2) == loaded.is_close_friend(
+                user1, user2
+            )
+    assert graph.get_connection_type("student1", "student5") == "request"
+    assert graph.get_connection_type("student1", "student6") == "block"
+    assert graph.get_connection_type("staffusertwo", "student1") == "connected"
+
+
+def test_social_graph_sees_other_workers(app):
+    """
+    Tests that the index picks up changes another process made to the
+    database, and is loaded again if the change log has moved past it.
+    """
+    with app.app_context():
+        graph = helper_graph.get_graph()
+    with sqlite3.connect(app.config["DATABASE"]) as conn:
+        conn.execute(
+            "DELETE FROM Connection WHERE user1 IN ('student1', 'student2') "
+            "AND user2 IN ('student1', 'student2');"
+        )
+        conn.execute("DELETE FROM CloseFriend WHERE user1='student1';")
+        conn.execute(
+            "INSERT INTO Connection (user1, user2, connection_type) "
+            "VALUES ('student5', 'student1', 'block');"
+        )
+    with app.test_request_context():
+        session["username"] = "student1"
+        assert helper_graph.get_graph() is graph
+        assert helper_connections.get_connection_type("student2") is None
+        assert not helper_connections.is_close_friend("student1", "student2")
+        assert helper_connections.get_connection_type("student5") == "blocked"
+
+    with sqlite3.connect(app.config["DATABASE"]) as conn:
+        conn.execute(
+            "INSERT INTO CloseFriend (user1, user2) VALUES ('student1', 'student4');"
+        )
+        conn.execute("DELETE FROM GraphChange;")
+    with app.app_context():
+        reloaded = helper_graph.get_graph()
+    assert reloaded is not graph
+    assert reloaded.is_close_friend("student1", "student4")
+
+
+def test_social_graph_uses_request_connection(app):
+    """
+    Tests that loading and syncing the index reads through the request's
+    connection, so it doesn't wait on a pool other requests have used up.
+    """
+    with app.test_request_context():
+        helper_database.get_db()
+        pool = helper_database.get_pool()
+        held = [pool.acquire(timeout=1) for _ in range(pool.max_size - 1)]
+        try:
+            assert "student2" in helper_graph.get_graph().get_connections("student1")
+            assert helper_database.get_connection_count() == 1
+        finally:
+            for conn in held:
+                pool.release(conn)
@@ -0,0 +1,159 @@
+import re
+import sqlite3
+import threading
+
+import pytest
+import student_network.helpers.helper_achievements as helper_achievements
+import student_network.helpers.helper_connections as helper_connections
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_events as helper_events
+import student_network.helpers.helper_general as helper_general
+import student_network.helpers.helper_graph as helper_graph
+import student_network.helpers.helper_messages as helper_messages
+import student_network.helpers.helper_migrations as helper_migrations
+import student_network.helpers.helper_navbar as helper_navbar
+import student_network.helpers.helper_notifications as helper_notifications
+import student_network.helpers.helper_paging as helper_paging
+import student_network.helpers.helper_posts as helper_posts
+import student_network.helpers.helper_recommendations as helper_recommendations
+import student_network.helpers.helper_search as helper_search
+from flask import session
+
+
+def test_pool_reuses_connections(tmp_path):
+    """
+    Tests that released connections are handed out again instead of new ones
+    being opened.
+    """
+    pool = helper_database.ConnectionPool(str(tmp_path / "pool.sqlite3"), 2)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    assert pool.opened == 1
+    assert conn.execute("PRAGMA journal_mode;").fetchone()[0] == "wal"
+
+
+def test_pool_is_bounded(tmp_path):
+    """
+    Tests that the pool never opens more connections than its maximum size.
+    """
+    pool = helper_database.ConnectionPool(str(tmp_path / "pool.sqlite3"), 2)
+    pool.acquire()
+    conn = pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.01)
+
+    threading.Timer(0.05, pool.release, (conn,)).start()
+    assert pool.acquire(timeout=1) is conn
+    assert pool.opened == 2
+
+
+def test_one_connection_per_request(client):
+    """
+    Tests that rendering the feed uses a single shared connection.
+    """
+    response = client.get("/feed")
+    assert response.status_code == 200
+    assert response.headers["X-DB-Connections"] == "1"
+    response = client.get("/fetch_posts/?number=5")
+    assert response.headers["X-DB-Connections"] == "1"
+
+
+def test_migrations_are_idempotent(tmp_path):
+    """
+    Tests that migrating brings a database to the latest version and that
+    running the migrations again changes nothing.
+    """
+    conn = sqlite3.connect(str(tmp_path / "db.sqlite3"))
+    conn.executescript(
+        "CREATE TABLE POSTS "
+        "(postId INTEGER PRIMARY KEY, username VARCHAR, body VARCHAR, date DATE, "
+        "privacy VARCHAR);"
+        "CREATE TABLE ACCOUNTS (username VARCHAR PRIMARY KEY);"
+        "CREATE TABLE Connection (user1 TEXT, user2 TEXT, connection_type TEXT);"
+        "CREATE TABLE CloseFriend (user1 TEXT, user2 TEXT);"
+        "CREATE TABLE Comments "
+        "(commentId INTEGER PRIMARY KEY, postId BIGINT, body TEXT, date DATETIME);"
+        "CREATE TABLE UserLikes (username VARCHAR, postId INTEGER);"
+        "CREATE TABLE AllUserLikes (username VARCHAR, postId INTEGER);"
+        "CREATE TABLE PostContent (postId INTEGER, contentUrl TEXT);"
+        "CREATE TABLE notification (username STRING, date DATETIME);"
+        "CREATE TABLE PrivateMessages "
+        "(sender STRING, receiver STRING, message TEXT, date);"
+        "CREATE TABLE UserHobby (username VARCHAR, hobby TEXT);"
+        "CREATE TABLE UserInterests (username VARCHAR, interest TEXT);"
+        "CREATE TABLE UserProfile (username VARCHAR, name VARCHAR, "
+        "profilepicture TEXT, degree INTEGER);"
+        "CREATE TABLE Degree (degreeId INTEGER PRIMARY KEY, degree STRING);"
+        "CREATE TABLE UserLevel (username TEXT PRIMARY KEY, experience INTEGER);"
+    )
+    assert helper_migrations.migrate(conn) == len(helper_migrations.MIGRATIONS)
+    schema = conn.execute("SELECT * FROM sqlite_master;").fetchall()
+    assert helper_migrations.migrate(conn) == len(helper_migrations.MIGRATIONS)
+    assert conn.execute("SELECT * FROM sqlite_master;").fetchall() == schema
+
+
+# Tables which are kept small enough that scanning them is intended. Full
+# text tables are searched through their own index, which shows as a MATCH
+# constraint on the scan.
+SCANNED_TABLES = {"TimelineExempt"}
+
+
+def get_full_scans(conn, statements: list) -> list:
+    """
+    Gets the statements whose query plan scans a whole table.
+    """
+    tables = {
+        x[0] for x in conn.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    } - SCANNED_TABLES
+    full_scans = []
+    for statement in statements:
+        # Statements run inside virtual tables are traced as comments.
+        if statement.startswith("--"):
+            continue
+        for row in conn.execute("EXPLAIN QUERY PLAN " + statement):
+            match = re.match(r"SCAN (\w+)\b(?! VIRTUAL TABLE INDEX \d+:M)", row[3])
+            if match and match.group(1) in tables:
+                full_scans.append((statement, row[3]))
+    return full_scans
+
+
+@pytest.mark.parametrize("fanout", [False, True])
+def test_hot_queries_use_indexes(app, monkeypatch, fanout):
+    """
+    Tests that none of the queries on the hot paths fall back to scanning a
+    whole table.
+    """
+    monkeypatch.setitem(app.config, "FEED_FANOUT", fanout)
+    statements = []
+    with app.test_request_context("/feed"):
+        session["username"] = "student1"
+        conn = helper_database.get_db()
+        # The achievement catalog and social graph are deliberately read
+        # whole, once.
+        helper_achievements.get_catalog()
+        helper_graph.get_graph()
+        conn.set_trace_callback(statements.append)
+        helper_posts.fetch_posts(5)
+        helper_posts.fetch_posts(5, helper_paging.encode_cursor(6))
+        helper_notifications.get_notifications("student1", 10)
+        helper_notifications.get_notifications(
+            "student1", 10, helper_paging.encode_cursor(1621527287, 20)
+        )
+        helper_navbar.get_badge_counts("student1")
+        helper_messages.get_history("student1", "student2")
+        helper_messages.get_history(
+            "student1", "student2", 1, helper_paging.encode_cursor(1621527287, 2)
+        )
+        helper_general.get_rooms()
+        helper_messages.get_pending("student1")
+        helper_search.search_members("stu", "cod", offset=10)
+        helper_search.search_posts("student1", "hey", 2)
+        helper_connections.get_connection_request_count()
+        helper_recommendations.recommend("student1")
+        helper_achievements.get_connected_unlocks(conn.cursor(), "student1", "student2")
+        helper_events.process_events()
+        conn.set_trace_callback(None)
+
+        assert statements
+        assert get_full_scans(conn, statements) == []
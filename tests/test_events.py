@@ -0,0 +1,101 @@
+import pytest
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_events as helper_events
+
+
+def has_achievement(username: str, achievement_id: int) -> bool:
+    """
+    Checks whether a user has unlocked an achievement.
+    """
+    with helper_database.get_db() as conn:
+        return bool(
+            conn.execute(
+                "SELECT EXISTS (SELECT 1 FROM CompleteAchievements "
+                "WHERE username=? AND achievement_ID=?);",
+                (username, achievement_id),
+            ).fetchone()[0]
+        )
+
+
+def test_achievements_processed_off_request(app, client):
+    """
+    Tests that liking a post queues an event instead of awarding achievements
+    during the request, and that the worker awards them later.
+    """
+    client.post("/like_post", data={"postId": 2})
+    with app.app_context():
+        assert helper_events.get_queue_depth()["pending"] == 1
+        assert not has_achievement("student2", 20)
+
+        assert helper_events.process_events() == 1
+        assert has_achievement("student2", 20)
+        assert helper_events.get_queue_depth() == {
+            "pending": 0,
+            "leased": 0,
+            "failed": 0,
+        }
+
+
+def test_events_redelivered(app, monkeypatch):
+    """
+    Tests that events are handed out again when a worker dies before
+    finishing them or their handler fails, until they have failed too often.
+    """
+    monkeypatch.setattr(helper_events, "LEASE_SECONDS", 0)
+    processed = []
+    monkeypatch.setitem(
+        helper_events._handlers, "test", lambda cur, events: processed.extend(events)
+    )
+    with app.app_context():
+        conn = helper_database.get_db()
+        helper_events.publish(conn.cursor(), "test", value=1)
+        conn.commit()
+        # A worker leases the event and dies without processing it.
+        assert len(helper_events.claim_events(conn)) == 1
+        assert helper_events.process_events() == 1
+        assert processed == [{"value": 1}]
+
+        def fail(cur, events):
+            raise RuntimeError("Handler failed.")
+
+        monkeypatch.setitem(helper_events._handlers, "test", fail)
+        helper_events.publish(conn.cursor(), "test", value=2)
+        conn.commit()
+        for _ in range(helper_events.MAX_ATTEMPTS + 1):
+            assert helper_events.process_events() == 0
+        assert helper_events.get_queue_depth()["failed"] == 1
+
+
+def test_events_committed_with_change(app, client, monkeypatch):
+    """
+    Tests that liking, commenting and accepting a connection commit their
+    change and its event together, so neither is kept if the request fails
+    after publishing.
+    """
+    publish = helper_events.publish
+
+    def publish_then_fail(cur, name, **payload):
+        publish(cur, name, **payload)
+        raise RuntimeError("Crashed after publishing.")
+
+    def count_rows() -> tuple:
+        with helper_database.connection() as conn:
+            return conn.execute(
+                "SELECT (SELECT COUNT(*) FROM EventQueue), "
+                "(SELECT COUNT(*) FROM UserLikes), "
+                "(SELECT COUNT(*) FROM Comments), "
+                "(SELECT COUNT(*) FROM Connection WHERE connection_type='connected');"
+            ).fetchone()
+
+    monkeypatch.setattr(helper_events, "publish", publish_then_fail)
+    with app.app_context():
+        before = count_rows()
+    for url, data in (
+        ("/like_post", {"postId": 2}),
+        ("/submit_comment", {"postId": 2, "comment_text": "Lost"}),
+        ("/accept_connection_request/staffusertwo", {}),
+    ):
+        with pytest.raises(RuntimeError):
+            client.post(url, data=data)
+    with app.app_context():
+        assert count_rows() == before
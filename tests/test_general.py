@@ -1,4 +1,12 @@
+import sqlite3
+from datetime import datetime
+
+import student_network.helpers.helper_autocomplete as helper_autocomplete
+import student_network.helpers.helper_database as helper_database
 import student_network.helpers.helper_general as helper_general
+import student_network.helpers.helper_navbar as helper_navbar
+import student_network.helpers.helper_notifications as helper_notifications
+from flask import session
 
 
 def test_is_allowed_photo_file():
@@ -9,3 +17,193 @@ def test_is_allowed_photo_file():
     assert helper_general.is_allowed_photo_file(file_name) is True
     invalid_file_name = "test.txt"
     assert helper_general.is_allowed_photo_file(invalid_file_name) is False
+
+
+def test_navbar_badges(app):
+    """
+    Tests that the navigation bar limits notifications, counts the unread
+    ones, and updates its cached counts when a notification is added.
+    """
+    with app.test_request_context():
+        session["username"] = "student2"
+        navbar = helper_navbar.get_navbar()
+        assert len(navbar["notifications"]) == helper_navbar.NOTIFICATION_LIMIT
+        assert navbar["notificationCount"] == 12
+
+    with app.test_request_context():
+        session["username"] = "student1"
+        helper_general.new_notification_username("student2", "Hello", "/feed")
+
+    with app.test_request_context():
+        session["username"] = "student2"
+        assert helper_navbar.get_navbar()["notificationCount"] == 13
+
+
+def test_notifications(app, client, monkeypatch):
+    """
+    Tests that notifications are paged with a cursor, marked read when
+    opened or all at once, and compacted once old and read or too many.
+    """
+    page = client.get("/notifications?limit=5").get_json()
+    assert len(page["notifications"]) == 5
+    seen = [x["id"] for x in page["notifications"]]
+    page = client.get(
+        "/notifications", query_string={"cursor": page["next_cursor"]}
+    ).get_json()
+    assert page["next_cursor"] is None
+    seen += [x["id"] for x in page["notifications"]]
+    assert len(set(seen)) == 7
+    assert client.get("/notifications?cursor=bad").status_code == 400
+
+    notification = page["notifications"][0]
+    response = client.get("/notifications/{}".format(notification["id"]))
+    assert response.location == notification["url"]
+    with app.test_request_context():
+        assert helper_navbar.get_badge_counts("student1")[1] == 6
+    client.post("/notifications/read")
+    with app.test_request_context():
+        assert helper_navbar.get_badge_counts("student1")[1] == 0
+
+    with app.app_context():
+        with helper_database.connection() as conn:
+            # student1's notifications are now read and older than 90 days.
+            assert helper_notifications.compact_notifications(conn) == 7
+            # Only student2 has more than four notifications.
+            monkeypatch.setitem(app.config, "NOTIFICATION_MAX_PER_USER", 4)
+            assert helper_notifications.compact_notifications(conn) == 8
+
+
+def test_timestamps(app):
+    """
+    Tests that stored dates are backfilled as Unix timestamps and that ages
+    are worked out from them in one batch.
+    """
+    assert helper_general.format_ages([100, 40, 100 - 3600 * 24], now=100) == [
+        "Just Now",
+        "1m",
+        "1d",
+    ]
+    assert helper_general.format_dates([1621555200]) == ["21-05-21"]
+    with app.app_context():
+        conn = helper_database.get_db()
+        assert (
+            conn.execute(
+                "SELECT COUNT(*) FROM notification WHERE timestamp IS NULL OR "
+                "datetime(timestamp, 'unixepoch', 'localtime')!=date;"
+            ).fetchone()[0]
+            == 0
+        )
+        # The demo messages were dated in local time.
+        sent = datetime(2021, 5, 20, 17, 14, 46).timestamp()
+        assert conn.execute(
+            "SELECT timestamp FROM PrivateMessages ORDER BY id;"
+        ).fetchall() == [(sent,), (sent + 1,)]
+
+
+def test_member_search(app, client):
+    """
+    Tests that members are found by the start of any word in their username,
+    name, hobbies or interests, and that results are paged.
+    """
+    page = client.get("/search_query?chars=stu&hobby=&interest=&limit=5").get_json()
+    assert len(page["users"]) == 5
+    assert page["next"] == 5
+    page = client.get("/search_query?chars=stu&offset=10&limit=5").get_json()
+    assert page["next"] is None
+    assert client.get("/search_query?chars=stu&limit=x").status_code == 400
+
+    page = client.get("/search_query?chars=first&hobby=prog&interest=").get_json()
+    assert page["users"] == [
+        [
+            "student1",
+            "programming",
+            None,
+            "/static/images/default-pfp.jpg",
+            "Computer Science BSc",
+        ]
+    ]
+
+    with app.app_context():
+        conn = helper_database.get_db()
+        conn.execute("INSERT INTO UserHobby VALUES ('student2', 'rock climbing');")
+        conn.execute("UPDATE UserProfile SET name='Zed' WHERE username='student3';")
+        conn.commit()
+    page = client.get("/search_query?hobby=rock+cli").get_json()
+    assert [x[:2] for x in page["users"]] == [["student2", "rock climbing"]]
+    page = client.get("/search_query?chars=zed").get_json()
+    assert [x[0] for x in page["users"]] == ["student3"]
+
+
+def test_autocomplete_usernames(client):
+    """
+    Tests that usernames are suggested by prefix instead of sending every
+    username with each page.
+    """
+    response = client.get("/autocomplete_usernames?prefix=student100")
+    assert [x["username"] for x in response.get_json()] == [
+        "student1000",
+        "student1001",
+        "student1002",
+    ]
+    response = client.get("/autocomplete_usernames?prefix=staff")
+    assert response.get_json() == [
+        {"username": x, "profile_picture": "/static/images/default-pfp.jpg"}
+        for x in ("staffuser", "staffusertwo")
+    ]
+    assert client.get("/feed").status_code == 200
+
+
+def test_username_index(app):
+    """
+    Tests that the autocomplete index takes in new users and profile
+    pictures, and stops at the limit or the end of the prefix.
+    """
+    with app.app_context():
+        index = helper_autocomplete.get_index()
+        assert [x[0] for x in index.complete("student", 3)] == [
+            "student1",
+            "student1000",
+            "student1001",
+        ]
+        assert index.complete("zzz", 10) == []
+
+        conn = helper_database.get_db()
+        conn.execute(
+            "INSERT INTO ACCOUNTS (username, password, email) "
+            "VALUES ('student1000a', '', '');"
+        )
+        conn.execute(
+            "UPDATE UserProfile SET profilepicture='/new.jpg' "
+            "WHERE username='student1001';"
+        )
+        conn.commit()
+        helper_autocomplete.refresh(conn.cursor(), "student1000a", "student1001")
+        assert index.complete("student100", 10) == [
+            ("student1000", "/static/images/default-pfp.jpg"),
+            ("student1000a", None),
+            ("student1001", "/new.jpg"),
+            ("student1002", "/static/images/default-pfp.jpg"),
+        ]
+
+
+def test_username_index_sees_other_workers(app):
+    """
+    Tests that the autocomplete index takes in users registered and deleted
+    by another process.
+    """
+    with app.app_context():
+        index = helper_autocomplete.get_index()
+    with sqlite3.connect(app.config["DATABASE"]) as conn:
+        conn.execute(
+            "INSERT INTO ACCOUNTS (username, password, email) "
+            "VALUES ('student1000a', '', '');"
+        )
+        conn.execute("DELETE FROM UserProfile WHERE username='student1001';")
+        conn.execute("DELETE FROM ACCOUNTS WHERE username='student1001';")
+    with app.app_context():
+        assert helper_autocomplete.get_index() is index
+        assert [x[0] for x in index.complete("student100", 3)] == [
+            "student1000",
+            "student1000a",
+            "student1002",
+        ]
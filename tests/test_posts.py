@@ -0,0 +1,342 @@
+import io
+import os
+import sqlite3
+import time
+
+import pytest
+import student_network.helpers.helper_images as helper_images
+import student_network.helpers.helper_paging as helper_paging
+import student_network.helpers.helper_timeline as helper_timeline
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+
+def add_posts(app, posts):
+    """
+    Inserts posts into the test database.
+    """
+    with sqlite3.connect(app.config["DATABASE"]) as conn:
+        conn.executemany(
+            "INSERT INTO POSTS (postId, body, username, privacy) "
+            "VALUES (?, 'body', ?, ?);",
+            posts,
+        )
+
+
+def make_image(width=1200, height=900):
+    """
+    Creates a PNG image to upload.
+    """
+    file = io.BytesIO()
+    Image.new("RGB", (width, height), "red").save(file, format="PNG")
+    file.seek(0)
+    return file
+
+
+VISIBILITY_POSTS = [
+    (100, "student4", "close"),
+    (101, "student2", "close"),
+    (102, "student2", "private"),
+    (103, "student2", "protected"),
+    (104, "student3", "public"),
+    (105, "student1", "private"),
+    (106, "student1", "deleted"),
+]
+
+
+def get_timeline_readers(app, post_id):
+    """
+    Gets the users with a post in their precomputed timeline.
+    """
+    with sqlite3.connect(app.config["DATABASE"]) as conn:
+        rows = conn.execute(
+            "SELECT username FROM Timeline WHERE postId=?;", (post_id,)
+        ).fetchall()
+    return {x[0] for x in rows}
+
+
+def test_feed_visibility(app, client):
+    """
+    Tests that the feed only contains posts the user is allowed to see.
+    """
+    add_posts(app, VISIBILITY_POSTS)
+    response = client.get("/fetch_posts/?number=20")
+    post_ids = [x["postId"] for x in response.get_json()["AllPosts"]]
+    assert post_ids[:4] == [105, 103, 100, 12]
+    assert not {101, 102, 104, 106} & set(post_ids)
+
+
+def test_feed_post_details(client):
+    """
+    Tests that comments, likes and images are attached to each post.
+    """
+    cursor = helper_paging.encode_cursor(12)
+    response = client.get("/fetch_posts/?number=2&cursor=" + cursor)
+    posts = response.get_json()["AllPosts"]
+    assert [x["postId"] for x in posts] == [11, 10]
+    assert posts[0]["comment_count"] == 1
+    assert posts[0]["liked"] is True
+    assert posts[0]["comments"][0][5] is not None
+    assert posts[1]["liked"] is False
+
+    cursor = helper_paging.encode_cursor(6)
+    response = client.get("/fetch_posts/?number=1&cursor=" + cursor)
+    post = response.get_json()["AllPosts"][0]
+    assert len(post["images"]) == 7
+
+
+def test_feed_pagination(client):
+    """
+    Tests that following the next cursor walks through the whole feed once.
+    """
+    post_ids = []
+    cursor = ""
+    while cursor is not None:
+        response = client.get("/fetch_posts/?number=5&cursor=" + cursor)
+        page = response.get_json()
+        assert len(page["AllPosts"]) <= 5
+        post_ids += [x["postId"] for x in page["AllPosts"]]
+        cursor = page["next_cursor"]
+
+    assert post_ids == list(range(12, 0, -1))
+    response = client.get("/fetch_posts/?number=5&cursor=invalid")
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("fanout_limit", [1000, 2])
+def test_feed_fanout_matches_read(app, client, monkeypatch, fanout_limit):
+    """
+    Tests that the precomputed timeline gives the same feed as fan-out on
+    read, including for authors over the fan-out limit.
+    """
+    add_posts(app, VISIBILITY_POSTS)
+    response = client.get("/fetch_posts/?number=50")
+    expected = [x["postId"] for x in response.get_json()["AllPosts"]]
+
+    monkeypatch.setitem(app.config, "FEED_FANOUT", True)
+    monkeypatch.setitem(app.config, "FEED_FANOUT_LIMIT", fanout_limit)
+    with app.app_context():
+        helper_timeline.backfill()
+    if fanout_limit == 2:
+        assert get_timeline_readers(app, 12) == set()
+
+    post_ids = []
+    cursor = ""
+    while cursor is not None:
+        response = client.get("/fetch_posts/?number=3&cursor=" + cursor)
+        page = response.get_json()
+        post_ids += [x["postId"] for x in page["AllPosts"]]
+        cursor = page["next_cursor"]
+    assert post_ids == expected
+
+
+def test_feed_fanout_writes(app, client, monkeypatch):
+    """
+    Tests that posting, deleting and removing connections keep the
+    precomputed timeline up to date.
+    """
+    monkeypatch.setitem(app.config, "FEED_FANOUT", True)
+    with app.app_context():
+        helper_timeline.backfill()
+    assert "student2" in get_timeline_readers(app, 12)
+
+    client.post(
+        "/submit_post",
+        data={"privacy": "close", "post_text": "Hello", "allFileNames": ""},
+    )
+    assert get_timeline_readers(app, 13) == {"student1", "student2"}
+
+    client.post("/delete_post", data={"postId": 13})
+    assert get_timeline_readers(app, 13) == set()
+
+    with client.session_transaction() as session:
+        session["prev-page"] = "/feed"
+    client.get("/remove_connection/student2")
+    assert "student2" not in get_timeline_readers(app, 12)
+    assert get_timeline_readers(app, 2) == {"student2"}
+
+
+def test_search_posts(app, client):
+    """
+    Tests that searching finds posts and comments the user can see, with
+    phrases, prefixes, escaped snippets and pages, and nothing when logged
+    out.
+    """
+    add_posts(app, VISIBILITY_POSTS)
+    response = client.get("/search_posts?q=body")
+    assert [x["postId"] for x in response.get_json()["results"]] == [105, 103, 100]
+
+    results = client.get('/search_posts?q="stop spamming"').get_json()["results"]
+    assert [(x["postId"], x["commentId"]) for x in results] == [(8, 10)]
+    assert results[0]["snippet"] == "dude <mark>stop spamming</mark> okay?"
+    assert client.get("/search_posts?q=spam").get_json()["results"] == []
+    results = client.get("/search_posts?q=spam*").get_json()["results"]
+    assert [x["commentId"] for x in results] == [10]
+
+    seen = []
+    cursor = ""
+    while cursor is not None:
+        page = client.get(
+            "/search_posts", query_string={"q": "hey", "limit": 2, "cursor": cursor}
+        ).get_json()
+        seen += [x["postId"] for x in page["results"]]
+        cursor = page["next_cursor"]
+    assert seen == [11, 10, 9, 8, 7]
+    assert client.get("/search_posts?q=hey&cursor=bad").status_code == 400
+
+    client.post(
+        "/submit_post",
+        data={"post_text": "<b>hi</b>", "privacy": "public", "allFileNames": ""},
+    )
+    results = client.get("/search_posts?q=hi").get_json()["results"]
+    assert results[0]["snippet"] == "&lt;b&gt;<mark>hi</mark>&lt;/b&gt;"
+    client.post("/delete_post", data={"postId": results[0]["postId"]})
+    assert client.get("/search_posts?q=hi").get_json()["results"] == []
+
+    page = app.test_client().get("/search_posts?q=hey").get_json()
+    assert page == {"results": [], "next_cursor": None}
+
+
+def test_upload_images(app, client):
+    """
+    Tests that uploaded images are resized under the IDs they are given,
+    without keeping the original, and that files which aren't images are
+    turned away.
+    """
+    response = client.post(
+        "/upload_file",
+        data={
+            "a": (make_image(), "a.png"),
+            "b": (io.BytesIO(b"not an image"), "b.png"),
+        },
+    )
+    image_id, invalid = response.get_json()
+    assert invalid == ""
+    path = helper_images.get_image_path(
+        app.config["IMAGE_DIRECTORY"], "post_imgs", image_id
+    )
+    with Image.open(path) as img:
+        assert (img.format, img.size) == ("JPEG", (800, 600))
+    directory = app.config["IMAGE_DIRECTORY"]
+    assert not os.path.exists(helper_images.get_original_path(directory, image_id))
+
+    missing = "00000000-0000-0000-0000-000000000000"
+    response = client.get(
+        "/upload_status", query_string={"ids": image_id + "," + missing}
+    )
+    assert response.get_json() == {image_id: "done", missing: None}
+    assert client.get("/upload_status?ids=../db").status_code == 400
+
+
+def test_delete_images(app, client):
+    """
+    Tests that users can only delete images they uploaded and which are only
+    on their own posts, and that file names can't lead out of the images
+    folder.
+    """
+    other = app.test_client()
+    with other.session_transaction() as session:
+        session["username"] = "student2"
+    directory = app.config["IMAGE_DIRECTORY"]
+
+    def upload() -> tuple:
+        response = client.post("/upload_file", data={"a": (make_image(), "a.png")})
+        image_id = response.get_json()[0]
+        return image_id, helper_images.get_image_path(directory, "post_imgs", image_id)
+
+    image_id, path = upload()
+    anonymous = app.test_client().post("/delete_file?filename=" + image_id)
+    assert anonymous.status_code == 401
+    assert client.post("/delete_file?filename=../../db").status_code == 400
+    assert other.post("/delete_file?filename=" + image_id).status_code == 403
+    assert client.post("/delete_file?filename=" + image_id).status_code == 200
+    assert not os.path.exists(path)
+
+    image_id, path = upload()
+    for user in (client, other):
+        user.post(
+            "/submit_post",
+            data={"post_text": "", "privacy": "public", "allFileNames": image_id},
+        )
+    assert client.post("/delete_file?filename=" + image_id).status_code == 403
+    assert os.path.exists(path)
+
+    with pytest.raises(ValueError):
+        helper_images.delete_original(directory, "../../db.sqlite3")
+
+
+def test_image_pipeline(tmp_path):
+    """
+    Tests that the process pool resizes images in the background, turns
+    uploads away while its queue is full, and deletes every original.
+    """
+    pipeline = helper_images.ImagePipeline(workers=1, limit=1)
+    try:
+        image_id = pipeline.submit(
+            FileStorage(make_image(), "a.png"), str(tmp_path), "avatars"
+        )
+        assert pipeline.get_status(str(tmp_path), image_id) == "pending"
+        with pytest.raises(helper_images.QueueFull):
+            pipeline.submit(
+                FileStorage(make_image(), "b.png"), str(tmp_path), "avatars"
+            )
+
+        deadline = time.monotonic() + 30
+        while pipeline.pending_count() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert pipeline.get_status(str(tmp_path), image_id) == "done"
+        path = helper_images.get_image_path(str(tmp_path), "avatars", image_id)
+        with Image.open(path) as img:
+            assert img.size == (400, 400)
+        assert os.listdir(tmp_path / helper_images.ORIGINALS_FOLDER) == []
+
+        # Images which can't be decoded past their header aren't kept either.
+        truncated = io.BytesIO(make_image().getvalue()[:200])
+        with pytest.raises(OSError):
+            pipeline.submit(
+                FileStorage(truncated, "c.png"), str(tmp_path), "avatars", True
+            )
+        assert os.listdir(tmp_path / helper_images.ORIGINALS_FOLDER) == []
+    finally:
+        pipeline.close()
+
+
+def test_image_derivatives(app, client):
+    """
+    Tests that smaller copies of images are served in WebP or JPEG, and made
+    on first request for images uploaded before copies existed.
+    """
+    directory = app.config["IMAGE_DIRECTORY"]
+    avatar = helper_images.get_image_path(directory, "avatars", "old-avatar")
+    os.makedirs(os.path.dirname(avatar))
+    Image.open(make_image(400, 400)).convert("RGB").save(avatar)
+    url = helper_images.image_url("/static/images/avatars/old-avatar.jpg", 90)
+    assert url == "/images/avatars/old-avatar/96"
+    assert helper_images.image_url("/static/images/default-pfp.jpg", 90) == (
+        "/static/images/default-pfp.jpg"
+    )
+
+    response = client.get(url, headers={"Accept": "image/webp,*/*"})
+    assert response.headers["Vary"] == "Accept"
+    with Image.open(io.BytesIO(response.data)) as img:
+        assert (img.format, img.size) == ("WEBP", (96, 96))
+    response = client.get(url, headers={"Accept": "*/*"})
+    with Image.open(io.BytesIO(response.data)) as img:
+        assert (img.format, img.size) == ("JPEG", (96, 96))
+    assert os.path.exists(
+        helper_images.get_derivative_path(directory, "avatars", "old-avatar", 96, "jpg")
+    )
+    assert client.get("/images/avatars/old-avatar/97").status_code == 404
+    assert client.get("/images/avatars/missing/96").status_code == 404
+
+    (image_id,) = client.post(
+        "/upload_file", data={"a": (make_image(), "a.png")}
+    ).get_json()
+    for width in helper_images.DERIVATIVE_WIDTHS:
+        path = helper_images.get_derivative_path(
+            directory, "post_imgs", image_id, width, "webp"
+        )
+        with Image.open(path) as img:
+            assert img.size == (width, width * 3 // 4)
+    client.post("/delete_file", query_string={"filename": image_id})
+    assert client.get(helper_images.post_image_url(image_id, 200)).status_code == 404
@@ -1,3 +1,5 @@
+import student_network.helpers.helper_database as helper_database
+import student_network.helpers.helper_general as helper_general
 import student_network.helpers.helper_profile as helper_profile
 
 
@@ -46,3 +48,83 @@ def test_null_edit_profile():
     """
     valid, _ = helper_profile.validate_edit_profile("", "Male", "", [], [])
     assert valid is True
+
+
+def test_user_metadata_is_batched_and_cached(app):
+    """
+    Tests that user details are loaded in one query, then served from the
+    request and process caches until the user is invalidated.
+    """
+    statements = []
+
+    def trace(statement):
+        # Full text indexes read their own settings with internal queries,
+        # which depend on what the connection has already loaded.
+        if statement.startswith("SELECT") and "'main'." not in statement:
+            statements.append(statement)
+
+    with app.test_request_context():
+        conn = helper_database.get_db()
+        conn.set_trace_callback(trace)
+        users = helper_profile.get_users(["student1", "student2", "missing"])
+        assert users["missing"] is None
+        assert users["student1"].account_type == "student"
+        assert helper_profile.get_degree("student2") == (
+            users["student2"].degree_id,
+            users["student2"].degree,
+        )
+        assert len(statements) == 1
+
+    with app.test_request_context():
+        conn = helper_database.get_db()
+        conn.set_trace_callback(trace)
+        helper_profile.get_profile_picture("student1")
+        assert len(statements) == 1
+
+        conn.execute(
+            "UPDATE UserProfile SET profilepicture='new.jpg' WHERE username=?;",
+            ("student1",),
+        )
+        helper_profile.invalidate_user("student1")
+        assert helper_profile.get_profile_picture("student1") == "new.jpg"
+        assert len(statements) == 2
+
+
+def test_calculate_level():
+    """
+    Tests that the closed form level matches counting up level by level.
+    """
+    level, remaining, xp_next_level = 1, 0, 100
+    for experience in range(20000):
+        if remaining == xp_next_level:
+            level, remaining, xp_next_level = level + 1, 0, xp_next_level + 15
+        assert helper_profile.calculate_level(experience) == [
+            level,
+            remaining,
+            xp_next_level,
+        ]
+        remaining += 1
+
+
+def test_stored_level(app):
+    """
+    Tests that levels are read from UserLevel without writing, and stored
+    again when experience passes the next threshold.
+    """
+    with app.test_request_context():
+        conn = helper_database.get_db()
+        statements = []
+        conn.set_trace_callback(statements.append)
+        assert helper_profile.get_level("student1") == helper_profile.calculate_level(
+            2361
+        )
+        assert helper_profile.get_level("nobody") == [1, 0, 100]
+        assert helper_general.get_exp("nobody") == 0
+        conn.set_trace_callback(None)
+        assert all(x.startswith("SELECT") for x in statements)
+
+        # student8 has 50 experience, so 50 more reaches level 2.
+        helper_general.add_experience(conn.cursor(), {"student8": 50, "nobody": 1})
+        conn.commit()
+        assert helper_profile.get_level("student8") == [2, 0, 115]
+        assert helper_profile.get_level("nobody") == [1, 1, 100]